@@ -0,0 +1,244 @@
+"""
+Measures the throughput of every fuse stage on synthetic data
+
+  python benchmarks/bench_fuse.py --rows 200000 --output result.json
+  python benchmarks/bench_fuse.py --save_baseline
+  python benchmarks/bench_fuse.py --baseline benchmarks/baseline.json
+
+With a baseline the run fails when a stage is slower than the baseline
+by more than the tolerance. Both runs time a fixed calibration workload
+and the baseline is scaled by their ratio, so a baseline saved on
+another machine still compares. The baselines are not committed
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, the peak RSS is not measured there
+    resource = None
+
+_BENCH_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(_BENCH_PATH))
+
+import modules.cmd_deployer   as cmd_deployer
+import modules.command_parser as command_parser
+import modules.data_parser    as data_parser
+
+import synthetic_data
+
+_BASE_BASELINE_PATH = os.path.join(_BENCH_PATH, 'baseline.json')
+_BASE_TOLERANCE = 0.2
+# the str.format calls of the calibration and the best of how many runs
+_CALIBRATION_CALLS = 200000
+_CALIBRATION_RUNS = 3
+# seconds, a stage of a few milliseconds varies more than the tolerance
+_MIN_SLOWDOWN = 0.005
+_FORMATS = ['csv', 'tsv', 'xlsx']
+# the result keys which must match for the times to compare
+_RUN_OPTIONS = ['spec', 'format', 'jobs', 'backend', 'parallel_read']
+
+class StageResult:
+
+    def __init__(self, name, seconds, rows=0, commands=0):
+        self.name = name
+        self.seconds = seconds
+        self.rows = rows
+        self.commands = commands
+        self.peak_rss_kb = peak_rss_kb()
+
+    def to_dict(self):
+        result = {
+            'seconds' : round(self.seconds, 6),
+            'rows' : self.rows,
+            'commands' : self.commands,
+            'peak_rss_kb' : self.peak_rss_kb
+        }
+        if self.seconds > 0:
+            result['rows_per_sec'] = round(self.rows / self.seconds, 1)
+            result['commands_per_sec'] = round(self.commands / self.seconds, 1)
+        return result
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # bytes on macOS, kilobytes on linux
+        peak = peak // 1024
+    return peak
+
+def calibrate():
+    """
+    Times a fixed workload close to the fuse, str.format of a few values
+
+    Returns
+    -------
+    seconds : float
+        The fastest of the runs
+    """
+    template = 'interface {0} ip address {1} {2} gateway {3}'
+    fastest = None
+    for _ in range(_CALIBRATION_RUNS):
+        start = time.perf_counter()
+        for idx in range(_CALIBRATION_CALLS):
+            template.format(idx, '10.0.0.1', '255.255.255.0', '10.0.0.254')
+        seconds = time.perf_counter() - start
+        if fastest is None or seconds < fastest:
+            fastest = seconds
+    return fastest
+
+def count_rows(tables):
+    return sum(len(table) for table in tables)
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+def run_benchmark(spec, data_format, work_dir, jobs=1,
+    backend=cmd_deployer.FuseBackend.row, parallel_read=False):
+    """
+    Returns
+    -------
+    stages : []
+        One element is a StageResult
+    """
+    data_path = os.path.join(work_dir, 'data.' + data_format)
+    commands_path = os.path.join(work_dir, 'commands.txt')
+    package_path = os.path.join(work_dir, 'package')
+    output_path = os.path.join(work_dir, 'output.txt')
+    synthetic_data.write_datasheet(spec, data_path)
+    synthetic_data.write_commands_file(spec, commands_path)
+
+    read_jobs = None
+    if parallel_read:
+        read_jobs = jobs
+    stages = []
+    tables, seconds = timed(lambda: data_parser.RawDataParser(data_path, read_jobs=read_jobs).data)
+    row_count = count_rows(tables)
+    stages.append(StageResult('data_load', seconds, rows=row_count))
+
+    cmd_package, seconds = timed(lambda: command_parser.CommandPackage(commands_path))
+    stages.append(StageResult('package_parse', seconds, commands=len(cmd_package.data)))
+    cmd_package.deploy_package(package_path)
+    commands, seconds = timed(lambda: command_parser.CommandPackage().load_package(package_path))
+    stages.append(StageResult('package_load', seconds, commands=len(commands)))
+
+    for separation in [cmd_deployer.CommandSeparationType.sequential,
+                       cmd_deployer.CommandSeparationType.group]:
+        deployer = cmd_deployer.CommandFuse(tables, commands,
+            separation_type=separation, jobs=jobs, backend=backend)
+        generated, seconds = timed(deployer.fuse)
+        stages.append(StageResult('fuse_' + separation, seconds,
+            rows=row_count, commands=len(generated)))
+        del generated
+
+    deployer = cmd_deployer.CommandFuse(tables, commands, jobs=jobs, backend=backend)
+    _, seconds = timed(lambda: deployer.fuse_to_file(output_path))
+    stages.append(StageResult('fuse_to_file', seconds, rows=row_count,
+        commands=count_lines(output_path)))
+    return stages
+
+def count_lines(path):
+    count = 0
+    with open(path) as output_file:
+        for _ in output_file:
+            count = count + 1
+    return count
+
+def compare(result, baseline, tolerance):
+    """
+    Returns
+    -------
+    regressions : []
+        One element is a message of a stage slower than the baseline,
+        the baseline times are scaled by the calibration of the runs
+    """
+    scale = result['calibration_seconds'] / baseline['calibration_seconds']
+    regressions = []
+    for name, stage in result['stages'].items():
+        base_stage = baseline.get('stages', {}).get(name)
+        if not base_stage or not base_stage['seconds']:
+            continue
+        expected = base_stage['seconds'] * scale
+        limit = max(expected * (1 + tolerance), expected + _MIN_SLOWDOWN)
+        if stage['seconds'] > limit:
+            regressions.append('{}: {:.3f}s, baseline {:.3f}s on this machine (+{:.0%} allowed)'.format(
+                name, stage['seconds'], expected, tolerance))
+    return regressions
+
+def is_same_run(baseline, result):
+    return all(baseline.get(key) == result[key] for key in _RUN_OPTIONS)
+
+def create_parser():
+    parser = argparse.ArgumentParser(description='Command-Fuse stage benchmarks')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--columns', type=int, default=20)
+    parser.add_argument('--commands', type=int, default=50)
+    parser.add_argument('--placeholders', type=int, default=15)
+    parser.add_argument('--ids_per_row', type=int, default=3)
+    parser.add_argument('--distinct_cells', type=int, default=40)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--format', choices=_FORMATS, default='csv')
+    parser.add_argument('--jobs', type=int, default=1)
+    parser.add_argument('--parallel_read', action='store_true',
+                        help='Reads a csv/tsv in byte ranges on the --jobs processes')
+    parser.add_argument('--backend', default=cmd_deployer.FuseBackend.row,
+                        choices=[cmd_deployer.FuseBackend.row, cmd_deployer.FuseBackend.columnar])
+    parser.add_argument('--output', help='Writes the JSON result to the file')
+    parser.add_argument('--baseline', help='Fails if slower than this saved result')
+    parser.add_argument('--tolerance', type=float, default=_BASE_TOLERANCE,
+                        help='The allowed slowdown compared to the baseline')
+    parser.add_argument('--save_baseline', nargs='?', const=_BASE_BASELINE_PATH,
+                        help='Stores the result as the baseline, benchmarks/baseline.json by default')
+    return parser
+
+def main():
+    args = create_parser().parse_args()
+    spec = synthetic_data.SyntheticSpec(args.rows, args.columns, args.commands,
+        args.placeholders, args.ids_per_row, args.distinct_cells, args.seed)
+    calibration_seconds = calibrate()
+    with tempfile.TemporaryDirectory() as work_dir:
+        stages = run_benchmark(spec, args.format, work_dir, args.jobs, args.backend,
+            args.parallel_read)
+
+    result = {
+        'spec' : spec.to_dict(),
+        'format' : args.format,
+        'jobs' : args.jobs,
+        'backend' : args.backend,
+        'parallel_read' : args.parallel_read,
+        'python' : sys.version.split()[0],
+        'calibration_seconds' : round(calibration_seconds, 6),
+        'stages' : {stage.name : stage.to_dict() for stage in stages}
+    }
+    result_json = json.dumps(result, indent=4)
+    print(result_json)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(result_json)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as baseline_file:
+            baseline_file.write(result_json)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        if not is_same_run(baseline, result):
+            print('Baseline was measured on other data, the times may not compare',
+                file=sys.stderr)
+        regressions = compare(result, baseline, args.tolerance)
+        if regressions:
+            print('Performance regression:', file=sys.stderr)
+            for regression in regressions:
+                print('  ' + regression, file=sys.stderr)
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Measures the wall time of short cmd.py runs, where the interpreter
+startup and the imports dominate
+
+  python benchmarks/bench_startup.py --runs 30 --target_ms 50
+
+The run fails when the median of the csv fuse is over the target
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+_BENCH_PATH = os.path.dirname(os.path.abspath(__file__))
+_CMD_PATH = os.path.join(os.path.dirname(_BENCH_PATH), 'cmd.py')
+
+import synthetic_data
+
+_BASE_RUNS = 20
+_BASE_TARGET_MS = 50.0
+
+def time_command(arguments, runs):
+    """
+    Returns
+    -------
+    times : []
+        The milliseconds of every run, after one warm up run
+        which compiles the .pyc files and the package
+    """
+    command = [sys.executable] + arguments
+    subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+        times.append((time.perf_counter() - started) * 1000)
+    return times
+
+def summarize(times):
+    return {
+        'min_ms' : round(min(times), 2),
+        'median_ms' : round(statistics.median(times), 2),
+        'max_ms' : round(max(times), 2)
+    }
+
+def create_parser():
+    parser = argparse.ArgumentParser(description='Command-Fuse startup benchmark')
+    parser.add_argument('--runs', type=int, default=_BASE_RUNS)
+    parser.add_argument('--rows', type=int, default=10)
+    parser.add_argument('--target_ms', type=float, default=_BASE_TARGET_MS,
+                        help='The allowed median of the csv fuse run')
+    parser.add_argument('--output', help='Writes the JSON result to the file')
+    return parser
+
+def main():
+    args = create_parser().parse_args()
+    spec = synthetic_data.SyntheticSpec(rows=args.rows, columns=5, commands=5,
+        placeholders=3, ids_per_row=2, distinct_cells=5)
+    with tempfile.TemporaryDirectory() as work_dir:
+        data_path = os.path.join(work_dir, 'startup.csv')
+        commands_path = os.path.join(work_dir, 'startup_commands.txt')
+        synthetic_data.write_datasheet(spec, data_path)
+        synthetic_data.write_commands_file(spec, commands_path)
+        # the package is built here, not among the packages of the repository
+        package_dir = os.path.join(work_dir, 'packages')
+
+        runs = {
+            'python' : time_command(['-c', 'pass'], args.runs),
+            'show' : time_command([_CMD_PATH, '-show', '-package_dir', package_dir], args.runs),
+            'csv_fuse' : time_command([_CMD_PATH, '-f', data_path, '-d', commands_path,
+                '-package_dir', package_dir, '-not_print'], args.runs)
+        }
+
+    result = {
+        'runs' : args.runs,
+        'rows' : args.rows,
+        'python' : sys.version.split()[0],
+        'target_ms' : args.target_ms,
+        'commands' : {name : summarize(times) for name, times in runs.items()}
+    }
+    result_json = json.dumps(result, indent=4)
+    print(result_json)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(result_json)
+
+    median_ms = result['commands']['csv_fuse']['median_ms']
+    if median_ms > args.target_ms:
+        print('Startup over the target: {:.1f}ms, target {:.1f}ms'.format(
+            median_ms, args.target_ms), file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
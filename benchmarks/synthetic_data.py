@@ -0,0 +1,112 @@
+"""
+Generates synthetic datasheets and commands files for the benchmarks
+"""
+import csv
+import random
+
+COMMAND_COLUMN = 'CMD'
+COMMAND_SEP = ';'
+PACKAGE_SEPARATOR = ':'
+_COLUMN_NAME = 'COL_{}'
+_COMMAND_NAME = 'cmd_{}'
+_VALUE_LENGTH = 12
+_VALUE_CHARS = 'abcdefghijklmnopqrstuvwxyz0123456789-./'
+
+class SyntheticSpec:
+    """
+    The size of the generated data
+    """
+    def __init__(self, rows=100000, columns=20, commands=50,
+        placeholders=15, ids_per_row=3, distinct_cells=40, seed=0):
+        """
+        Params
+        ------
+        rows : int
+            Data rows of the datasheet
+        columns : int
+            Data columns next to the command column
+        commands : int
+            Command templates in the commands file
+        placeholders : int
+            Column placeholders in one command template
+        ids_per_row : int
+            Command ids in one command cell
+        distinct_cells : int
+            Distinct command cells reused across the rows
+        seed : int
+            The same seed generates the same files
+        """
+        self.rows = rows
+        self.columns = columns
+        self.commands = commands
+        self.placeholders = placeholders
+        self.ids_per_row = ids_per_row
+        self.distinct_cells = distinct_cells
+        self.seed = seed
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+def column_names(spec):
+    return [_COLUMN_NAME.format(idx) for idx in range(spec.columns)]
+
+def command_ids(spec):
+    return [_COMMAND_NAME.format(idx) for idx in range(spec.commands)]
+
+def write_commands_file(spec, path):
+    """
+    Writes a commands file with the spec's templates,
+    e.g. cmd_0 : run --p0 [COL_3] --p1 [COL_7]
+    """
+    rand = random.Random(spec.seed)
+    columns = column_names(spec)
+    with open(path, 'w') as commands_file:
+        for cmd_id in command_ids(spec):
+            parts = ['run', cmd_id]
+            for idx in range(spec.placeholders):
+                parts.append('--p{} [{}]'.format(idx, rand.choice(columns)))
+            commands_file.write('{} {} {}\n'.format(
+                cmd_id, PACKAGE_SEPARATOR, ' '.join(parts)))
+
+def iter_rows(spec):
+    """
+    Yields
+    ------
+    row : []
+        The data columns then the command cell
+    """
+    rand = random.Random(spec.seed + 1)
+    ids = command_ids(spec)
+    cells = []
+    for _ in range(spec.distinct_cells):
+        cell_ids = rand.sample(ids, min(spec.ids_per_row, len(ids)))
+        cells.append(COMMAND_SEP.join(cell_ids))
+    for _ in range(spec.rows):
+        row = []
+        for _ in range(spec.columns):
+            row.append(''.join(rand.choices(_VALUE_CHARS, k=_VALUE_LENGTH)))
+        row.append(rand.choice(cells))
+        yield row
+
+def write_datasheet(spec, path):
+    """
+    Writes the datasheet, the format is chosen by the extension:
+    .csv, .tsv or .xlsx (needs openpyxl)
+    """
+    header = column_names(spec) + [COMMAND_COLUMN]
+    if path.endswith('.xlsx'):
+        import openpyxl
+        book = openpyxl.Workbook(write_only=True)
+        sheet = book.create_sheet()
+        sheet.append(header)
+        for row in iter_rows(spec):
+            sheet.append(row)
+        book.save(path)
+        return
+    dialect = 'excel'
+    if path.endswith('.tsv'):
+        dialect = 'excel-tab'
+    with open(path, 'w', newline='') as data_file:
+        writer = csv.writer(data_file, dialect=dialect)
+        writer.writerow(header)
+        writer.writerows(iter_rows(spec))
@@ -1,22 +1,56 @@
 import argparse
 import os
 import sys
-import time
 
 import modules.command_parser      as command_parser
 import modules.data_parser         as data_parser
 import modules.cmd_fuse_exception  as cmd_fuse_exception 
 import modules.cmd_deployer        as cmd_deployer
+import modules.output_sink         as output_sink
+import modules.package_cache       as package_cache
+import modules.fuse_stats          as fuse_stats
 
 _CURRENT_PATH = os.path.dirname(__file__) + os.sep
 _PACKAGE_PATH = _CURRENT_PATH + 'packages' + os.sep
 _SAVE_PATH = _CURRENT_PATH + 'fused_commands' + os.sep
+# the default shard directory is next to the default output of the package
+_SHARD_DIR_SUFFIX = '_shards'
 
 _GROUP_INPUT = {
     'seq' : cmd_deployer.CommandSeparationType.sequential,
     'group' : cmd_deployer.CommandSeparationType.group
     }
-_PACKAGE_GENERATE_SLEEP_TIME = 1
+_PACKAGE_FORMATS = [
+    command_parser.CommandPackage.BINARY_FORMAT,
+    command_parser.CommandPackage.JSON_FORMAT
+    ]
+_MEGABYTE = 1024 * 1024
+_COMPRESSION_EXTENSIONS = {
+    output_sink.CompressionType.gzip : '.gz',
+    output_sink.CompressionType.zstd : '.zst'
+    }
+_BACKENDS = [
+    cmd_deployer.FuseBackend.row,
+    cmd_deployer.FuseBackend.columnar
+    ]
+# the command_dedupe.DedupeScope values, loaded only with -dedupe
+_DEDUPE_OUTPUT = 'output'
+_DEDUPE_SCOPES = [
+    _DEDUPE_OUTPUT,
+    'group'
+    ]
+# seconds a printed command waits while a file is streamed
+_STREAM_FLUSH_INTERVAL = 0.1
+# the defaults of command_executor.CommandExecutor, the module
+# imports asyncio so it is loaded only with -execute
+_EXEC_JOBS = 4
+_RETRY_BACKOFF = 1.0
+# the exit status of -execute when a command failed or timed out
+_EXEC_FAILED_STATUS = 1
+# the default of shard_output.ShardOutput, loaded only with -shard_by
+_MAX_OPEN_FILES = 256
+_PROFILE_CPU = 'cpu'
+_PROFILE_MEMORY = 'memory'
 
 _HELP_VIEW = "<< CMD_FUSE v1.0 >>\n\
 -- to generate command --\n\
@@ -41,6 +75,21 @@ def create_parser():
     parser.add_argument('-g', '--group', 
                         type=str, help='Separates the command {}'.format(user_values),
                         default=cmd_deployer.CommandSeparationType.sequential)
+    parser.add_argument('-go', '--group_order', nargs='+',
+                        help='The command ids to generate first in group mode')
+    parser.add_argument('-gmem', '--group_memory_budget', type=int,
+                        help='MB of commands to hold in memory in group mode before using temporary files')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='The number of parallel workers to fuse with')
+    parser.add_argument('-threads', '--use_threads', action="store_true",
+                        help='The parallel workers are threads instead of processes')
+    parser.add_argument('-parallel_read', '--parallel_read', action="store_true",
+                        help='Reads a csv/tsv in byte ranges on the -j processes, quoted fields must follow RFC 4180')
+    parser.add_argument('-backend', '--backend', type=str,
+                        help='The fuse engine {}, columnar needs numpy and falls back to row without it'.format(_BACKENDS),
+                        default=cmd_deployer.FuseBackend.row)
+    parser.add_argument('-validate_only', '--validate_only', action="store_true",
+                        help='Only checks the command ids and columns of the data')
     parser.add_argument('-not_print', '--not_print', action="store_true", 
                         help='The output shows on screen')
 
@@ -49,6 +98,59 @@ def create_parser():
     parser.add_argument('-sp', '--save_path', help='The fuesd commands to save',
                         default=_SAVE_PATH)
 
+    parser.add_argument('-package_dir', '--package_dir', type=str, default=_PACKAGE_PATH,
+                        help='The directory of the packages, {} by default'.format(_PACKAGE_PATH))
+
+    parser.add_argument('-incremental', '--incremental', action="store_true",
+                        help='Regenerates only the changed rows of the saved output, needs -save')
+    parser.add_argument('-diff', '--diff_path', type=str,
+                        help='Saves the new and changed commands of an incremental run to the path')
+    parser.add_argument('-shard_by', '--shard_by', type=str,
+                        help='Saves the commands of every value of the column to its own file in the save path directory, '
+                        '{}[package]{} if no save path provided'.format(_SAVE_PATH, _SHARD_DIR_SUFFIX))
+    parser.add_argument('-shards', '--shard_count', type=int,
+                        help='With -shard_by hashes the values into this many files instead of one file per value')
+    parser.add_argument('-max_open_files', '--max_open_files', type=int,
+                        help='The shard files to keep open together, the least recently written one is closed',
+                        default=_MAX_OPEN_FILES)
+    parser.add_argument('-dedupe', '--dedupe', nargs='?', const=_DEDUPE_OUTPUT,
+                        help='Drops the repeated commands in the whole output or per group/shard {}'.format(_DEDUPE_SCOPES))
+    parser.add_argument('-dedupe_mem', '--dedupe_memory_budget', type=int,
+                        help='MB of command digests to hold in memory before moving them to a temporary database')
+    parser.add_argument('-dedupe_bloom', '--dedupe_bloom_items', type=int,
+                        help='The expected distinct commands, puts a Bloom filter in front of the temporary database')
+    parser.add_argument('-compress', '--compress', type=str,
+                        help='Compresses the saved commands {}, inferred from a .gz/.zst save path if not provided'.format(
+                            list(_COMPRESSION_EXTENSIONS.keys())))
+    parser.add_argument('-batch', '--batch', type=str,
+                        help='Runs the jobs of a JSON manifest, the other options are the defaults of the jobs')
+    parser.add_argument('-batch_glob', '--batch_glob', type=str,
+                        help='Fuses every datasheet of the pattern with the -d package')
+    parser.add_argument('-serve', '--serve', type=str,
+                        help='Runs a fuse server on a unix socket path or [host:]port until stopped')
+    parser.add_argument('-allow_remote', '--allow_remote', action="store_true",
+                        help='Lets -serve listen on a host which is not a loopback address, '
+                        'the clients can read any file of this machine')
+    parser.add_argument('-commands_dir', '--commands_dir', type=str,
+                        help='Lets the -serve clients send the path of a commands file under this directory as the package')
+    parser.add_argument('-connect', '--connect', type=str,
+                        help='Sends the -f datasheet and the -d package to a fuse server')
+    parser.add_argument('-execute', '--execute', action="store_true",
+                        help='Runs the generated commands as shell commands instead of printing them')
+    parser.add_argument('-exec_jobs', '--exec_jobs', type=int,
+                        help='The commands to run at the same time, group mode runs the buckets one after the other',
+                        default=_EXEC_JOBS)
+    parser.add_argument('-exec_timeout', '--exec_timeout', type=float,
+                        help='Seconds before a running command is killed')
+    parser.add_argument('-retries', '--retries', type=int, default=0,
+                        help='The times a failed command is run again')
+    parser.add_argument('-retry_backoff', '--retry_backoff', type=float,
+                        help='Seconds before the first retry, doubled for every next one',
+                        default=_RETRY_BACKOFF)
+    parser.add_argument('-results_log', '--results_log', type=str,
+                        help='Appends the exit code, duration and output of every command as a JSON line')
+    parser.add_argument('-stop_on_error', '--stop_on_error', action="store_true",
+                        help='Does not start the next group when a command failed')
     parser.add_argument('-csep', '--command_separator',
                         type=str, help='The [separator] value for [commands] file',
                         default=command_parser.CommandPackage.BASE_SEPARATOR)
@@ -68,29 +170,108 @@ def create_parser():
     parser.add_argument('-col_to_replace', type=str, 
                         help='The column characters to substitute',
                         default=command_parser.CommandPackage.TO_REPLACE)
+    parser.add_argument('-sheets', '--sheets', nargs='+',
+                        help='The sheets to read from a workbook, every sheet if not provided')
+    parser.add_argument('-stream', '--stream', action="store_true",
+                        help='Reads the data row by row and writes the commands as generated')
+    parser.add_argument('-pf', '--package_format', type=str,
+                        help='The format of the generated package {}'.format(_PACKAGE_FORMATS),
+                        default=command_parser.CommandPackage.BASE_PACKAGE_FORMAT)
+    parser.add_argument('-rebuild', '--rebuild_package', action="store_true",
+                        help='Compiles the package of the commands file even if it did not change')
+    parser.add_argument('-export', '--export_package', type=str,
+                        help='Prints the package of the name as JSON')
+    parser.add_argument('-stats', '--stats', action="store_true",
+                        help='Prints the time and counters of every stage')
+    parser.add_argument('-profile', '--profile', type=str,
+                        help='Profiles the run and saves the result to the path')
+    parser.add_argument('-profile_mode', '--profile_mode', type=str,
+                        help='cProfile for {} or tracemalloc for {}'.format(_PROFILE_CPU, _PROFILE_MEMORY),
+                        default=_PROFILE_CPU)
     parser.add_argument('-show', '--show_avialable', action="store_true",
                         help='Shows the avialable packages')
 
     return parser
 
 def main():
-    create_dir_if_not_exist(_PACKAGE_PATH)
-    create_dir_if_not_exist(_SAVE_PATH)
-
     parser = create_parser()
     can_show_usage = ['-h', '--help'] in sys.argv or len(sys.argv) == 1
     if can_show_usage:
         print(_HELP_VIEW)
     args = parser.parse_args()
+    if args.incremental and not args.is_save_to_deployed:
+        parser.error('-incremental needs -save')
+    if args.dedupe and args.dedupe not in _DEDUPE_SCOPES:
+        parser.error('-dedupe is one of {}'.format(_DEDUPE_SCOPES))
+    if args.dedupe and args.incremental:
+        parser.error('-dedupe does not work with -incremental')
+    if args.execute and args.is_save_to_deployed:
+        parser.error('-execute runs the commands instead of saving them, it does not work with -save')
+    if args.shard_by and (args.group != cmd_deployer.CommandSeparationType.sequential
+            or args.incremental or args.execute or args.compress):
+        parser.error('-shard_by works only with the sequential fuse, without -incremental, -execute and -compress')
+
+    stats = None
+    if args.stats:
+        stats = fuse_stats.FuseStats()
+    try:
+        if args.profile:
+            run_profiled(args, stats)
+        else:
+            run(args, stats)
+    finally:
+        if stats:
+            print(stats.report(), file=sys.stderr)
+
+def run_profiled(args, stats):
+    """
+    Runs with cProfile or tracemalloc and dumps the result to the profile path
+    """
+    if args.profile_mode == _PROFILE_MEMORY:
+        import tracemalloc
+        tracemalloc.start()
+        try:
+            run(args, stats)
+        finally:
+            tracemalloc.take_snapshot().dump(args.profile)
+            tracemalloc.stop()
+    else:
+        import cProfile
+        profiler = cProfile.Profile()
+        try:
+            profiler.runcall(run, args, stats)
+        finally:
+            profiler.dump_stats(args.profile)
+    print('Profile saved to {}'.format(args.profile), file=sys.stderr)
 
+def run(args, stats=None):
     if args.show_avialable:
         print('Avialable packages')
-        packages = os.listdir(_PACKAGE_PATH)
+        packages = []
+        if os.path.isdir(args.package_dir):
+            packages = os.listdir(args.package_dir)
         for package in packages:
-            print(package)
+            if not package.startswith('.'):
+                print(package)
+
+    if args.export_package:
+        cmd_package = command_parser.CommandPackage(package_name=args.export_package)
+        cmd_package.load_package(os.path.join(args.package_dir, args.export_package))
+        print(cmd_package.to_json())
+
+    if args.batch or args.batch_glob:
+        run_batch(args)
+
+    if args.serve:
+        run_server(args)
+        return
+
+    if args.file and args.deploy and args.connect:
+        run_remote(args)
+        return
 
     if args.file and args.deploy:
-        commands = None
+        commands_from_package = None
         package_name = args.deploy
 
         if os.path.isfile(args.deploy):
@@ -98,43 +279,230 @@ def main():
             package_name = args.deploy.split(os.sep)[-1]
             if '.' in package_name:
                 package_name = package_name.split('.')[0]
-  
-            cmd_package = command_parser.CommandPackage(
-                commands_file_path, package_name, args.command_separator)
-            cmd_package.deploy_package(_PACKAGE_PATH)
 
-            print("Package \'{}\' generated".format(package_name))
+            create_dir_if_not_exist(args.package_dir)
+            cache = package_cache.PackageCache(args.package_dir, stats=stats)
+            commands_from_package, is_built = cache.get_or_build(
+                commands_file_path, package_name, args.command_separator,
+                args.col_sub_left, args.col_sub_right, args.col_to_replace,
+                args.package_format, args.rebuild_package)
+            if is_built:
+                print("Package \'{}\' generated".format(package_name))
 
-            time.sleep(_PACKAGE_GENERATE_SLEEP_TIME)
+        if commands_from_package is None:
+            package_path = os.path.join(args.package_dir, package_name)
+            commands_from_package = command_parser.CommandPackage(
+                stats=stats).load_package(package_path)
 
-        data = data_parser.RawDataParser(args.file).data
-        package_path = _PACKAGE_PATH + package_name
+        # the columns no command uses are dropped while the data is read
+        columns = cmd_deployer.CommandFuse.required_columns(
+            commands_from_package, args.command_column)
+        if args.shard_by:
+            columns.add(args.shard_by)
+        read_jobs = None
+        if args.parallel_read:
+            read_jobs = args.jobs
+        if args.stream:
+            data = data_parser.RawDataParser(args.file, lazy=True,
+                sheets=args.sheets, stats=stats, columns=columns, read_jobs=read_jobs)
+        else:
+            data = data_parser.RawDataParser(args.file, sheets=args.sheets,
+                stats=stats, columns=columns, read_jobs=read_jobs).data
 
-        commands_from_package = command_parser.CommandPackage().load_package(package_path)
+        group_memory_budget = None
+        if args.group_memory_budget is not None:
+            group_memory_budget = args.group_memory_budget * _MEGABYTE
+
+        dedupe = None
+        if args.dedupe:
+            import modules.command_dedupe as command_dedupe
+            dedupe_memory_budget = None
+            if args.dedupe_memory_budget is not None:
+                dedupe_memory_budget = args.dedupe_memory_budget * _MEGABYTE
+            dedupe = command_dedupe.CommandDeduper(args.dedupe,
+                dedupe_memory_budget, args.dedupe_bloom_items)
 
         deployer = cmd_deployer.CommandFuse(
             data, commands_from_package, args.command_column, 
-            args.data_command_sep, args.group
+            args.data_command_sep, args.group,
+            args.group_order, group_memory_budget,
+            args.jobs, args.use_threads, stats=stats,
+            backend=args.backend, dedupe=dedupe
         )
-        if args.is_save_to_deployed:
-            path = args.save_path
-            if args.save_path == _SAVE_PATH:
-                path = path + package_name
-            deployer.fuse_to_file(path)
-        generated_commands = deployer.fuse()
+        # the loaded data is checked before the first command is written
+        if args.validate_only or not args.stream:
+            deployer.validate()
+        if args.validate_only:
+            print('Data is valid')
+            return
 
+        if args.execute:
+            run_commands(args, deployer)
+            print_removed_duplicates(dedupe)
+            return
+
+        if args.shard_by:
+            import modules.shard_output as shard_output
+            path = get_shard_dir(args, package_name)
+            shards = shard_output.ShardOutput(path, args.shard_count, args.max_open_files)
+            deployer.fuse_to_shards(shards, args.shard_by)
+            print('Shards saved: {} in {}'.format(len(shards.paths), path))
+            print_removed_duplicates(dedupe)
+            return
+
+        path = get_save_path(args, package_name)
+        if args.incremental:
+            result = deployer.fuse_to_file_incremental(path, args.diff_path)
+            print('Rows regenerated: {} of {}'.format(result.regenerated_rows, result.rows))
+            print('Commands generated')
+            return
+
+        sinks = []
+        if args.is_save_to_deployed:
+            sinks.append(output_sink.FileSink(path, args.compress))
         if not args.not_print:
-            for cmd in generated_commands:
-                print(cmd)
+            sinks.append(create_console_sink(args))
+        deployer.fuse_to_sinks(sinks)
 
+        print_removed_duplicates(dedupe)
         print('Commands generated')
 
     if args.file and args.add_package:
         cmd_package = command_parser.CommandPackage(args.file, args.add_package)
-        cmd_package.deploy_package(_PACKAGE_PATH)
+        create_dir_if_not_exist(args.package_dir)
+        cmd_package.deploy_package(args.package_dir, args.package_format)
         
         print('Package saved')
 
+def get_save_path(args, package_name):
+    path = args.save_path
+    if args.save_path == _SAVE_PATH:
+        if args.is_save_to_deployed:
+            create_dir_if_not_exist(_SAVE_PATH)
+        path = path + package_name + _COMPRESSION_EXTENSIONS.get(args.compress, '')
+    return path
+
+def create_console_sink(args, is_streamed=False):
+    """
+    Returns
+    -------
+    StreamSink
+        Prints every command at once to a console or while the standard
+        input is streamed, shortly after it is generated while a file
+        is streamed, in large chunks otherwise
+    """
+    flush_interval = None
+    if args.stream or is_streamed:
+        flush_interval = _STREAM_FLUSH_INTERVAL
+        if args.file == data_parser.RawDataParser.STDIN_PATH:
+            flush_interval = 0
+    if sys.stdout.isatty():
+        flush_interval = 0
+    return output_sink.StreamSink(sys.stdout, flush_interval=flush_interval)
+
+def get_shard_dir(args, package_name):
+    if args.save_path == _SAVE_PATH:
+        return _SAVE_PATH + package_name + _SHARD_DIR_SUFFIX
+    return args.save_path
+
+def print_removed_duplicates(dedupe):
+    if dedupe:
+        print('Duplicates removed: {}'.format(dedupe.removed))
+
+def run_commands(args, deployer):
+    import modules.command_executor as command_executor
+    executor = command_executor.CommandExecutor(args.exec_jobs, args.exec_timeout,
+        args.retries, args.retry_backoff, args.results_log, args.stop_on_error)
+
+    def print_result(result):
+        status = 'exit {}'.format(result.exit_code)
+        if result.timed_out:
+            status = 'timed out'
+        print('[{}] {} ({:.3f}s)'.format(status, result.command, result.duration))
+
+    on_result = None
+    if not args.not_print:
+        on_result = print_result
+    summary = executor.execute(deployer.iter_command_groups(), on_result)
+    print('Commands executed: {}, failed: {} ({:.3f}s)'.format(
+        summary.commands, summary.failed, summary.seconds))
+    if summary.failed:
+        sys.exit(_EXEC_FAILED_STATUS)
+
+def run_server(args):
+    import modules.fuse_server as fuse_server
+    create_dir_if_not_exist(args.package_dir)
+    server = fuse_server.FuseServer(args.serve, args.package_dir,
+        (args.command_separator, args.col_sub_left, args.col_sub_right,
+        args.col_to_replace, args.package_format), args.allow_remote, args.commands_dir)
+    print('Serving on {}'.format(args.serve))
+    server.run()
+    print('Server stopped')
+
+def run_remote(args):
+    import modules.fuse_server as fuse_server
+    package = args.deploy
+    package_name = package
+    if os.path.isfile(package):
+        package = os.path.abspath(package)
+        package_name = os.path.basename(package).split('.')[0]
+    request = {
+        'file' : os.path.abspath(args.file),
+        'package' : package,
+        'group' : args.group,
+        'command_column' : args.command_column,
+        'data_command_sep' : args.data_command_sep,
+        'group_order' : args.group_order,
+        'sheets' : args.sheets
+    }
+    sinks = []
+    if args.is_save_to_deployed:
+        sinks.append(output_sink.FileSink(get_save_path(args, package_name), args.compress))
+    if not args.not_print:
+        sinks.append(create_console_sink(args, is_streamed=True))
+    for sink in sinks:
+        sink.open()
+    try:
+        for command in fuse_server.iter_remote_fuse(args.connect, request):
+            for sink in sinks:
+                sink.write(command)
+    except BaseException:
+        for sink in sinks:
+            sink.abort()
+        raise
+    for sink in sinks:
+        sink.close()
+    print('Commands generated')
+
+def run_batch(args):
+    import modules.batch_fuse as batch_fuse
+    create_dir_if_not_exist(args.package_dir)
+    if args.save_path == _SAVE_PATH:
+        create_dir_if_not_exist(_SAVE_PATH)
+    save_dir = args.save_path
+    if not os.path.isdir(save_dir):
+        save_dir = os.path.dirname(save_dir) or os.curdir
+    defaults = {}
+    for option in batch_fuse.BatchFuse.BASE_OPTIONS:
+        defaults[option] = getattr(args, option)
+
+    if args.batch:
+        jobs = batch_fuse.BatchFuse.read_manifest(args.batch, save_dir, defaults)
+    else:
+        jobs = batch_fuse.BatchFuse.from_glob(args.batch_glob, args.deploy, save_dir, defaults)
+    batch = batch_fuse.BatchFuse(jobs, args.package_dir, args.jobs, args.use_threads,
+        args.command_separator, args.col_sub_left, args.col_sub_right,
+        args.col_to_replace, args.package_format)
+
+    failed_jobs = 0
+    for result in batch.run():
+        if result.error:
+            failed_jobs = failed_jobs + 1
+            print('Failed {} with {}: {}'.format(result.job.file, result.job.package, result.error))
+        else:
+            print('Saved {} ({:.3f}s)'.format(result.job.save_path, result.seconds))
+    print('Jobs done: {} of {}'.format(len(jobs) - failed_jobs, len(jobs)))
+
 if __name__ == '__main__':
     try:
         main()
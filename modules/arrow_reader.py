@@ -0,0 +1,96 @@
+import itertools
+
+import modules.cmd_fuse_exception as cmd_fuse_exception
+import modules.table_reader       as table_reader
+
+class ArrowReader(table_reader.TableReader):
+    """
+    Reads Arrow IPC files and streams (.arrow, .feather, .arrows) with
+    pyarrow. The file is memory mapped and the record batches are
+    converted to rows one by one, only the read columns are touched
+    """
+    _EMPTY_CELL = ''
+
+    def iter_sheets(self):
+        pyarrow = ArrowReader._import_pyarrow('.arrow')
+        import pyarrow.ipc
+        source = pyarrow.memory_map(self._path)
+        try:
+            try:
+                reader = pyarrow.ipc.open_file(source)
+                batches = (reader.get_batch(batch_idx)
+                    for batch_idx in range(reader.num_record_batches))
+            except pyarrow.ArrowInvalid:
+                # not the file format, the stream format has no footer
+                source.seek(0)
+                reader = pyarrow.ipc.open_stream(source)
+                batches = iter(reader)
+            header = reader.schema.names
+            indices = self._column_indices(header)
+            if indices is not None:
+                header = [header[idx] for idx in indices]
+            yield None, header, ArrowReader._iter_batch_rows(batches, indices)
+        finally:
+            source.close()
+
+    @staticmethod
+    def _import_pyarrow(extension):
+        try:
+            import pyarrow
+        except ImportError:
+            raise cmd_fuse_exception.MissingDependencyError('pyarrow', extension)
+        return pyarrow
+
+    @staticmethod
+    def _iter_batch_rows(batches, indices=None):
+        """
+        Params
+        ------
+        batches : iterable
+            One element is a pyarrow.RecordBatch
+        indices : []
+            The indices of the columns to read, None reads every column
+        Yields
+        ------
+        row : tuple
+            The values of the cells, a null is '' like an empty csv cell
+        """
+        for batch in batches:
+            if indices is None:
+                columns = batch.columns
+            else:
+                columns = [batch.column(idx) for idx in indices]
+            if not columns:
+                yield from itertools.repeat((), batch.num_rows)
+                continue
+            yield from zip(*[ArrowReader._to_values(column) for column in columns])
+
+    @staticmethod
+    def _to_values(column):
+        values = column.to_pylist()
+        if column.null_count:
+            return [ArrowReader._EMPTY_CELL if value is None else value for value in values]
+        return values
+
+class ParquetReader(ArrowReader):
+    """
+    Reads .parquet files with pyarrow in record batches, the columns
+    which are not read are not decoded
+    """
+    BASE_BATCH_SIZE = 65536
+
+    def iter_sheets(self):
+        pyarrow = ArrowReader._import_pyarrow('.parquet')
+        import pyarrow.parquet
+        source = pyarrow.memory_map(self._path)
+        try:
+            parquet_file = pyarrow.parquet.ParquetFile(source)
+            header = parquet_file.schema_arrow.names
+            indices = self._column_indices(header)
+            if indices is not None:
+                header = [header[idx] for idx in indices]
+            batches = parquet_file.iter_batches(batch_size=ParquetReader.BASE_BATCH_SIZE,
+                columns=header)
+            yield None, header, ArrowReader._iter_batch_rows(batches)
+        finally:
+            source.close()
@@ -0,0 +1,284 @@
+from collections import namedtuple
+import glob
+import json
+import os
+import time
+
+import modules.cmd_deployer       as cmd_deployer
+import modules.cmd_fuse_exception as cmd_fuse_exception
+import modules.command_parser     as command_parser
+import modules.data_parser        as data_parser
+import modules.output_sink        as output_sink
+import modules.package_cache      as package_cache
+
+BatchJob = namedtuple('BatchJob', ['file', 'package', 'save_path', 'options'])
+JobResult = namedtuple('JobResult', ['job', 'error', 'seconds'])
+
+# the packages of the batch, loaded once in every worker
+_worker_packages = {}
+
+def _init_batch_worker(packages):
+    _worker_packages.update(packages)
+
+def _run_batch_job(job):
+    """
+    Returns
+    -------
+    (error, seconds) : tuple
+        error is the message of the failure or None
+    """
+    started = time.perf_counter()
+    try:
+        commands = _worker_packages[job.package]
+        options = job.options
+        if not os.path.isfile(job.file):
+            raise FileNotFoundError(job.file)
+        columns = cmd_deployer.CommandFuse.required_columns(commands, options['command_column'])
+        data = data_parser.RawDataParser(job.file, sheets=options.get('sheets'),
+            columns=columns).data
+        deployer = cmd_deployer.CommandFuse(
+            data, commands, options['command_column'],
+            options['data_command_sep'], options['group'],
+            options.get('group_order'))
+        deployer.validate()
+        deployer.fuse_to_sinks([output_sink.FileSink(job.save_path, options.get('compress'))])
+    except Exception as job_error:
+        # the exceptions of the package can not always be pickled
+        return '{}: {}'.format(type(job_error).__name__, job_error), time.perf_counter() - started
+    return None, time.perf_counter() - started
+
+class BatchFuse:
+    """
+    Fuses many datasheets against many packages in one process.
+    Every package is loaded once and shared by the jobs, the jobs run
+    on a worker pool and each one saves to its own file. A failed job
+    is reported in its result, the others still run
+    """
+    BASE_OPTIONS = {
+        'group' : cmd_deployer.CommandSeparationType.sequential,
+        'command_column' : cmd_deployer.CommandFuse.BASE_COMMAND_COLUMN,
+        'data_command_sep' : cmd_deployer.CommandFuse.BASE_COMMAND_SEP,
+        'group_order' : None,
+        'sheets' : None,
+        'compress' : None
+        }
+    _JOBS_KEY = 'jobs'
+    _DEFAULTS_KEY = 'defaults'
+    _OUTPUT_EXTENSION = '.txt'
+
+    def __init__(self, jobs, package_dir, workers=1, use_threads=False,
+        separator=command_parser.CommandPackage.BASE_SEPARATOR,
+        col_sub_left=command_parser.CommandPackage.COL_SUB_LEFT,
+        col_sub_right=command_parser.CommandPackage.COL_SUB_RIGHT,
+        to_replace=command_parser.CommandPackage.TO_REPLACE,
+        file_format=command_parser.CommandPackage.BASE_PACKAGE_FORMAT):
+        """
+        Params
+        ------
+        jobs : []
+            One element is a BatchJob
+        package_dir : str
+            The directory of the packages
+        workers : int
+            The number of jobs to run at the same time
+        use_threads : bool
+            Use a thread pool instead of a process pool for the jobs
+        The others are passed to the PackageCache for the commands files
+        Raises
+        ------
+        BatchConflictError
+            When jobs save to the same path or different commands files
+            build a package of the same name
+        """
+        BatchFuse.check_conflicts(jobs)
+        self._jobs = jobs
+        self._package_dir = package_dir
+        self._workers = workers
+        self._use_threads = use_threads
+        self._package_options = (separator, col_sub_left, col_sub_right,
+            to_replace, file_format)
+
+    @staticmethod
+    def read_manifest(path, save_dir, defaults=None):
+        """
+        Reads the jobs of a JSON manifest, the relative paths are
+        relative to the manifest
+
+            {"defaults": {"group": "seq"},
+             "jobs": [{"file": "a.csv", "package": "pkg", "save_path": "a.txt"}]}
+
+        The manifest can be the list of the jobs too
+
+        Params
+        ------
+        path : str
+            The manifest file
+        save_dir : str
+            The directory of the outputs without a save_path
+        defaults : dict
+            The options of the jobs without their own, see BASE_OPTIONS
+        Returns
+        -------
+        jobs : []
+            One element is a BatchJob
+        Raises
+        ------
+        ValueError
+            When a job misses its file or package
+        """
+        with open(path) as manifest_file:
+            manifest = json.load(manifest_file)
+        job_defaults = dict(defaults or {})
+        if isinstance(manifest, dict):
+            job_defaults.update(manifest.get(BatchFuse._DEFAULTS_KEY, {}))
+            manifest = manifest.get(BatchFuse._JOBS_KEY, [])
+
+        base_dir = os.path.dirname(os.path.abspath(path))
+        jobs = []
+        for job_number, entry in enumerate(manifest, 1):
+            entry = dict(entry)
+            data_path = entry.pop('file', None)
+            package = entry.pop('package', None)
+            if not data_path or not package:
+                raise ValueError('Job {} of {} needs a file and a package'.format(job_number, path))
+            data_path = os.path.join(base_dir, data_path)
+            if os.path.isfile(os.path.join(base_dir, package)):
+                package = os.path.join(base_dir, package)
+            save_path = entry.pop('save_path', None)
+            if save_path:
+                save_path = os.path.join(base_dir, save_path)
+            options = dict(job_defaults)
+            options.update(entry)
+            jobs.append(BatchFuse.create_job(data_path, package, save_dir, save_path, options))
+        return jobs
+
+    @staticmethod
+    def from_glob(pattern, package, save_dir, defaults=None):
+        """
+        Params
+        ------
+        pattern : str
+            Selects the datasheets, e.g. sheets/*.csv
+        package : str
+            The package name or commands file of every datasheet
+        Returns
+        -------
+        jobs : []
+            One element is a BatchJob, in the order of the paths
+        """
+        return [BatchFuse.create_job(data_path, package, save_dir, options=defaults)
+            for data_path in sorted(glob.glob(pattern)) if os.path.isfile(data_path)]
+
+    @staticmethod
+    def create_job(data_path, package, save_dir, save_path=None, options=None):
+        """
+        Returns
+        -------
+        job : BatchJob
+            Saves to [save_dir][datasheet name]_[package name].txt
+            without a save_path
+        """
+        job_options = dict(BatchFuse.BASE_OPTIONS)
+        job_options.update(options or {})
+        if not save_path:
+            save_path = os.path.join(save_dir, '{}_{}{}'.format(
+                BatchFuse._file_name(data_path), BatchFuse._file_name(package),
+                BatchFuse._OUTPUT_EXTENSION))
+        return BatchJob(data_path, package, save_path, job_options)
+
+    @staticmethod
+    def check_conflicts(jobs):
+        """
+        Params
+        ------
+        jobs : []
+            One element is a BatchJob
+        Raises
+        ------
+        BatchConflictError
+            When jobs save to the same path or different commands files
+            build a package of the same name
+        """
+        conflicts = []
+        save_paths = {}
+        package_sources = {}
+        for job_number, job in enumerate(jobs, 1):
+            save_path = os.path.normcase(os.path.realpath(job.save_path))
+            if save_path in save_paths:
+                conflicts.append('Jobs {} and {} save to {}'.format(
+                    save_paths[save_path], job_number, job.save_path))
+            else:
+                save_paths[save_path] = job_number
+
+            name, source = job.package, job.package
+            if os.path.isfile(job.package):
+                name = BatchFuse._file_name(job.package)
+                source = os.path.normcase(os.path.realpath(job.package))
+            sources = package_sources.setdefault(name, [])
+            if source not in sources:
+                sources.append(source)
+        for name, sources in package_sources.items():
+            if len(sources) > 1:
+                conflicts.append('The package \'{}\' would be built from {}'.format(
+                    name, ', '.join(sources)))
+        if conflicts:
+            raise cmd_fuse_exception.BatchConflictError(conflicts)
+
+    def run(self):
+        """
+        Yields
+        ------
+        result : JobResult
+            In the order of the jobs
+        """
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+        packages, package_errors = self._load_packages()
+        executor_type = ProcessPoolExecutor
+        if self._use_threads:
+            executor_type = ThreadPoolExecutor
+        with executor_type(max(1, self._workers),
+            initializer=_init_batch_worker, initargs=(packages,)) as executor:
+            futures = []
+            for job in self._jobs:
+                if job.package in package_errors:
+                    futures.append(None)
+                else:
+                    futures.append(executor.submit(_run_batch_job, job))
+            for job, future in zip(self._jobs, futures):
+                if future is None:
+                    yield JobResult(job, package_errors[job.package], 0.0)
+                else:
+                    error, seconds = future.result()
+                    yield JobResult(job, error, seconds)
+
+    def _load_packages(self):
+        """
+        Returns
+        -------
+        (packages, package_errors) : tuple
+            The package and commands pairs and the package
+            and error message pairs of the failed packages
+        """
+        packages = {}
+        package_errors = {}
+        cache = package_cache.PackageCache(self._package_dir)
+        for package in set(job.package for job in self._jobs):
+            try:
+                if os.path.isfile(package):
+                    packages[package], _ = cache.get_or_build(
+                        package, BatchFuse._file_name(package), *self._package_options)
+                else:
+                    packages[package] = command_parser.CommandPackage(
+                        package_name=package).load_package(
+                        os.path.join(self._package_dir, package))
+            except Exception as package_error:
+                package_errors[package] = '{}: {}'.format(
+                    type(package_error).__name__, package_error)
+        return packages, package_errors
+
+    @staticmethod
+    def _file_name(path):
+        name = path.split(os.sep)[-1]
+        if '.' in name:
+            name = name.split('.')[0]
+        return name
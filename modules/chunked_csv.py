@@ -0,0 +1,182 @@
+from collections import deque, namedtuple
+import csv
+import io
+import locale
+import mmap
+import os
+
+import modules.data_parser as data_parser
+
+CsvRange = namedtuple('CsvRange', ['path', 'start', 'end', 'dialect',
+    'encoding', 'header', 'width', 'indices'])
+
+_NEW_LINE = b'\n'
+
+def read_range(csv_range):
+    """
+    Parses the records of one byte range, runs in the worker processes
+
+    Params
+    ------
+    csv_range : CsvRange
+        Starts and ends on a record boundary
+    Returns
+    -------
+    rows : []
+        One element is a tuple, like data_parser.iter_csv_rows
+    """
+    with open(csv_range.path, 'rb') as data_file:
+        with mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ) as data_map:
+            text = data_map[csv_range.start:csv_range.end].decode(csv_range.encoding)
+    # newline='' splits the lines like the file object of RawDataParser
+    reader = csv.reader(io.StringIO(text, newline=''), dialect=csv_range.dialect)
+    return list(data_parser.iter_csv_rows(reader, csv_range.width, csv_range.indices))
+
+class ChunkedCsvFile:
+    """
+    Reads a csv/tsv file in byte ranges of a memory map. The ranges end
+    on a record boundary, a new line counts only outside of the quoted
+    fields, which are found by the parity of the quote characters.
+    The fields must be quoted as in RFC 4180, a quote character in an
+    unquoted field can misplace a boundary.
+
+    The ranges are parsed on a process pool and the rows are yielded in
+    the order of the file, CommandFuse fuses the ranges in its own
+    workers instead when the file is its data
+    """
+    BASE_CHUNK_BYTES = 16 * 1024 * 1024
+    # ranges in flight per job, bounds the memory of the read
+    _RANGES_PER_JOB = 2
+
+    def __init__(self, path, dialect, columns=None, jobs=1,
+        chunk_bytes=BASE_CHUNK_BYTES):
+        """
+        Params
+        ------
+        path : str
+            The file's path
+        dialect : str
+            The csv dialect, 'excel' or 'excel-tab'
+        columns : iterable
+            The column names to read, None reads every column
+        jobs : int
+            The number of processes to parse the ranges with
+        chunk_bytes : int
+            The approximate size of one range
+        """
+        self._path = path
+        self._dialect = dialect
+        self._jobs = jobs
+        self._chunk_bytes = max(1, chunk_bytes)
+        # the encoding of open() without an encoding, like RawDataParser
+        self._encoding = locale.getpreferredencoding(False)
+        self._quote = csv.get_dialect(dialect).quotechar.encode(self._encoding)
+        self._header = None
+        self._width = 0
+        self._indices = None
+        self._data_start = 0
+        self._read_header(columns)
+
+    @property
+    def header(self):
+        """
+        Returns
+        -------
+        header : []
+            The names of the read columns, None for an empty file
+        """
+        return self._header
+
+    def _read_header(self, columns):
+        if os.path.getsize(self._path) == 0:
+            return
+        with open(self._path, 'rb') as data_file:
+            with mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ) as data_map:
+                self._data_start = self._record_end(data_map, 0, False)
+                text = data_map[:self._data_start].decode(self._encoding)
+        header = next(csv.reader(io.StringIO(text, newline=''), dialect=self._dialect), None)
+        if header is None:
+            return
+        self._width = len(header)
+        self._indices = data_parser.column_indices(header, columns)
+        if self._indices is not None:
+            header = [header[idx] for idx in self._indices]
+        self._header = header
+
+    def iter_ranges(self):
+        """
+        Splits the records after the header, the file is scanned once
+        for the quote characters and new lines
+
+        Yields
+        ------
+        csv_range : CsvRange
+            In the order of the file
+        """
+        if self._header is None:
+            return
+        with open(self._path, 'rb') as data_file:
+            with mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ) as data_map:
+                size = len(data_map)
+                start = self._data_start
+                while start < size:
+                    target = start + self._chunk_bytes
+                    if target >= size:
+                        end = size
+                    else:
+                        # an odd number of quotes before the target means it is in a quoted field
+                        in_quotes = data_map[start:target].count(self._quote) % 2 == 1
+                        end = self._record_end(data_map, target, in_quotes)
+                    yield CsvRange(self._path, start, end, self._dialect, self._encoding,
+                        self._header, self._width, self._indices)
+                    start = end
+
+    def _record_end(self, data_map, position, in_quotes):
+        """
+        Params
+        ------
+        position : int
+            The byte to search from
+        in_quotes : bool
+            The position is in a quoted field
+        Returns
+        -------
+        end : int
+            The byte after the first new line outside of the quoted
+            fields, the size of the file when there is none
+        """
+        while True:
+            new_line = data_map.find(_NEW_LINE, position)
+            if new_line < 0:
+                return len(data_map)
+            if data_map[position:new_line].count(self._quote) % 2 == 1:
+                in_quotes = not in_quotes
+            position = new_line + 1
+            if not in_quotes:
+                return position
+
+    def __iter__(self):
+        """
+        Yields
+        ------
+        row : tuple
+            Every iteration reads the file again
+        """
+        if self._jobs <= 1:
+            for csv_range in self.iter_ranges():
+                yield from read_range(csv_range)
+            return
+        # the pools are imported only for parallel runs, they take long to import
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(self._jobs)
+        max_pending = self._jobs * ChunkedCsvFile._RANGES_PER_JOB
+        pending = deque()
+        try:
+            for csv_range in self.iter_ranges():
+                pending.append(executor.submit(read_range, csv_range))
+                if len(pending) >= max_pending:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+        finally:
+            executor.shutdown(cancel_futures=True)
@@ -1,36 +1,392 @@
+from collections import deque, namedtuple, OrderedDict
+import itertools
 import os
+import threading
+import time
 
 import modules.cmd_fuse_exception as cmd_fuse_exception
+import modules.command_buckets    as command_buckets
 import modules.command_parser     as command_parser
 import modules.data_parser        as data_parser
+import modules.fuse_stats         as fuse_stats
+import modules.output_sink        as output_sink
 
 class CommandSeparationType:
     sequential = 'seq'
     group = 'group'
 
+class FuseBackend:
+    row = 'row'
+    columnar = 'columnar'
+
+IncrementalResult = namedtuple('IncrementalResult',
+    ['rows', 'reused_rows', 'regenerated_rows', 'commands'])
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'max_size', 'size'])
+
+class CommandCache:
+    """
+    Least recently used memo of the command cells, one raw cell string
+    maps to its already resolved commands. The entries belong to the
+    header they were resolved for
+    """
+    BASE_MAX_SIZE = 1024
+
+    def __init__(self, max_size=BASE_MAX_SIZE):
+        """
+        Params
+        ------
+        max_size : int
+            The number of distinct cells to remember
+        """
+        self._max_size = max_size
+        self._entries = OrderedDict()
+        self._header = None
+        self.hits = 0
+        self.misses = 0
+
+    def use_header(self, header):
+        """
+        Forgets the entries when the cells are read from another header
+        """
+        if header != self._header:
+            self._entries.clear()
+            self._header = header
+
+    def get(self, command_str):
+        resolved = self._entries.get(command_str)
+        if resolved is None:
+            self.misses = self.misses + 1
+        else:
+            self.hits = self.hits + 1
+            self._entries.move_to_end(command_str)
+        return resolved
+
+    def put(self, command_str, resolved):
+        self._entries[command_str] = resolved
+        if len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self._max_size, len(self._entries))
+
+class RowFuser:
+    """
+    Generates the commands of the rows, one instance belongs to the
+    CommandFuse and a copy is sent once to every parallel worker
+    """
+    def __init__(self, commands, command_column, cmd_id_sep,
+        cache_size=CommandCache.BASE_MAX_SIZE):
+        """
+        Params
+        ------
+        commands : dict
+            The command id and OneCommand pairs
+        command_column : str
+            The column which holds the command ids
+        cmd_id_sep : str
+            Separates the command ids in the command column
+        cache_size : int
+            The number of distinct command cells to remember
+        """
+        self._commands = commands
+        self._command_column = command_column
+        self._command_id_sep = cmd_id_sep
+        self._cache_size = cache_size
+        self._command_cache = CommandCache(cache_size)
+
+    @property
+    def command_cache(self):
+        return self._command_cache
+
+    @property
+    def command_column(self):
+        return self._command_column
+
+    def worker_copy(self):
+        """
+        Returns
+        -------
+        RowFuser
+            With the same commands and its own command cache
+        """
+        return RowFuser(self._commands, self._command_column,
+            self._command_id_sep, self._cache_size)
+
+    def iter_table_commands(self, table, index):
+        """
+        The command cells are resolved once to the commands bound
+        to the table's columns, the rows are read by position
+
+        Params
+        ------
+        table : data_parser.DataTable
+            The rows to generate from
+        index : int
+            The row number of the first row
+        Yields
+        ------
+        (command_id, command) : tuple
+            The command id and the generated command
+        Returns
+        -------
+        index : int
+            The row number after the last row of the table
+        """
+        command_idx = table.columns.get(self._command_column)
+        if command_idx is None:
+            for _ in table:
+                index = index + 1
+            return index
+        command_cache = self._command_cache
+        command_cache.use_header(table.header)
+        for row in table:
+            command_str = row[command_idx]
+            if command_str:
+                resolved = command_cache.get(command_str)
+                if resolved is None:
+                    resolved = self._resolve(command_str, table.columns, index)
+                    command_cache.put(command_str, resolved)
+                for command_id, bound_command in resolved:
+                    yield command_id, bound_command.generate(row)
+            index = index + 1
+        return index
+
+    def iter_resolved_rows(self, table, index):
+        """
+        Resolves the command cells without generating the commands
+
+        Yields
+        ------
+        (index, row, resolved) : tuple
+            The row number, the row and its (command_id, BoundCommand)
+            pairs, BoundCommand.generate(row) creates the command
+        """
+        command_idx = table.columns.get(self._command_column)
+        self._command_cache.use_header(table.header)
+        for row in table:
+            resolved = ()
+            if command_idx is not None:
+                command_str = row[command_idx]
+                if command_str:
+                    resolved = self.resolve_cell(command_str, table.columns, index)
+            yield index, row, resolved
+            index = index + 1
+
+    def resolve_cell(self, command_str, columns, index):
+        """
+        Resolves one command cell through the cache, the cache
+        must be set to the table's header with use_header
+
+        Returns
+        -------
+        resolved : []
+            One element is a (command_id, BoundCommand) tuple
+        """
+        resolved = self._command_cache.get(command_str)
+        if resolved is None:
+            resolved = self._resolve(command_str, columns, index)
+            self._command_cache.put(command_str, resolved)
+        return resolved
+
+    def fuse_chunk(self, header, rows, index):
+        """
+        Params
+        ------
+        header : tuple
+            The column names of the rows
+        rows : []
+            One element is a tuple
+        index : int
+            The row number of the first row
+        Returns
+        -------
+        row_commands : []
+            One element is a (command_id, command) tuple
+        """
+        table = data_parser.DataTable(header, rows)
+        return list(self.iter_table_commands(table, index))
+
+    def _resolve(self, command_str, columns, index):
+        """
+        Returns
+        -------
+        resolved : []
+            One element is a (command_id, BoundCommand) tuple
+        """
+        resolved = []
+        for command_id in self.extract_commands(command_str):
+            resolved.append((command_id, self._bind(command_id, columns, index)))
+        return resolved
+
+    def _bind(self, command_id, columns, index):
+        one_command = self._commands.get(command_id)
+        if not one_command:
+           raise cmd_fuse_exception.UnknownCommandIdError(command_id, index)
+        try:
+            return one_command.bind(columns)
+        except cmd_fuse_exception.CannotGenerateCommandError as generated_error:
+            message = str(generated_error)
+            raise cmd_fuse_exception.FuseExecutionError(message, index)
+
+    def extract_commands(self, command_str):
+        commands = command_str.split(self._command_id_sep)
+        formatted_command_ids = []
+        for cmd_id in commands:
+            formatted_command_ids.append(cmd_id.strip())
+        return formatted_command_ids
+
+# the RowFuser of a parallel worker, set once by the pool initializer
+_worker_state = threading.local()
+
+def _init_fuse_worker(row_fuser):
+    _worker_state.row_fuser = row_fuser.worker_copy()
+
+def _fuse_worker_chunk(header, rows, index):
+    """
+    Returns
+    -------
+    (row_commands, cache_hits, cache_misses) : tuple
+        The cache counters are the ones of this chunk
+    """
+    row_fuser = _worker_state.row_fuser
+    command_cache = row_fuser.command_cache
+    hits = command_cache.hits
+    misses = command_cache.misses
+    row_commands = row_fuser.fuse_chunk(header, rows, index)
+    return row_commands, command_cache.hits - hits, command_cache.misses - misses
+
+def _fuse_worker_range(csv_range):
+    """
+    Reads and fuses one byte range of a chunked_csv.ChunkedCsvFile
+
+    Returns
+    -------
+    (row_count, row_commands, failed_rows, cache_hits, cache_misses) : tuple
+        The row numbers of a range are known only when the ranges
+        before it are done, a failed range returns its rows instead
+        of the commands and it is fused again at its row numbers
+    """
+    import modules.chunked_csv as chunked_csv
+    rows = chunked_csv.read_range(csv_range)
+    row_fuser = _worker_state.row_fuser
+    command_cache = row_fuser.command_cache
+    hits = command_cache.hits
+    misses = command_cache.misses
+    try:
+        row_commands = row_fuser.fuse_chunk(csv_range.header, rows, 0)
+    except cmd_fuse_exception.CommandFuseError:
+        return (len(rows), None, rows,
+            command_cache.hits - hits, command_cache.misses - misses)
+    return (len(rows), row_commands, None,
+        command_cache.hits - hits, command_cache.misses - misses)
+
 class CommandFuse:
 
     BASE_COMMAND_COLUMN = 'CMD'
     BASE_COMMAND_SEP = ';'
     _DATA_START_IDX = 1
+    _PARALLEL_CHUNK_SIZE = 2000
+    # chunks in flight per job, bounds the memory of the parallel fuse
+    _PARALLEL_CHUNKS_PER_JOB = 2
     # windows using \r\n for endline only use \n
     _NEW_LINE = '\n' 
 
     def __init__(self, data, commands, 
        command_column=BASE_COMMAND_COLUMN,
        cmd_id_sep=BASE_COMMAND_SEP,
-       separation_type=CommandSeparationType.sequential):
+       separation_type=CommandSeparationType.sequential,
+       group_order=None, group_memory_budget=None,
+       jobs=1, use_threads=False,
+       command_cache_size=CommandCache.BASE_MAX_SIZE, stats=None,
+       backend=FuseBackend.row, dedupe=None):
+        """
+        Params
+        ------
+        data : iterable
+            A data_parser.DataTable, the tables of a RawDataParser
+            or rows where one element is a dict
+        commands : dict
+            The command id and OneCommand pairs
+        command_column : str
+            The column which holds the command ids
+        cmd_id_sep : str
+            Separates the command ids in the command column
+        separation_type : str
+            A CommandSeparationType value
+        group_order : []
+            Command ids to emit first in group fuse, one element is str
+        group_memory_budget : int
+            Characters to hold in memory at group fuse before spilling
+            to temporary files, None is unlimited
+        jobs : int
+            The number of parallel workers, the rows are fused
+            in chunks and merged back in the original order, the
+            workers read the byte ranges of a chunked csv file too
+        use_threads : bool
+            Use a thread pool instead of a process pool for the jobs
+        command_cache_size : int
+            The number of distinct command cells to remember resolved
+        stats : fuse_stats.FuseStats
+            Collects the fuse and write time and counters, None skips it
+        backend : str
+            A FuseBackend value, the columnar backend needs numpy and
+            falls back to the row backend without it, the parallel
+            jobs always use the row backend
+        dedupe : command_dedupe.CommandDeduper
+            Drops the repeated commands, the first occurrence is kept,
+            None keeps every command. The incremental fuse ignores it
+        """
         self._data = data
         self._commands = commands
         self._command_column = command_column
         self._command_id_sep = cmd_id_sep
         self._separation_type = separation_type
+        self._group_order = group_order
+        self._group_memory_budget = group_memory_budget
+        self._jobs = jobs
+        self._use_threads = use_threads
+        self._row_fuser = RowFuser(commands, command_column,
+            cmd_id_sep, command_cache_size)
+        self._table_fuser = self._row_fuser
+        if backend == FuseBackend.columnar:
+            import modules.columnar_fuse as columnar_fuse
+            try:
+                self._table_fuser = columnar_fuse.ColumnarFuser(commands, self._row_fuser)
+            except cmd_fuse_exception.MissingDependencyError:
+                pass
+        # counters of the command caches in the parallel workers
+        self._worker_cache_hits = 0
+        self._worker_cache_misses = 0
+        self._rows_fused = 0
+        self._stats = stats
+        self._dedupe = dedupe
 
-        self._fuse_functions = {
-           CommandSeparationType.group : self._group_fuse,
-           CommandSeparationType.sequential : self._seq_fuse
+        self._iter_fuse_functions = {
+           CommandSeparationType.group : self._iter_group_fuse,
+           CommandSeparationType.sequential : self._iter_seq_fuse
         }
 
+    @staticmethod
+    def required_columns(commands, command_column=BASE_COMMAND_COLUMN):
+        """
+        Params
+        ------
+        commands : dict
+            The command id and OneCommand pairs
+        command_column : str
+            The column which holds the command ids
+        Returns
+        -------
+        columns : set
+            The only columns a fuse of the commands reads, the command
+            column and the required columns of every command
+        """
+        columns = set([command_column])
+        for one_command in commands.values():
+            columns.update(one_command.required_columns)
+        return columns
+
     def fuse(self):
         """
         Generates the commands
@@ -40,88 +396,566 @@ class CommandFuse:
         generated_commands : []
             One element is str
         """
-        generated_commands = []
-        fuse_function = self._fuse_functions.get(self._separation_type)
+        return list(self.iter_fuse())
+
+    def command_cache_info(self):
+        """
+        Returns
+        -------
+        CacheInfo
+            The hits and misses of the command cell cache,
+            the parallel workers' counters are included
+        """
+        info = self._row_fuser.command_cache.info()
+        return CacheInfo(info.hits + self._worker_cache_hits,
+            info.misses + self._worker_cache_misses, info.max_size, info.size)
+
+    def validate(self):
+        """
+        Checks the data once before fusing, every command id in the
+        command column must be in the package and every required column
+        of the referenced commands must be in the header of its table.
+        The distinct command cells are checked instead of every row,
+        the data is read one more time
+
+        Raises
+        ------
+        DataValidationError
+            With every unknown command id and missing column
+        """
+        problems = []
+        index = CommandFuse._DATA_START_IDX
+        if self._stats:
+            with self._stats.timer(fuse_stats.FuseStats.VALIDATE):
+                for table in data_parser.as_tables(self._data):
+                    index = self._validate_table(table, index, problems)
+            self._stats.add(fuse_stats.FuseStats.VALIDATE,
+                'rows', index - CommandFuse._DATA_START_IDX)
+        else:
+            for table in data_parser.as_tables(self._data):
+                index = self._validate_table(table, index, problems)
+        if problems:
+            raise cmd_fuse_exception.DataValidationError(problems)
+
+    def _validate_table(self, table, index, problems):
+        """
+        Returns
+        -------
+        index : int
+            The row number after the last row of the table
+        """
+        command_idx = table.columns.get(self._command_column)
+        command_cells = {}
+        for row in table:
+            if command_idx is not None:
+                command_str = row[command_idx]
+                if command_str and command_str not in command_cells:
+                    command_cells[command_str] = index
+            index = index + 1
+
+        first_lines = {}
+        for command_str, line in command_cells.items():
+            for command_id in self._row_fuser.extract_commands(command_str):
+                if command_id not in first_lines:
+                    first_lines[command_id] = line
+        for command_id, line in first_lines.items():
+            one_command = self._commands.get(command_id)
+            if not one_command:
+                problems.append(str(cmd_fuse_exception.UnknownCommandIdError(command_id, line)))
+                continue
+            try:
+                one_command.bind(table.columns)
+            except cmd_fuse_exception.CannotGenerateCommandError as generated_error:
+                problems.append(str(cmd_fuse_exception.FuseExecutionError(
+                    str(generated_error), line)))
+        return index
+
+    def iter_fuse(self):
+        """
+        Generates the commands one by one while the data is read,
+        in sequential mode only the current row is held in memory
+
+        Yields
+        ------
+        command : str
+            One generated command
+        """
+        fuse_function = self._iter_fuse_functions.get(self._separation_type)
         if not fuse_function:
             raise cmd_fuse_exception.NotSupportedSeparationError(self._separation_type)
-        generated_commands = fuse_function()
-        return generated_commands
+        if self._stats:
+            return self._iter_with_stats(fuse_function())
+        return fuse_function()
+
+    def _iter_with_stats(self, commands):
+        """
+        Adds the time spent generating to the fuse stage,
+        the time of the consumer between two commands is left out
+        """
+        stage = self._stats.stage(fuse_stats.FuseStats.FUSE)
+        cache_info = self.command_cache_info()
+        command_count = 0
+        try:
+            start = time.perf_counter()
+            for command in commands:
+                stage.seconds = stage.seconds + time.perf_counter() - start
+                command_count = command_count + 1
+                yield command
+                start = time.perf_counter()
+            stage.seconds = stage.seconds + time.perf_counter() - start
+        finally:
+            end_cache_info = self.command_cache_info()
+            stage.add('rows', self._rows_fused)
+            stage.add('commands', command_count)
+            stage.add('cache_hits', end_cache_info.hits - cache_info.hits)
+            stage.add('cache_misses', end_cache_info.misses - cache_info.misses)
 
     def fuse_to_file(self, path):
         """
         Saves the generated output to the provided path
         """
-        generated_commands = self.fuse()
-        
-        with open(path, 'w') as to_save:
-            command_str = CommandFuse._NEW_LINE.join(generated_commands)
-            to_save.write(command_str)
+        self.fuse_to_sinks([output_sink.FileSink(path)])
 
-    def _group_fuse(self):
+    def fuse_to_stream(self, stream):
         """
-        Implements the group command generation
+        Writes the commands to the stream as they are generated,
+        the commands are separated by new lines
 
-        Retunrs
+        Params
+        ------
+        stream : file object
+            Opened for writing text
+        """
+        self.fuse_to_sinks([output_sink.SeparatedStreamSink(stream)])
+
+    def fuse_to_sinks(self, sinks):
+        """
+        Generates the commands once and writes every command
+        into all of the sinks, e.g. a file and the console
+
+        Params
+        ------
+        sinks : []
+            One element is an output_sink.CommandSink
+        Returns
         -------
-        generated_commands : []
-            One element is str
+        command_count : int
+            The number of generated commands
+        """
+        command_count = 0
+        opened_sinks = []
+        write_seconds = 0.0
+        try:
+            for sink in sinks:
+                sink.open()
+                opened_sinks.append(sink)
+            if self._stats:
+                for command in self.iter_fuse():
+                    start = time.perf_counter()
+                    for sink in sinks:
+                        sink.write(command)
+                    write_seconds = write_seconds + time.perf_counter() - start
+                    command_count = command_count + 1
+            else:
+                for command in self.iter_fuse():
+                    for sink in sinks:
+                        sink.write(command)
+                    command_count = command_count + 1
+        except BaseException:
+            # e.g. an atomic file sink does not replace the previous output
+            for sink in opened_sinks:
+                sink.abort()
+            raise
+        start = time.perf_counter()
+        for sink in opened_sinks:
+            sink.close()
+        if self._stats:
+            write_seconds = write_seconds + time.perf_counter() - start
+            self._stats.add_time(fuse_stats.FuseStats.WRITE, write_seconds)
+            for sink in opened_sinks:
+                self._stats.add(fuse_stats.FuseStats.WRITE, 'bytes_written', sink.bytes_written)
+        return command_count
+
+    def fuse_to_shards(self, shard_output, key_column):
+        """
+        Saves the commands of every row into the shard of the row's
+        value in the key column, e.g. one file per host. The shards keep
+        the order of the rows, the rows are fused on the row backend
+
+        Params
+        ------
+        shard_output : shard_output.ShardOutput
+            Receives the (key, command) pairs
+        key_column : str
+            The column which selects the shard of a row
+        Returns
+        -------
+        command_count : int
+            The number of generated commands
+        Raises
+        ------
+        NotSupportedSeparationError
+            When it is not the sequential fuse
+        """
+        if self._separation_type != CommandSeparationType.sequential:
+            raise cmd_fuse_exception.NotSupportedSeparationError(self._separation_type)
+        command_count = 0
+        keyed_commands = self._iter_keyed_commands(key_column)
+        if self._dedupe:
+            keyed_commands = self._iter_deduped(keyed_commands)
+        started = time.perf_counter()
+        shard_output.open()
+        try:
+            for key, command in keyed_commands:
+                shard_output.write(key, command)
+                command_count = command_count + 1
+        except BaseException:
+            shard_output.abort()
+            raise
+        fuse_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        shard_output.close()
+        if self._stats:
+            self._stats.add_time(fuse_stats.FuseStats.FUSE, fuse_seconds)
+            self._stats.add(fuse_stats.FuseStats.FUSE, 'rows', self._rows_fused)
+            self._stats.add(fuse_stats.FuseStats.FUSE, 'commands', command_count)
+            self._stats.add_time(fuse_stats.FuseStats.WRITE, time.perf_counter() - started)
+            self._stats.add(fuse_stats.FuseStats.WRITE, 'bytes_written', shard_output.bytes_written)
+        return command_count
+
+    def _iter_keyed_commands(self, key_column):
+        """
+        Yields
+        ------
+        (key, command) : tuple
+            In the order of the rows
+        """
+        rows = 0
+        for table in data_parser.as_tables(self._data):
+            key_idx = table.columns.get(key_column)
+            for index, row, resolved in self._row_fuser.iter_resolved_rows(
+                table, CommandFuse._DATA_START_IDX + rows):
+                rows = rows + 1
+                if not resolved:
+                    continue
+                if key_idx is None:
+                    raise cmd_fuse_exception.FuseExecutionError(
+                        'Missing shard column \'{}\' '.format(key_column), index)
+                key = row[key_idx]
+                for _, bound_command in resolved:
+                    yield key, bound_command.generate(row)
+        self._rows_fused = rows
+
+    def fuse_to_file_incremental(self, path, diff_path=None):
+        """
+        Saves the sequential output like fuse_to_file, but regenerates only
+        the rows whose values or referenced command templates changed since
+        the previous run. The others are copied from the previous output.
+        The row and template fingerprints are kept in a manifest next
+        to the output, the rows are matched by their position
+
+        Params
+        ------
+        path : str
+            The output file, the previous output is read from here
+        diff_path : str
+            Saves only the new and changed commands to this file
+        Returns
+        -------
+        IncrementalResult
+        """
+        if self._separation_type != CommandSeparationType.sequential:
+            raise cmd_fuse_exception.NotSupportedSeparationError(self._separation_type)
+        import modules.fuse_manifest as fuse_manifest
+        options = [self._command_column, self._command_id_sep]
+        templates = {}
+        for cmd_id, one_command in self._commands.items():
+            templates[cmd_id] = fuse_manifest.template_fingerprint(one_command)
+
+        previous = fuse_manifest.FuseManifest.read(fuse_manifest.manifest_path(path))
+        if previous and (previous.options != options or not os.path.isfile(path)
+                or os.path.getsize(path) != previous.output_size):
+            previous = None
+        changed_templates = set(templates)
+        previous_records = iter(())
+        previous_output = None
+        if previous:
+            changed_templates = set(cmd_id for cmd_id, fingerprint in templates.items()
+                if previous.templates.get(cmd_id) != fingerprint)
+            previous_records = previous.iter_records()
+            previous_output = output_sink.open_output(path)
+
+        sinks = [output_sink.FileSink(path)]
+        if diff_path:
+            sinks.append(output_sink.FileSink(diff_path))
+        manifest_writer = fuse_manifest.ManifestWriter(fuse_manifest.manifest_path(path))
+        started = time.perf_counter()
+        try:
+            for sink in sinks:
+                sink.open()
+            result = self._splice_rows(sinks, manifest_writer, changed_templates,
+                previous_records, previous_output)
+        except BaseException:
+            for sink in sinks:
+                sink.abort()
+            manifest_writer.abort()
+            raise
+        finally:
+            if previous_output:
+                previous_output.close()
+        for sink in sinks:
+            sink.close()
+        manifest_writer.commit(options, templates, sinks[0].bytes_written)
+        if self._stats:
+            self._stats.add_time(fuse_stats.FuseStats.FUSE, time.perf_counter() - started)
+            self._stats.add(fuse_stats.FuseStats.FUSE, 'rows', result.rows)
+            self._stats.add(fuse_stats.FuseStats.FUSE, 'rows_reused', result.reused_rows)
+            self._stats.add(fuse_stats.FuseStats.FUSE, 'commands', result.commands)
+        return result
+
+    def _splice_rows(self, sinks, manifest_writer, changed_templates,
+        previous_records, previous_output):
         """
-        command_dict = {}
+        Returns
+        -------
+        IncrementalResult
+        """
+        import modules.fuse_manifest as fuse_manifest
+        output = sinks[0]
+        diff_output = None
+        if len(sinks) > 1:
+            diff_output = sinks[1]
+        rows = 0
+        reused_rows = 0
+        command_count = 0
         index = CommandFuse._DATA_START_IDX
-        for row in self._data:
-            command_str = row.get(self._command_column)
-            if command_str:
-                commands = self._extract_commands(command_str)
-                for command_id in commands:
-                    one_command = self._commands.get(command_id)
-                    if not one_command:
-                       raise cmd_fuse_exception.UnknownCommandIdError(command_id, index)
-                    if not command_dict.get(command_id):
-                        command_dict[command_id] = []
-                    try:
-                        command_dict[command_id].append(one_command.generate(row))
-                    except cmd_fuse_exception.CannotGenerateCommandError as generated_error:
-                        message = str(generated_error)
-                        raise cmd_fuse_exception.FuseExecutionError(message, index)
-            index = index + 1
-        generated_commads = []
-        for cmd_id in command_dict:
-            generated_commads = generated_commads + command_dict[cmd_id]
-        return generated_commads
+        for table in data_parser.as_tables(self._data):
+            table_digest = fuse_manifest.header_digest(table.header)
+            for index, row, resolved in self._row_fuser.iter_resolved_rows(table, index):
+                fingerprint = fuse_manifest.row_fingerprint(table_digest, row)
+                previous_record = next(previous_records, None)
+                previous_text = None
+                if previous_record is not None:
+                    previous_text = CommandFuse._read_row_output(
+                        previous_output, previous_record[1])
 
-    def _seq_fuse(self):
+                is_reused = (previous_record is not None
+                    and previous_record[0] == fingerprint
+                    and not any(cmd_id in changed_templates for cmd_id, _ in resolved))
+                if is_reused:
+                    row_text = previous_text
+                    reused_rows = reused_rows + 1
+                else:
+                    row_commands = [bound.generate(row) for _, bound in resolved]
+                    row_text = CommandFuse._NEW_LINE.join(row_commands)
+                    if diff_output:
+                        previous_commands = set()
+                        if previous_text:
+                            previous_commands = set(previous_text.split(CommandFuse._NEW_LINE))
+                        for command in row_commands:
+                            if command not in previous_commands:
+                                diff_output.write(command)
+
+                line_count = 0
+                if resolved:
+                    output.write(row_text)
+                    line_count = row_text.count(CommandFuse._NEW_LINE) + 1
+                    command_count = command_count + len(resolved)
+                manifest_writer.add(fingerprint, line_count)
+                rows = rows + 1
+            index = CommandFuse._DATA_START_IDX + rows
+        return IncrementalResult(rows, reused_rows, rows - reused_rows, command_count)
+
+    @staticmethod
+    def _read_row_output(previous_output, line_count):
         """
-        Implements the sequential fuse 
-        
         Returns
         -------
-        generated_commands : []
-            One element is str
+        row_text : str
+            The next line_count lines of the previous output
+            without the last new line
+        """
+        lines = []
+        for _ in range(line_count):
+            lines.append(next(previous_output, ''))
+        row_text = ''.join(lines)
+        if row_text.endswith(CommandFuse._NEW_LINE):
+            row_text = row_text[:-1]
+        return row_text
+
+    def iter_command_groups(self):
+        """
+        Yields
+        ------
+        (command_id, commands) : tuple
+            In group fuse one for every bucket in the emitted order,
+            in sequential fuse one with a None id and every command in
+            the order of the rows, commands is an iterable of str
+        """
+        if self._separation_type == CommandSeparationType.sequential:
+            yield None, self.iter_fuse()
+            return
+        if self._separation_type != CommandSeparationType.group:
+            raise cmd_fuse_exception.NotSupportedSeparationError(self._separation_type)
+        yield from self._iter_buckets()
+
+    def _iter_buckets(self):
+        """
+        The group fuse needs every row before the first command,
+        the buckets are emitted afterwards one by one
+
+        Yields
+        ------
+        (command_id, commands) : tuple
+            One for every bucket in the emitted order
+        """
+        buckets = command_buckets.CommandBuckets(
+            self._group_order, self._group_memory_budget)
+        try:
+            for command_id, command in self._iter_row_commands():
+                buckets.add(command_id, command)
+            yield from buckets.iter_groups()
+        finally:
+            buckets.close()
+
+    def _iter_group_fuse(self):
+        """
+        Yields
+        ------
+        command : str
+            One generated command, bucket after bucket
+        """
+        for _, commands in self._iter_buckets():
+            yield from commands
+
+    def _iter_seq_fuse(self):
+        """
+        Implements the sequential fuse row by row
+
+        Yields
+        ------
+        command : str
+            One generated command
+        """
+        for _, command in self._iter_row_commands():
+            yield command
+
+    def _iter_row_commands(self):
+        """
+        Yields
+        ------
+        (command_id, command) : tuple
+            In the order of the rows
         """
-        generated_commands = []
+        if self._jobs and self._jobs > 1:
+            row_commands = self._iter_parallel_row_commands()
+        else:
+            row_commands = self._iter_serial_row_commands()
+        if self._dedupe:
+            return self._iter_deduped(row_commands)
+        return row_commands
+
+    def _iter_deduped(self, keyed_commands):
+        """
+        Params
+        ------
+        keyed_commands : iterable
+            One element is a (command_id, command) or (key, command)
+            tuple, the first one is the group of the group scope
+        Yields
+        ------
+        (group, command) : tuple
+            Only the first occurrence of a command
+        """
+        dedupe = self._dedupe
+        dedupe.reset()
+        try:
+            for group, command in keyed_commands:
+                if dedupe.is_new(command, group):
+                    yield group, command
+        finally:
+            dedupe.close()
+            if self._stats:
+                self._stats.add(fuse_stats.FuseStats.FUSE, 'duplicates_removed', dedupe.removed)
+
+    def _iter_serial_row_commands(self):
         index = CommandFuse._DATA_START_IDX
-        for row in self._data:
-            command_str = row.get(self._command_column)
-            if command_str:
-                commands = self._extract_commands(command_str)
-                for command_id in commands:
-                    command_id = command_id.strip()
-                    one_command = self._commands.get(command_id)
-                    if not one_command:
-                       raise cmd_fuse_exception.UnknownCommandIdError(command_id, index)
-                    try:
-                        generated_commands.append(one_command.generate(row))
-                    except cmd_fuse_exception.CannotGenerateCommandError as generated_error:
-                        message = str(generated_error)
-                        raise cmd_fuse_exception.FuseExecutionError(message, index)
-            index = index + 1
-        return generated_commands
+        for table in data_parser.as_tables(self._data):
+            index = yield from self._table_fuser.iter_table_commands(table, index)
+        self._rows_fused = index - CommandFuse._DATA_START_IDX
 
-    def _extract_commands(self, command_str):
-        commands = command_str.split(self._command_id_sep)
-        formatted_command_ids = []
-        for cmd_id in commands:
-            formatted_command_ids.append(cmd_id.strip())
-        return formatted_command_ids
-            
-        
\ No newline at end of file
+    def _iter_parallel_row_commands(self):
+        """
+        Fuses the chunks of rows in a worker pool, only a few chunks
+        per job are in flight so the rows are still read lazily
+        """
+        # the pools are imported only for parallel runs, they take long to import
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+        executor_type = ProcessPoolExecutor
+        if self._use_threads:
+            executor_type = ThreadPoolExecutor
+        executor = executor_type(self._jobs,
+            initializer=_init_fuse_worker, initargs=(self._row_fuser,))
+        max_pending = self._jobs * CommandFuse._PARALLEL_CHUNKS_PER_JOB
+        pending = deque()
+        try:
+            index = CommandFuse._DATA_START_IDX
+            for table in data_parser.as_tables(self._data):
+                iter_ranges = getattr(table.rows, 'iter_ranges', None)
+                if iter_ranges:
+                    # the first row number of the ranges is known after the chunks before
+                    while pending:
+                        yield from self._chunk_result(pending.popleft())
+                    index = yield from self._iter_range_commands(
+                        executor, table.header, iter_ranges(), index)
+                    continue
+                rows = iter(table)
+                chunk = list(itertools.islice(rows, CommandFuse._PARALLEL_CHUNK_SIZE))
+                while chunk:
+                    pending.append(executor.submit(
+                        _fuse_worker_chunk, table.header, chunk, index))
+                    index = index + len(chunk)
+                    if len(pending) >= max_pending:
+                        yield from self._chunk_result(pending.popleft())
+                    chunk = list(itertools.islice(rows, CommandFuse._PARALLEL_CHUNK_SIZE))
+            while pending:
+                yield from self._chunk_result(pending.popleft())
+            self._rows_fused = index - CommandFuse._DATA_START_IDX
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def _iter_range_commands(self, executor, header, csv_ranges, index):
+        """
+        Reads and fuses the byte ranges of a chunked csv file in the
+        workers, the workers parse the file too
+
+        Returns
+        -------
+        index : int
+            The row number after the last row of the ranges
+        """
+        max_pending = self._jobs * CommandFuse._PARALLEL_CHUNKS_PER_JOB
+        pending = deque()
+        for csv_range in csv_ranges:
+            pending.append(executor.submit(_fuse_worker_range, csv_range))
+            if len(pending) >= max_pending:
+                index = yield from self._range_result(pending.popleft(), header, index)
+        while pending:
+            index = yield from self._range_result(pending.popleft(), header, index)
+        return index
+
+    def _range_result(self, future, header, index):
+        row_count, row_commands, failed_rows, cache_hits, cache_misses = future.result()
+        self._worker_cache_hits = self._worker_cache_hits + cache_hits
+        self._worker_cache_misses = self._worker_cache_misses + cache_misses
+        if row_commands is None:
+            # raises the error of the range at its row number
+            row_commands = self._row_fuser.fuse_chunk(header, failed_rows, index)
+        yield from row_commands
+        return index + row_count
+
+    def _chunk_result(self, future):
+        row_commands, cache_hits, cache_misses = future.result()
+        self._worker_cache_hits = self._worker_cache_hits + cache_hits
+        self._worker_cache_misses = self._worker_cache_misses + cache_misses
+        return row_commands
@@ -58,4 +58,108 @@ class ColumnSyntaxError(CommandFuseError):
         self._message = 'Missing column parenthesis \'{}\''.format(missing_col)
 
     def __str__(self):
-        return self._message
\ No newline at end of file
+        return self._message
+
+class PackageFormatError(CommandFuseError):
+
+    def __init__(self, message):
+        self._message = 'Cannot load the package: {}'.format(message)
+
+    def __str__(self):
+        return self._message
+
+class SheetNotFoundError(CommandFuseError):
+
+    def __init__(self, sheet_name, path):
+        self._message = 'Cannot find sheet \'{}\' in: {}'.format(sheet_name, path)
+
+    def __str__(self):
+        return self._message
+
+class MissingDependencyError(CommandFuseError):
+
+    def __init__(self, package, purpose):
+        self._message = 'The \'{}\' package is required for: {}'.format(package, purpose)
+
+    def __str__(self):
+        return self._message
+
+class DataValidationError(CommandFuseError):
+
+    def __init__(self, problems):
+        self._problems = problems
+        self._message = 'Found {} problem(s) in the data:'.format(len(problems))
+        for problem in problems:
+            self._message += '\n  ' + problem
+
+    @property
+    def problems(self):
+        return self._problems
+
+    def __str__(self):
+        return self._message
+
+class NotSupportedCompressionError(CommandFuseError):
+
+    def __init__(self, compression):
+        self._message = 'Not supported compression: {}'.format(compression)
+
+    def __str__(self):
+        return self._message
+
+class RemoteFuseError(CommandFuseError):
+
+    def __init__(self, address, message):
+        self._message = 'The fuse server at {} failed: {}'.format(address, message)
+
+    def __str__(self):
+        return self._message
+
+class NonLocalAddressError(CommandFuseError):
+
+    def __init__(self, address):
+        self._message = ('The fuse server serves only local clients, {} is not a loopback '
+            'address, allow the remote clients (-allow_remote) to serve on it').format(address)
+
+    def __str__(self):
+        return self._message
+
+class ShardDirectoryError(CommandFuseError):
+
+    def __init__(self, path):
+        self._message = 'Cannot save the shards into {}, it is a file'.format(path)
+
+    def __str__(self):
+        return self._message
+
+class BatchConflictError(CommandFuseError):
+
+    def __init__(self, conflicts):
+        self._conflicts = conflicts
+        self._message = 'Found {} conflict(s) between the batch jobs:'.format(len(conflicts))
+        for conflict in conflicts:
+            self._message += '\n  ' + conflict
+
+    @property
+    def conflicts(self):
+        return self._conflicts
+
+    def __str__(self):
+        return self._message
+
+class PackageNameError(CommandFuseError):
+
+    def __init__(self, package):
+        self._message = ('Not a package name of the server or a commands file of its '
+            'commands directory: {}').format(package)
+
+    def __str__(self):
+        return self._message
+
+class SocketPathError(CommandFuseError):
+
+    def __init__(self, path):
+        self._message = 'Cannot serve on {}, the path exists and it is not a socket'.format(path)
+
+    def __str__(self):
+        return self._message
@@ -0,0 +1,105 @@
+import itertools
+import operator
+
+import modules.cmd_fuse_exception as cmd_fuse_exception
+import modules.data_parser        as data_parser
+
+class ColumnarFuser:
+    """
+    Generates the commands of a table command by command instead of
+    row by row. The rows which share a command cell are grouped with
+    numpy, every command of a group is generated over all of its rows
+    in one pass, then numpy puts the commands back in row order.
+    The output is the same as BoundCommand.generate row by row
+    """
+    BASE_CHUNK_SIZE = 100000
+
+    def __init__(self, commands, row_fuser, chunk_size=BASE_CHUNK_SIZE):
+        """
+        Params
+        ------
+        commands : dict
+            The command id and OneCommand pairs
+        row_fuser : cmd_deployer.RowFuser
+            Resolves the command cells, its errors and cache are kept
+        chunk_size : int
+            The rows to fill at once, bounds the memory of a large table
+        Raises
+        ------
+        MissingDependencyError
+            When numpy is not installed
+        """
+        try:
+            import numpy
+        except ImportError:
+            raise cmd_fuse_exception.MissingDependencyError('numpy', 'the columnar backend')
+        self._numpy = numpy
+        self._commands = commands
+        self._row_fuser = row_fuser
+        self._chunk_size = chunk_size
+
+    def iter_table_commands(self, table, index):
+        """
+        Same as RowFuser.iter_table_commands
+
+        Yields
+        ------
+        (command_id, command) : tuple
+            In the order of the rows
+        Returns
+        -------
+        index : int
+            The row number after the last row of the table
+        """
+        rows = iter(table)
+        while True:
+            chunk = list(itertools.islice(rows, self._chunk_size))
+            if not chunk:
+                return index
+            yield from self._fuse_chunk(data_parser.DataTable(table.header, chunk), index)
+            index = index + len(chunk)
+
+    def _fuse_chunk(self, table, index):
+        numpy = self._numpy
+        command_column_idx = table.columns.get(self._row_fuser.command_column)
+        if command_column_idx is None:
+            return
+        rows = table.rows
+        # the rows of a cell in the order of the first occurrences
+        cell_rows = {}
+        for row_idx, cell in enumerate(map(operator.itemgetter(command_column_idx), rows)):
+            if cell:
+                group_rows = cell_rows.get(cell)
+                if group_rows is None:
+                    group_rows = cell_rows[cell] = []
+                group_rows.append(row_idx)
+        if not cell_rows:
+            return
+
+        self._row_fuser.command_cache.use_header(table.header)
+        command_counts = numpy.zeros(len(rows), dtype=numpy.int64)
+        cell_groups = []
+        for cell, group_rows in cell_rows.items():
+            # resolved in the order of the rows so the first bad row raises
+            resolved = self._row_fuser.resolve_cell(cell, table.columns, index + group_rows[0])
+            group_rows = numpy.array(group_rows, dtype=numpy.int64)
+            command_counts[group_rows] = len(resolved)
+            cell_groups.append((group_rows, resolved))
+        total = int(command_counts.sum())
+        if not total:
+            return
+        offsets = numpy.cumsum(command_counts) - command_counts
+
+        command_ids = numpy.empty(total, dtype=object)
+        generated = numpy.empty(total, dtype=object)
+        for group_rows, resolved in cell_groups:
+            group_table_rows = rows
+            if len(group_rows) != len(rows):
+                group_table_rows = [rows[row_idx] for row_idx in group_rows.tolist()]
+            positions = offsets[group_rows]
+            for command_offset, (command_id, bound_command) in enumerate(resolved):
+                command_positions = positions + command_offset
+                command_ids[command_positions] = command_id
+                generated[command_positions] = bound_command.generate_rows(group_table_rows)
+
+        yield from zip(command_ids.tolist(), generated.tolist())
@@ -0,0 +1,156 @@
+class CommandBucket:
+    """
+    Holds the generated commands of one command id,
+    the commands can be spilled into a temporary file
+    """
+    _NEW_LINE = '\n'
+    _ESCAPED_NEW_LINE = '\\n'
+    _BACKSLASH = '\\'
+    _ESCAPED_BACKSLASH = '\\\\'
+
+    def __init__(self):
+        self._commands = []
+        self._size = 0
+        self._spill_file = None
+
+    @property
+    def size(self):
+        """
+        Returns
+        -------
+        size : int
+            The number of characters held in memory
+        """
+        return self._size
+
+    def append(self, command):
+        self._commands.append(command)
+        self._size = self._size + len(command)
+
+    def spill(self):
+        """
+        Moves the commands held in memory to the end of the temporary file
+        """
+        if not self._commands:
+            return
+        if not self._spill_file:
+            import tempfile
+            # only '\n' ends a line, a '\r' of a command is kept as it is
+            self._spill_file = tempfile.TemporaryFile('w+', encoding='utf-8', newline='\n')
+        lines = []
+        for command in self._commands:
+            lines.append(CommandBucket._escape(command))
+            lines.append(CommandBucket._NEW_LINE)
+        self._spill_file.write(''.join(lines))
+        self._commands = []
+        self._size = 0
+
+    def __iter__(self):
+        if self._spill_file:
+            self._spill_file.flush()
+            self._spill_file.seek(0)
+            for line in self._spill_file:
+                yield CommandBucket._unescape(line[:-1])
+        yield from self._commands
+
+    def close(self):
+        if self._spill_file:
+            self._spill_file.close()
+            self._spill_file = None
+        self._commands = []
+        self._size = 0
+
+    @staticmethod
+    def _escape(command):
+        command = command.replace(CommandBucket._BACKSLASH, CommandBucket._ESCAPED_BACKSLASH)
+        return command.replace(CommandBucket._NEW_LINE, CommandBucket._ESCAPED_NEW_LINE)
+
+    @staticmethod
+    def _unescape(line):
+        if CommandBucket._BACKSLASH not in line:
+            return line
+        parts = line.split(CommandBucket._ESCAPED_BACKSLASH)
+        for idx, part in enumerate(parts):
+            parts[idx] = part.replace(CommandBucket._ESCAPED_NEW_LINE, CommandBucket._NEW_LINE)
+        return CommandBucket._BACKSLASH.join(parts)
+
+class CommandBuckets:
+    """
+    Collects the generated commands per command id for the group fuse.
+    The buckets are emitted in the provided group order first, then
+    in the order their command id showed up in the data
+    """
+    def __init__(self, group_order=None, memory_budget=None):
+        """
+        Params
+        ------
+        group_order : []
+            Command ids to emit first, one element is str
+        memory_budget : int
+            The number of characters to hold in memory before
+            the buckets are spilled to temporary files, None is unlimited
+        """
+        self._buckets = {}
+        self._group_order = []
+        if group_order:
+            self._group_order = list(group_order)
+        self._memory_budget = memory_budget
+        self._size = 0
+
+    def add(self, cmd_id, command):
+        """
+        Appends the command to the end of the command id's bucket
+        """
+        bucket = self._buckets.get(cmd_id)
+        if bucket is None:
+            bucket = CommandBucket()
+            self._buckets[cmd_id] = bucket
+        bucket.append(command)
+        self._size = self._size + len(command)
+        if self._memory_budget is not None and self._size > self._memory_budget:
+            self.spill()
+
+    def spill(self):
+        """
+        Moves every command held in memory to the temporary files
+        """
+        for bucket in self._buckets.values():
+            bucket.spill()
+        self._size = 0
+
+    def ordered_ids(self):
+        """
+        Returns
+        -------
+        cmd_ids : []
+            The command ids in the order their buckets are emitted
+        """
+        cmd_ids = [cmd_id for cmd_id in self._group_order if cmd_id in self._buckets]
+        ordered = set(cmd_ids)
+        for cmd_id in self._buckets:
+            if cmd_id not in ordered:
+                cmd_ids.append(cmd_id)
+        return cmd_ids
+
+    def iter_groups(self):
+        """
+        Yields
+        ------
+        (cmd_id, bucket) : tuple
+            The bucket is an iterable of the generated commands
+        """
+        for cmd_id in self.ordered_ids():
+            yield cmd_id, self._buckets[cmd_id]
+
+    def __iter__(self):
+        for _, bucket in self.iter_groups():
+            yield from bucket
+
+    def close(self):
+        """
+        Removes the temporary files
+        """
+        for bucket in self._buckets.values():
+            bucket.close()
+        self._buckets = {}
+        self._size = 0
@@ -0,0 +1,170 @@
+import math
+import os
+
+class DedupeScope:
+    output = 'output'
+    group = 'group'
+
+class BloomFilter:
+    """
+    Remembers digests in a bit array, a digest which was not added is
+    reported as present with about the error rate, an added one always
+    """
+    BASE_ERROR_RATE = 0.01
+
+    def __init__(self, items, error_rate=BASE_ERROR_RATE):
+        """
+        Params
+        ------
+        items : int
+            The expected number of added digests
+        error_rate : float
+            The rate of the false positives at the expected items
+        """
+        items = max(1, items)
+        self._size = max(8, int(-items * math.log(error_rate) / math.log(2) ** 2))
+        self._hash_count = max(1, round(self._size / items * math.log(2)))
+        self._bits = bytearray((self._size + 7) // 8)
+
+    def _positions(self, digest):
+        # double hashing of the two halves of the digest
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:16], 'little') | 1
+        return [(first + hash_idx * second) % self._size
+            for hash_idx in range(self._hash_count)]
+
+    def add(self, digest):
+        bits = self._bits
+        for position in self._positions(digest):
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, digest):
+        bits = self._bits
+        for position in self._positions(digest):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+class CommandDeduper:
+    """
+    Drops the repeated commands, the first occurrence is kept. The
+    commands are remembered by a 128 bit digest in a set. With a memory
+    budget the set is moved into an sqlite database in a temporary file
+    when it is full, a Bloom filter in front of it answers most lookups
+    of the new commands without the disk
+    """
+    # the bytes of one digest in the set, measured on CPython
+    _ENTRY_BYTES = 100
+    _DIGEST_SIZE = 16
+    _GROUP_SEP = '\0'
+    _ENCODING = 'utf-8'
+
+    def __init__(self, scope=DedupeScope.output, memory_budget=None,
+        bloom_items=None, spill_dir=None):
+        """
+        Params
+        ------
+        scope : str
+            A DedupeScope value, group drops the repeats of a command
+            within its command id, or within its shard key when sharded
+        memory_budget : int
+            The bytes of the digests to hold in memory before moving
+            them to the disk, None is unlimited
+        bloom_items : int
+            The expected number of distinct commands, puts a Bloom
+            filter of this size in front of the disk, None skips it
+        spill_dir : str
+            The directory of the temporary database, None uses the
+            default temporary directory
+        """
+        # imported here, the hashing is only needed with dedupe
+        import hashlib
+        self._blake2b = hashlib.blake2b
+        self._scope = scope
+        self._max_entries = None
+        if memory_budget is not None:
+            self._max_entries = max(1, memory_budget // CommandDeduper._ENTRY_BYTES)
+        self._bloom_items = bloom_items
+        self._spill_dir = spill_dir
+        self._seen = set()
+        self._bloom = None
+        self._spill_path = None
+        self._spill = None
+        self.removed = 0
+
+    @property
+    def scope(self):
+        return self._scope
+
+    def reset(self):
+        """
+        Forgets the commands seen so far, called at the start of a fuse
+        """
+        self.close()
+        self.removed = 0
+        if self._bloom_items:
+            self._bloom = BloomFilter(self._bloom_items)
+
+    def is_new(self, command, group=None):
+        """
+        Params
+        ------
+        command : str
+            A generated command
+        group : object
+            The command id or the shard key, used with the group scope
+        Returns
+        -------
+        is_new : bool
+            False when the command was seen before, it is counted as removed
+        """
+        text = command
+        if self._scope == DedupeScope.group and group is not None:
+            text = str(group) + CommandDeduper._GROUP_SEP + command
+        digest = self._blake2b(text.encode(CommandDeduper._ENCODING),
+            digest_size=CommandDeduper._DIGEST_SIZE).digest()
+        if digest in self._seen:
+            self.removed = self.removed + 1
+            return False
+        if self._spill is not None and (self._bloom is None or digest in self._bloom):
+            if self._spill.execute('SELECT 1 FROM seen WHERE digest = ?', (digest,)).fetchone():
+                self.removed = self.removed + 1
+                return False
+        self._seen.add(digest)
+        if self._bloom is not None:
+            self._bloom.add(digest)
+        if self._max_entries and len(self._seen) >= self._max_entries:
+            self._spill_seen()
+        return True
+
+    def _spill_seen(self):
+        """
+        Moves the digests held in memory to the database
+        """
+        if self._spill is None:
+            # imported here, only a memory budget needs them
+            import sqlite3
+            import tempfile
+            spill_fd, self._spill_path = tempfile.mkstemp(suffix='.dedupe', dir=self._spill_dir)
+            os.close(spill_fd)
+            self._spill = sqlite3.connect(self._spill_path)
+            self._spill.execute('PRAGMA journal_mode = OFF')
+            self._spill.execute('PRAGMA synchronous = OFF')
+            self._spill.execute('CREATE TABLE seen (digest BLOB PRIMARY KEY) WITHOUT ROWID')
+        self._spill.executemany('INSERT OR IGNORE INTO seen VALUES (?)',
+            ((digest,) for digest in self._seen))
+        self._spill.commit()
+        self._seen = set()
+
+    def close(self):
+        """
+        Removes the temporary database
+        """
+        self._seen = set()
+        self._bloom = None
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+        if self._spill_path:
+            os.remove(self._spill_path)
+            self._spill_path = None
@@ -0,0 +1,159 @@
+from collections import namedtuple
+import asyncio
+import json
+import os
+import signal
+import time
+
+CommandResult = namedtuple('CommandResult', ['index', 'command_id', 'command',
+    'exit_code', 'duration', 'attempts', 'timed_out', 'stdout', 'stderr'])
+ExecutionSummary = namedtuple('ExecutionSummary', ['commands', 'failed', 'groups', 'seconds'])
+
+class CommandExecutor:
+    """
+    Runs the generated commands as shell subprocesses, a few at the same
+    time. The commands of one group run concurrently, the next group
+    starts only when every command of the previous one finished, so the
+    buckets of the group fuse are ordering barriers
+    """
+    BASE_CONCURRENCY = 4
+    BASE_RETRY_BACKOFF = 1.0
+    _ENCODING = 'utf-8'
+
+    def __init__(self, concurrency=BASE_CONCURRENCY, timeout=None, retries=0,
+        retry_backoff=BASE_RETRY_BACKOFF, log_path=None, stop_on_error=False):
+        """
+        Params
+        ------
+        concurrency : int
+            The number of commands to run at the same time
+        timeout : float
+            Seconds before a command is killed, None waits forever
+        retries : int
+            The times a failed or timed out command is run again
+        retry_backoff : float
+            Seconds before the first retry, doubled for every next one
+        log_path : str
+            Appends a JSON line of every CommandResult to the file
+        stop_on_error : bool
+            Does not start the next group when a command failed
+        """
+        self._concurrency = max(1, concurrency)
+        self._timeout = timeout
+        self._retries = retries
+        self._retry_backoff = retry_backoff
+        self._log_path = log_path
+        self._stop_on_error = stop_on_error
+
+    def execute(self, command_groups, on_result=None):
+        """
+        Params
+        ------
+        command_groups : iterable
+            One element is a (command_id, commands) tuple, e.g. of
+            CommandFuse.iter_command_groups, the commands are read lazily
+        on_result : callable
+            Called with every CommandResult as the commands finish
+        Returns
+        -------
+        ExecutionSummary
+        """
+        return asyncio.run(self._execute(command_groups, on_result))
+
+    async def _execute(self, command_groups, on_result):
+        started = time.perf_counter()
+        log_file = None
+        if self._log_path:
+            log_file = open(self._log_path, 'a', encoding=CommandExecutor._ENCODING)
+        command_count = 0
+        failed = 0
+        group_count = 0
+        try:
+            for command_id, commands in command_groups:
+                group_count = group_count + 1
+                pending = set()
+                for command in commands:
+                    if len(pending) >= self._concurrency:
+                        done, pending = await asyncio.wait(pending,
+                            return_when=asyncio.FIRST_COMPLETED)
+                        failed = failed + self._report(done, log_file, on_result)
+                    pending.add(asyncio.ensure_future(
+                        self._run_with_retries(command_count, command_id, command)))
+                    command_count = command_count + 1
+                if pending:
+                    done, _ = await asyncio.wait(pending)
+                    failed = failed + self._report(done, log_file, on_result)
+                if failed and self._stop_on_error:
+                    break
+        finally:
+            if log_file:
+                log_file.close()
+        return ExecutionSummary(command_count, failed, group_count,
+            time.perf_counter() - started)
+
+    def _report(self, tasks, log_file, on_result):
+        """
+        Params
+        ------
+        tasks : set
+            The finished tasks, reported in the order of the commands
+        Returns
+        -------
+        failed : int
+            The number of failed results
+        """
+        failed = 0
+        results = sorted((task.result() for task in tasks), key=lambda result: result.index)
+        for result in results:
+            if result.exit_code != 0:
+                failed = failed + 1
+            if log_file:
+                log_file.write(json.dumps(result._asdict()) + '\n')
+            if on_result:
+                on_result(result)
+        if log_file and results:
+            log_file.flush()
+        return failed
+
+    async def _run_with_retries(self, index, command_id, command):
+        attempt = 1
+        while True:
+            result = await self._run(index, command_id, command, attempt)
+            if result.exit_code == 0 or attempt > self._retries:
+                return result
+            await asyncio.sleep(self._retry_backoff * 2 ** (attempt - 1))
+            attempt = attempt + 1
+
+    async def _run(self, index, command_id, command, attempt):
+        """
+        Returns
+        -------
+        CommandResult
+            The exit code is negative when a signal stopped the command
+        """
+        started = time.perf_counter()
+        # a session of its own so a timeout kills the children of the shell too
+        process = await asyncio.create_subprocess_shell(command,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+            start_new_session=True)
+        timed_out = False
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), self._timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+            CommandExecutor._kill(process)
+            stdout, stderr = await process.communicate()
+        return CommandResult(index, command_id, command, process.returncode,
+            round(time.perf_counter() - started, 6), attempt, timed_out,
+            stdout.decode(CommandExecutor._ENCODING, 'replace'),
+            stderr.decode(CommandExecutor._ENCODING, 'replace'))
+
+    @staticmethod
+    def _kill(process):
+        if hasattr(os, 'killpg'):
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+                return
+            except ProcessLookupError:
+                return
+        process.kill()
@@ -1,16 +1,23 @@
 from collections import OrderedDict
+import itertools
 import json
+import operator
 import re
 import os
+import string
 
 import modules.data_parser        as data_parser
 import modules.cmd_fuse_exception as cmd_fuse_exception
+import modules.fuse_stats         as fuse_stats
+import modules.package_format     as package_format
 
 class OneCommand:
     """
     Represents a single command which can be generated
     """
-    def __init__(self, cmd_id, cmd_str, required_cols):
+    _SLOT_FIELD = '{{{}}}'
+
+    def __init__(self, cmd_id, cmd_str, required_cols, template=None):
         """
         Params
         ------
@@ -20,10 +27,18 @@ class OneCommand:
             The raw string command
         required_cols : []
             The required columns to substitute for generating
+        template : str
+            Already built format template, e.g. from a binary package,
+            the segments and slots are split from it when asked for
         """
         self._cmd_id = cmd_id
         self._cmd_str = cmd_str
         self._requried_columns = required_cols
+        self._segments = None
+        self._slots = None
+        self._template = template
+        if template is None:
+            self._compile()
 
     def __repr__(self):
         sep = ', '
@@ -44,6 +59,40 @@ class OneCommand:
     def command_str(self):
         return self._cmd_str
 
+    @property
+    def segments(self):
+        """
+        Returns
+        -------
+        segments : []
+            The literal parts of the command, always one more than the slots
+        """
+        if self._segments is None:
+            self._parse_template()
+        return self._segments
+
+    @property
+    def slots(self):
+        """
+        Returns
+        -------
+        slots : []
+            Index into required_columns for every gap between the segments
+        """
+        if self._slots is None:
+            self._parse_template()
+        return self._slots
+
+    @property
+    def template(self):
+        """
+        Returns
+        -------
+        template : str
+            The str.format template, the slots are positional fields
+        """
+        return self._template
+
     def generate(self, data:dict):
         """
         Returns
@@ -52,14 +101,84 @@ class OneCommand:
             the generated command or the missing column(s)
         """
         if self._is_data_avialable(data):
-            generated_cmd = self._cmd_str
-            for col in self._requried_columns:
-                generated_cmd = re.sub(col, data[col], generated_cmd)
-            return generated_cmd.strip()
+            values = [data[col] for col in self._requried_columns]
+            return self._template.format(*values).strip()
         else:
             missing_cols = self._get_missing_columns(data)
             raise cmd_fuse_exception.CannotGenerateCommandError(self._cmd_id, missing_cols)
 
+    def bind(self, columns):
+        """
+        Resolves the required columns to the indices of a table's rows
+
+        Params
+        ------
+        columns : dict
+            The column name and index pairs of the table
+        Returns
+        -------
+        BoundCommand
+            Generates the command from a tuple row
+        Raises
+        ------
+        CannotGenerateCommandError
+            When a required column is not in the table
+        """
+        if not self._is_data_avialable(columns):
+            missing_cols = self._get_missing_columns(columns)
+            raise cmd_fuse_exception.CannotGenerateCommandError(self._cmd_id, missing_cols)
+        indices = [columns[col] for col in self._requried_columns]
+        return BoundCommand(self._cmd_id, self._template, indices)
+
+    def _compile(self):
+        """
+        Splits the command once into literal segments and column slots,
+        every occurrence of a required column is a slot. The values are
+        later filled in a single pass and never interpreted as a pattern
+        """
+        columns = [col for col in self._requried_columns if col]
+        self._segments = []
+        self._slots = []
+        if not columns:
+            self._segments.append(self._cmd_str)
+        else:
+            # longest first so 'HOSTNAME' wins over 'NAME' at the same position
+            unique_cols = sorted(set(columns), key=len, reverse=True)
+            pattern = re.compile('|'.join(map(re.escape, unique_cols)))
+            last_end = 0
+            for match in pattern.finditer(self._cmd_str):
+                self._segments.append(self._cmd_str[last_end:match.start()])
+                self._slots.append(self._requried_columns.index(match.group()))
+                last_end = match.end()
+            self._segments.append(self._cmd_str[last_end:])
+        self._build_template()
+
+    def _build_template(self):
+        template_parts = []
+        for idx, slot in enumerate(self._slots):
+            template_parts.append(OneCommand._escape_literal(self._segments[idx]))
+            template_parts.append(OneCommand._SLOT_FIELD.format(slot))
+        template_parts.append(OneCommand._escape_literal(self._segments[-1]))
+        self._template = ''.join(template_parts)
+
+    def _parse_template(self):
+        segments = []
+        slots = []
+        literal_parts = []
+        for literal, field_name, _, _ in string.Formatter().parse(self._template):
+            literal_parts.append(literal)
+            if field_name is not None:
+                segments.append(''.join(literal_parts))
+                slots.append(int(field_name))
+                literal_parts = []
+        segments.append(''.join(literal_parts))
+        self._segments = segments
+        self._slots = slots
+
+    @staticmethod
+    def _escape_literal(literal):
+        return literal.replace('{', '{{').replace('}', '}}')
+
     def _is_data_avialable(self, data):
         is_avialable = True
         for col in self._requried_columns:
@@ -75,6 +194,73 @@ class OneCommand:
                 missing_cols.append(key)
         return missing_cols
 
+class BoundCommand:
+    """
+    A OneCommand resolved to the column indices of one table,
+    the values are looked up by position
+    """
+    __slots__ = ('_cmd_id', '_template', '_getter', '_constant')
+
+    def __init__(self, cmd_id, template, indices):
+        """
+        Params
+        ------
+        cmd_id : str
+            The command name
+        template : str
+            The format template of the OneCommand
+        indices : []
+            The row index of every required column
+        """
+        self._cmd_id = cmd_id
+        self._template = template
+        self._getter = None
+        self._constant = None
+        if not indices:
+            self._constant = template.format().strip()
+        elif len(indices) == 1:
+            # itemgetter returns a tuple only for more than one index
+            self._getter = operator.itemgetter(indices[0], indices[0])
+        else:
+            self._getter = operator.itemgetter(*indices)
+
+    @property
+    def cmd_id(self):
+        return self._cmd_id
+
+    def generate(self, row):
+        """
+        Params
+        ------
+        row : tuple
+            The row of the table the command was bound to
+        Returns
+        -------
+        str
+            The generated command
+        """
+        if self._getter is None:
+            return self._constant
+        return self._template.format(*self._getter(row)).strip()
+
+    def generate_rows(self, rows):
+        """
+        Generates the command of many rows in one pass over the
+        rows, the formatting loop runs in C
+
+        Params
+        ------
+        rows : []
+            One element is a tuple of the table the command was bound to
+        Returns
+        -------
+        commands : []
+            One element is str, the same as generate(row)
+        """
+        if self._getter is None:
+            return [self._constant] * len(rows)
+        return list(map(str.strip, itertools.starmap(self._template.format, map(self._getter, rows))))
+
 class CommandPackage(data_parser.DataParser):
     """
     Creates a command package from the given text file
@@ -82,6 +268,9 @@ class CommandPackage(data_parser.DataParser):
     cmd_id : command [to_substitute]
     """
     BASE_SEPARATOR = ':'
+    BINARY_FORMAT = 'binary'
+    JSON_FORMAT = 'json'
+    BASE_PACKAGE_FORMAT = BINARY_FORMAT
     COL_SUB_LEFT = '['
     COL_SUB_RIGHT = ']'
     TO_REPLACE = ''
@@ -92,7 +281,7 @@ class CommandPackage(data_parser.DataParser):
 
     def __init__(self, path=None, package_name=_BASE_PACKAGE_NAME, separator=BASE_SEPARATOR,
        col_sub_left=COL_SUB_LEFT, col_sub_right=COL_SUB_RIGHT,
-       to_replace=TO_REPLACE):
+       to_replace=TO_REPLACE, stats=None):
         """
         Params
         ------
@@ -108,18 +297,66 @@ class CommandPackage(data_parser.DataParser):
             The right id of the column which to replace later
         to_replace : str
             The col_sub-s to replace in the command
+        stats : fuse_stats.FuseStats
+            Collects the parse and load time, None skips it
         """
         self._separator = separator
         self._package_name = package_name
         self._col_sub_left = col_sub_left
         self._col_sub_right = col_sub_right
         self._to_replace = to_replace
+        self._source_hash = None
+        self._stats = stats
         return super().__init__(path)
 
     @property
     def package_name(self):
         return self._package_name
 
+    @property
+    def source_hash(self):
+        """
+        Returns
+        -------
+        source_hash : str
+            Hex digest of the commands file or the loaded package's source
+        """
+        return self._source_hash
+
+    @property
+    def commands(self):
+        """
+        Returns
+        -------
+        commands : dict
+            The command id and OneCommand pairs
+        """
+        commands = {}
+        for command in self.data:
+            commands[command.cmd_id] = command
+        return commands
+
+    def hash_source_file(self, path):
+        """
+        Hashes the commands file together with the parser options,
+        the package compiled from it stores the same hash
+
+        Params
+        ------
+        path : str
+            The commands file
+        Returns
+        -------
+        source_hash : str
+        """
+        with open(path) as cmd_file:
+            return self._hash_source(cmd_file.read())
+
+    def _hash_source(self, content):
+        options = (self._separator, self._col_sub_left,
+            self._col_sub_right, self._to_replace)
+        return package_format.source_hash(content.encode(), options)
+
     def deploy(self):
         """
         Creates the package
@@ -137,20 +374,44 @@ class CommandPackage(data_parser.DataParser):
             json_ready_dict[key] = current_command.copy()
         return json_ready_dict
 
-    def deploy_package(self, path):
+    def deploy_package(self, path, file_format=BASE_PACKAGE_FORMAT):
         """
         Writes the package into the path
         Params
         ------
         path : str
             The file to write
+        file_format : str
+            BINARY_FORMAT for the precompiled package which loads fast,
+            JSON_FORMAT for export and inspection
         """
-        json_ready_commands = self.deploy()
         if os.path.isdir(path):
             path = path + os.sep + self._package_name
+        if file_format == CommandPackage.BINARY_FORMAT:
+            package_format.dump(self.data, path, self._source_hash)
+        else:
+            self.export_json(path)
+
+    def export_json(self, path):
+        """
+        Writes the package as an indented JSON
+        Params
+        ------
+        path : str
+            The file to write
+        """
         with open(path, 'w') as package_file:
-            package_file.write(json.dumps(json_ready_commands, 
-                    indent=CommandPackage._JSON_INDENT))
+            package_file.write(self.to_json())
+
+    def to_json(self):
+        """
+        Returns
+        -------
+        str
+            The package as an indented JSON
+        """
+        json_ready_commands = self.deploy()
+        return json.dumps(json_ready_commands, indent=CommandPackage._JSON_INDENT)
 
     def load_package(self, path):
         """
@@ -161,13 +422,31 @@ class CommandPackage(data_parser.DataParser):
             To load the package file
         Returns
         -------
-        commands : []
-            One element is a OneCommand
+        commands : dict
+            The command id and OneCommand pairs
+        """
+        if self._stats:
+            with self._stats.timer(fuse_stats.FuseStats.PACKAGE_LOAD):
+                commands = self._load_package(path)
+            self._stats.add(fuse_stats.FuseStats.PACKAGE_LOAD, 'commands', len(commands))
+        else:
+            commands = self._load_package(path)
+        self._data = list(commands.values())
+        return commands
+
+    def _load_package(self, path):
+        if package_format.is_binary_package(path):
+            return self._load_binary_package(path)
+        return self._load_json_package(path)
+
+    def _load_json_package(self, path):
+        """
+        Loads the package exported as JSON
         """
         commands = {}
+        self._source_hash = None
         with open(path) as package_file:
-            lines_str = ''.join(package_file.readlines())
-            json_commands = json.loads(lines_str)
+            json_commands = json.load(package_file)
             for cmd_id in json_commands:
                 command_prop = json_commands[cmd_id]
                 one_command = OneCommand(cmd_id, 
@@ -176,6 +455,17 @@ class CommandPackage(data_parser.DataParser):
                 commands[cmd_id] = one_command
         return commands
 
+    def _load_binary_package(self, path):
+        """
+        Loads the precompiled package, the templates are not compiled again
+        """
+        commands = {}
+        self._source_hash, records = package_format.load(path)
+        for record in records:
+            commands[record.cmd_id] = OneCommand(record.cmd_id,
+                record.command_str, record.required_columns, record.template)
+        return commands
+
     def _get_data(self, path):
         """
         Returns
@@ -183,9 +473,19 @@ class CommandPackage(data_parser.DataParser):
         commands : []
             Where one element is an OneCommand
         """
+        if self._stats:
+            with self._stats.timer(fuse_stats.FuseStats.PACKAGE_PARSE):
+                cmds = self._parse_commands_file(path)
+            self._stats.add(fuse_stats.FuseStats.PACKAGE_PARSE, 'commands', len(cmds))
+            return cmds
+        return self._parse_commands_file(path)
+
+    def _parse_commands_file(self, path):
         rows = None
         with open(path) as cmd_file:
-            rows = cmd_file.read().splitlines()
+            content = cmd_file.read()
+            self._source_hash = self._hash_source(content)
+            rows = content.splitlines()
         cmds = []
         index = 0
         for one_row in rows:
@@ -1,12 +1,13 @@
 import csv
+import operator
 import re
-import sys
 import os
-from collections import OrderedDict
 
-import xlrd
-# https://blogs.harvard.edu/rprasad/2014/06/16/reading-excel-with-python-xlrd/
-import modules.cmd_fuse_exception as cmd_fuse_exception
+import modules.arrow_reader       as arrow_reader
+import modules.excel_reader       as excel_reader
+import modules.fuse_stats         as fuse_stats
+import modules.ndjson_reader      as ndjson_reader
+import modules.table_reader       as table_reader
 
 class DataParser:
 
@@ -18,7 +19,7 @@ class DataParser:
             The filepath of the data
         """
         self._data = []
-        if path and os.path.isfile(path):
+        if path and self._exists(path):
            data = self._get_data(path)
            self._data = data
 
@@ -35,77 +36,349 @@ class DataParser:
     def _get_data(self, path):
         pass
 
+    def _exists(self, path):
+        return os.path.isfile(path)
+
+class DataTable:
+    """
+    Rows which share one header, a row is a tuple in the header's order.
+    The header to index map is built once for the whole table
+    """
+    def __init__(self, header, rows=None):
+        """
+        Params
+        ------
+        header : []
+            The column names, one element is str
+        rows : iterable
+            One element is a tuple, a generator keeps the table lazy
+        """
+        self._header = tuple(header)
+        self._columns = {}
+        for idx, col in enumerate(self._header):
+            # the last one wins like in a dict row
+            self._columns[col] = idx
+        self._rows = rows
+        if self._rows is None:
+            self._rows = []
+
+    @property
+    def header(self):
+        return self._header
+
+    @property
+    def columns(self):
+        """
+        Returns
+        -------
+        columns : dict
+            The column name and index pairs
+        """
+        return self._columns
+
+    @property
+    def rows(self):
+        return self._rows
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def __len__(self):
+        return len(self._rows)
+
+    @staticmethod
+    def from_dicts(rows):
+        """
+        Builds the tables of dict rows, the consecutive rows with
+        the same keys share a table
+
+        Params
+        ------
+        rows : iterable
+            One element is a dict
+        Yields
+        ------
+        table : DataTable
+        """
+        header = None
+        table_rows = []
+        for row in rows:
+            row_header = tuple(row.keys())
+            if row_header != header:
+                if header is not None:
+                    yield DataTable(header, table_rows)
+                header = row_header
+                table_rows = []
+            table_rows.append(tuple(row.values()))
+        if header is not None:
+            yield DataTable(header, table_rows)
+
+def as_tables(data):
+    """
+    Params
+    ------
+    data : DataTable or iterable
+        A table or an iterable of tables or dict rows
+    Yields
+    ------
+    table : DataTable
+    """
+    if isinstance(data, DataTable):
+        yield data
+        return
+    dict_rows = []
+    for element in data:
+        if isinstance(element, DataTable):
+            if dict_rows:
+                yield from DataTable.from_dicts(dict_rows)
+                dict_rows = []
+            yield element
+        else:
+            dict_rows.append(element)
+    if dict_rows:
+        yield from DataTable.from_dicts(dict_rows)
+
+def column_indices(header, columns):
+    """
+    Params
+    ------
+    header : []
+        The column names of a table
+    columns : iterable
+        The column names to keep, None keeps every column
+    Returns
+    -------
+    indices : []
+        The indices of the kept columns in the header's order, a repeated
+        name keeps only its last column like DataTable.columns,
+        None when every column is kept
+    """
+    if columns is None:
+        return None
+    kept = set(columns)
+    last_indices = {}
+    for idx, col in enumerate(header):
+        if col in kept:
+            last_indices[col] = idx
+    return sorted(last_indices.values())
+
+def row_projection(indices):
+    """
+    Returns
+    -------
+    projection : callable
+        Takes a row and returns the tuple of the values at the indices
+    """
+    if not indices:
+        return lambda row: ()
+    if len(indices) == 1:
+        idx = indices[0]
+        return lambda row: (row[idx],)
+    return operator.itemgetter(*indices)
+
+_EMPTY_CELL = ''
+
+def iter_csv_rows(reader, width, indices=None):
+    """
+    Params
+    ------
+    reader : csv.reader
+        Positioned after the header
+    width : int
+        The number of columns of the header
+    indices : []
+        The indices of the columns to keep, None keeps every column
+    Yields
+    ------
+    row : tuple
+        Padded with empty cells to the header's width, a missing
+        cell is '' like an empty cell of the Excel readers
+    """
+    if indices is None:
+        for row in reader:
+            if not row:
+                continue
+            if len(row) < width:
+                row = row + [_EMPTY_CELL] * (width - len(row))
+            yield tuple(row)
+        return
+    project = row_projection(indices)
+    for row in reader:
+        if not row:
+            continue
+        if len(row) < width:
+            row = row + [_EMPTY_CELL] * (width - len(row))
+        yield project(row)
+
+class CsvReader(table_reader.TableReader):
+    """
+    Reads a csv file as one table, with read_jobs in byte ranges
+    of a memory map, see chunked_csv.ChunkedCsvFile
+    """
+    _DIALECT = 'excel'
+
+    def iter_sheets(self):
+        if self._read_jobs:
+            # imported here, the byte ranges are only read on request
+            import modules.chunked_csv as chunked_csv
+            chunked_file = chunked_csv.ChunkedCsvFile(self._path, self._DIALECT,
+                self._columns, self._read_jobs)
+            if chunked_file.header is not None:
+                yield None, chunked_file.header, chunked_file
+            return
+        with open(self._path, newline='') as file:
+            reader = csv.reader(file, dialect=self._DIALECT)
+            header = next(reader, None)
+            if header is not None:
+                indices = self._column_indices(header)
+                rows = iter_csv_rows(reader, len(header), indices)
+                if indices is not None:
+                    header = [header[idx] for idx in indices]
+                yield None, header, rows
+
+class TsvReader(CsvReader):
+    """
+    Reads a tab separated file as one table
+    """
+    _DIALECT = 'excel-tab'
+
+# the path patterns and the reader types, the first match reads the file
+_READERS = []
+
+def register_reader(pattern, reader_type):
+    """
+    Params
+    ------
+    pattern : str
+        A regular expression searched in the path, e.g. r'\.csv'
+    reader_type : type
+        A table_reader.TableReader, the readers registered later are
+        tried first so a new reader can replace a built-in one
+    """
+    _READERS.insert(0, (re.compile(pattern), reader_type))
+
+def find_reader(path):
+    """
+    Returns
+    -------
+    reader_type : type
+        The reader of the path, None when no reader is registered for it
+    """
+    for pattern, reader_type in _READERS:
+        if pattern.search(path):
+            return reader_type
+    return None
+
+register_reader(r'\.csv', CsvReader)
+register_reader(r'\.tsv', TsvReader)
+register_reader(r'\.xls', excel_reader.XlsReader)
+register_reader(r'\.xls[xm]', excel_reader.XlsxReader)
+register_reader(r'\.(arrows?|feather|ipc)$', arrow_reader.ArrowReader)
+register_reader(r'\.parquet$', arrow_reader.ParquetReader)
+register_reader(r'\.(ndjson|jsonl)$', ndjson_reader.NdjsonReader)
+register_reader(r'^-$', ndjson_reader.NdjsonReader)
+
 class RawDataParser(DataParser):
     """
     Reads the selected file which holds the data for the commands 
     """
-    _XLS_PATTERN = '\.xls'
-    _TSV_PATTERN = '\.tsv'
-    _CSV_PATTERN = '\.csv'
+    STDIN_PATH = ndjson_reader.NdjsonReader.STDIN_PATH
 
-    def __init__(self, path):
+    def __init__(self, path, lazy=False, sheets=None, stats=None, columns=None,
+        read_jobs=None):
         """
         Params
         ------
         path : str
-            The file's path
+            The file's path, '-' reads NDJSON from the standard input
+        lazy : bool
+            Do not load the rows, iterate the parser to read them one by one
+        sheets : []
+            The sheet names to read from a workbook, None reads every sheet
+        stats : fuse_stats.FuseStats
+            Collects the read time and the rows, None skips it
+        columns : iterable
+            The column names to read, the other columns are dropped while
+            the rows are read, None reads every column
+        read_jobs : int
+            Reads a csv/tsv file in byte ranges of a memory map on this
+            many processes, see chunked_csv.ChunkedCsvFile, None reads
+            it with one file object
         Raises
         ------
         TypeError
-            When the file extension is not supported
+            When no reader is registered for the file, see register_reader
         """
-        self._dialect = None
-        self._is_file_excel = False
+        self._sheets = sheets
+        self._stats = stats
+        self._columns = columns
+        self._read_jobs = read_jobs
+        self._path = path
 
-        if re.search(RawDataParser._XLS_PATTERN, path):
-            self._is_file_excel = True
-        elif re.search(RawDataParser._TSV_PATTERN, path):
-            self._dialect = 'excel-tab'
-        elif re.search(RawDataParser._CSV_PATTERN, path):
-            self._dialect = 'excel'
-        else:
+        self._reader_type = find_reader(path)
+        if self._reader_type is None:
             raise TypeError('Not supported file format')
+        if lazy:
+            path = None
+            if not self._exists(self._path):
+                raise FileNotFoundError(self._path)
         return super().__init__(path)
-    
-    def _get_data(self, path):
+
+    def __iter__(self):
+        return self.iter_tables()
+
+    def iter_tables(self):
         """
-        Returns
-        -------
-        rows : []
-            Where one element is an OrderedDict
+        Reads the tables lazily, the rows of a table are read while
+        it is iterated, every iteration reads the file again
+
+        Yields
+        ------
+        table : DataTable
+            One for a csv/tsv file, one for every sheet of a workbook,
+            one for every run of NDJSON objects with the same keys
         """
-        rows = []
-        if self._is_file_excel:
-                book = xlrd.open_workbook(path)
-                rows = self._parse_workbook(book)
+        if self._stats:
+            for table in self._iter_tables():
+                self._stats.add(fuse_stats.FuseStats.DATA_READ, 'tables')
+                rows = table.rows
+                # the byte ranges stay visible to the parallel fuse, it counts their rows
+                if not hasattr(rows, 'iter_ranges'):
+                    rows = self._iter_counted_rows(rows)
+                yield DataTable(table.header, rows)
         else:
-            with open(path) as file:
-                reader = csv.DictReader(file,dialect=self._dialect)
-                for _ in reader:
-                    rows.append(_)
-        return rows
-    
-    def _parse_workbook(self, book):
+            yield from self._iter_tables()
+
+    def _iter_tables(self):
+        reader = self._reader_type(self._path, self._sheets, self._columns, self._read_jobs)
+        for _, header, rows in reader.iter_sheets():
+            yield DataTable(header, rows)
+
+    def _exists(self, path):
+        return path == RawDataParser.STDIN_PATH or os.path.isfile(path)
+
+    def _get_data(self, path):
         """
         Returns
         -------
-        data : []
-            Where one element is an OrderedDict
-        """
-        data = []
-        for sh_name in book.sheet_names():
-            sheet = book.sheet_by_name(sh_name)
-            nrows = sheet.nrows
-            ncols = sheet.ncols
-            column_names = []
-            for row_idx in range(0, nrows):
-                if row_idx == 0:
-                    column_names = sheet.row_values(row_idx)
-                else:
-                    row_dict = OrderedDict()
-                    for col_idx in range(0, ncols):
-                        label = column_names[col_idx]
-                        row_dict[label] = sheet.cell(row_idx, col_idx).value
-                    data.append(row_dict)
-        return data
+        tables : []
+            Where one element is a DataTable with its rows loaded
+        """
+        tables = []
+        if self._stats:
+            with self._stats.timer(fuse_stats.FuseStats.DATA_READ):
+                for table in self.iter_tables():
+                    tables.append(DataTable(table.header, list(table.rows)))
+        else:
+            for table in self.iter_tables():
+                tables.append(DataTable(table.header, list(table.rows)))
+        return tables
 
+    def _iter_counted_rows(self, rows):
+        row_count = 0
+        try:
+            for row in rows:
+                row_count = row_count + 1
+                yield row
+        finally:
+            self._stats.add(fuse_stats.FuseStats.DATA_READ, 'rows', row_count)
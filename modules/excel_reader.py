@@ -0,0 +1,136 @@
+import modules.cmd_fuse_exception as cmd_fuse_exception
+import modules.table_reader       as table_reader
+
+class ExcelReader(table_reader.TableReader):
+    """
+    Reads the sheets of a workbook row by row, only the
+    selected sheets are loaded
+    """
+    _EMPTY_CELL = ''
+
+    def _select_sheets(self, sheet_names):
+        """
+        Returns
+        -------
+        sheet_names : []
+            The sheets to read in the workbook's order
+        Raises
+        ------
+        SheetNotFoundError
+            When a selected sheet is not in the workbook
+        """
+        if self._sheets is None:
+            return list(sheet_names)
+        for sheet_name in self._sheets:
+            if sheet_name not in sheet_names:
+                raise cmd_fuse_exception.SheetNotFoundError(sheet_name, self._path)
+        selected = set(self._sheets)
+        return [sheet_name for sheet_name in sheet_names if sheet_name in selected]
+
+class XlsReader(ExcelReader):
+    """
+    Reads .xls workbooks with xlrd, the sheets are loaded on demand
+    and released after they are read
+    """
+    def iter_sheets(self):
+        try:
+            import xlrd
+        except ImportError:
+            raise cmd_fuse_exception.MissingDependencyError('xlrd', '.xls')
+        # https://blogs.harvard.edu/rprasad/2014/06/16/reading-excel-with-python-xlrd/
+        book = xlrd.open_workbook(self._path, on_demand=True)
+        try:
+            for sheet_name in self._select_sheets(book.sheet_names()):
+                sheet = book.sheet_by_name(sheet_name)
+                if sheet.nrows:
+                    header = sheet.row_values(0)
+                    indices = self._column_indices(header)
+                    if indices is None:
+                        yield sheet_name, header, XlsReader._iter_rows(sheet)
+                    else:
+                        yield (sheet_name, [header[idx] for idx in indices],
+                            XlsReader._iter_cells(sheet, indices))
+                book.unload_sheet(sheet_name)
+        finally:
+            book.release_resources()
+
+    @staticmethod
+    def _iter_rows(sheet):
+        for row_idx in range(1, sheet.nrows):
+            yield tuple(sheet.row_values(row_idx))
+
+    @staticmethod
+    def _iter_cells(sheet, indices):
+        """
+        Yields
+        ------
+        row : tuple
+            Only the cells of the indices are read
+        """
+        for row_idx in range(1, sheet.nrows):
+            yield tuple(sheet.cell_value(row_idx, col_idx) for col_idx in indices)
+
+class XlsxReader(ExcelReader):
+    """
+    Reads .xlsx workbooks with the streaming read-only parser of openpyxl
+    """
+    def iter_sheets(self):
+        try:
+            import openpyxl
+        except ImportError:
+            raise cmd_fuse_exception.MissingDependencyError('openpyxl', '.xlsx')
+        book = openpyxl.load_workbook(self._path, read_only=True, data_only=True)
+        try:
+            for sheet_name in self._select_sheets(book.sheetnames):
+                sheet = book[sheet_name]
+                rows = sheet.iter_rows(max_row=1, values_only=True)
+                header = next(rows, None)
+                if header is None:
+                    continue
+                header = [XlsxReader._to_value(cell) for cell in header]
+                indices = self._column_indices(header)
+                if indices is None:
+                    rows = sheet.iter_rows(min_row=2, values_only=True)
+                    yield sheet_name, header, XlsxReader._iter_rows(rows, len(header))
+                else:
+                    # the cells right of the last used column are not parsed
+                    max_col = indices[-1] + 1 if indices else 1
+                    rows = sheet.iter_rows(min_row=2, max_col=max_col, values_only=True)
+                    yield (sheet_name, [header[idx] for idx in indices],
+                        XlsxReader._iter_projected_rows(rows, indices))
+        finally:
+            book.close()
+
+    @staticmethod
+    def _iter_rows(rows, width):
+        """
+        Yields
+        ------
+        row : tuple
+            The empty cells are '' like with xlrd and the row is
+            padded to the header's width
+        """
+        for row in rows:
+            if None in row:
+                row = [XlsxReader._to_value(cell) for cell in row]
+            if len(row) < width:
+                row = list(row) + [ExcelReader._EMPTY_CELL] * (width - len(row))
+            yield tuple(row)
+
+    @staticmethod
+    def _iter_projected_rows(rows, indices):
+        """
+        Yields
+        ------
+        row : tuple
+            The cells of the indices, the empty cells are ''
+        """
+        for row in rows:
+            yield tuple(XlsxReader._to_value(row[idx]) if idx < len(row)
+                else ExcelReader._EMPTY_CELL for idx in indices)
+
+    @staticmethod
+    def _to_value(cell):
+        if cell is None:
+            return ExcelReader._EMPTY_CELL
+        return cell
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import struct
+
+# Manifest of an incremental fuse output, stored next to the output:
+#   records: one for every data row, the row fingerprint and the
+#            number of output lines the row generated
+#   trailer: JSON with the version, the options, the template
+#            fingerprints and the output size, then its u64 length
+MANIFEST_VERSION = 1
+SUFFIX = '.manifest'
+FINGERPRINT_SIZE = 16
+
+_RECORD = struct.Struct('<16sI')
+_TRAILER_LENGTH = struct.Struct('<Q')
+_READ_RECORDS = 4096
+_ENCODING = 'utf-8'
+_ROW_SEPARATOR = b'\x1f'
+
+def manifest_path(output_path):
+    return output_path + SUFFIX
+
+def header_digest(header):
+    """
+    Returns
+    -------
+    digest : bytes
+        Fingerprint of a table header, it is part of every row fingerprint
+    """
+    return hashlib.blake2b(repr(tuple(header)).encode(_ENCODING),
+        digest_size=FINGERPRINT_SIZE).digest()
+
+def row_fingerprint(table_digest, row):
+    """
+    Returns
+    -------
+    fingerprint : bytes
+        Changes when a value of the row or the table header changes
+    """
+    row_hash = hashlib.blake2b(table_digest, digest_size=FINGERPRINT_SIZE)
+    row_hash.update(_ROW_SEPARATOR)
+    row_hash.update(repr(row).encode(_ENCODING))
+    return row_hash.digest()
+
+def template_fingerprint(one_command):
+    """
+    Returns
+    -------
+    fingerprint : str
+        Changes when the command or its required columns change
+    """
+    template = [one_command.command_str, list(one_command.required_columns)]
+    return hashlib.blake2b(json.dumps(template).encode(_ENCODING),
+        digest_size=FINGERPRINT_SIZE).hexdigest()
+
+class FuseManifest:
+    """
+    A manifest read from the disk, the records are read lazily
+    """
+    def __init__(self, path, options, templates, output_size, records_size):
+        self._path = path
+        self.options = options
+        self.templates = templates
+        self.output_size = output_size
+        self._records_size = records_size
+
+    @staticmethod
+    def read(path):
+        """
+        Returns
+        -------
+        FuseManifest
+            None when the manifest is missing or not readable
+        """
+        if not os.path.isfile(path):
+            return None
+        try:
+            with open(path, 'rb') as manifest_file:
+                manifest_file.seek(-_TRAILER_LENGTH.size, os.SEEK_END)
+                (trailer_length,) = _TRAILER_LENGTH.unpack(manifest_file.read(_TRAILER_LENGTH.size))
+                records_size = manifest_file.seek(
+                    -(_TRAILER_LENGTH.size + trailer_length), os.SEEK_END)
+                trailer = json.loads(manifest_file.read(trailer_length).decode(_ENCODING))
+        except (OSError, ValueError, struct.error):
+            return None
+        if trailer.get('version') != MANIFEST_VERSION or records_size % _RECORD.size:
+            return None
+        return FuseManifest(path, trailer['options'], trailer['templates'],
+            trailer['output_size'], records_size)
+
+    def iter_records(self):
+        """
+        Yields
+        ------
+        (fingerprint, line_count) : tuple
+            In the order of the data rows
+        """
+        with open(self._path, 'rb') as manifest_file:
+            remaining = self._records_size
+            while remaining:
+                chunk = manifest_file.read(min(remaining, _RECORD.size * _READ_RECORDS))
+                remaining = remaining - len(chunk)
+                yield from _RECORD.iter_unpack(chunk)
+
+class ManifestWriter:
+    """
+    Writes the manifest into a temporary file, commit replaces the manifest
+    """
+    _TEMP_PATH = '{}.{}.tmp'
+
+    def __init__(self, path):
+        self._path = path
+        self._temp_path = ManifestWriter._TEMP_PATH.format(path, os.getpid())
+        self._file = open(self._temp_path, 'wb')
+
+    def add(self, fingerprint, line_count):
+        self._file.write(_RECORD.pack(fingerprint, line_count))
+
+    def commit(self, options, templates, output_size):
+        trailer = json.dumps({
+            'version' : MANIFEST_VERSION,
+            'options' : options,
+            'templates' : templates,
+            'output_size' : output_size
+        }).encode(_ENCODING)
+        self._file.write(trailer)
+        self._file.write(_TRAILER_LENGTH.pack(len(trailer)))
+        self._file.close()
+        os.replace(self._temp_path, self._path)
+
+    def abort(self):
+        self._file.close()
+        os.remove(self._temp_path)
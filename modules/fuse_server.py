@@ -0,0 +1,478 @@
+import asyncio
+import concurrent.futures
+import json
+import os
+import signal
+import socket
+import stat
+import threading
+
+import modules.cmd_deployer       as cmd_deployer
+import modules.cmd_fuse_exception as cmd_fuse_exception
+import modules.command_parser     as command_parser
+import modules.data_parser        as data_parser
+import modules.package_cache      as package_cache
+
+_ENCODING = 'utf-8'
+_NEW_LINE = '\n'
+
+class HotPackageCache:
+    """
+    Keeps the loaded packages in memory, an entry is loaded again
+    when the modification time or the size of its file changes
+    """
+    def __init__(self, package_dir, package_options=(), commands_dir=None):
+        """
+        Params
+        ------
+        package_dir : str
+            The directory of the packages
+        package_options : tuple
+            The separator, col_sub_left, col_sub_right, to_replace and
+            file_format for the packages of the commands files
+        commands_dir : str
+            The commands files under this directory can be requested by
+            their path, None accepts only package names
+        """
+        self._package_dir = package_dir
+        self._package_options = package_options
+        self._commands_dir = None
+        if commands_dir is not None:
+            self._commands_dir = os.path.realpath(commands_dir)
+        self._packages = {}
+        self._lock = threading.Lock()
+
+    def get(self, package):
+        """
+        Params
+        ------
+        package : str
+            A package name or the path of a commands file
+        Returns
+        -------
+        commands : dict
+            The command id and OneCommand pairs
+        Raises
+        ------
+        FileNotFoundError
+            When the package does not exist
+        PackageNameError
+            When the package is neither a name of the package directory
+            nor a commands file of the commands directory
+        """
+        path, is_commands_file = self._resolve(package)
+        stat = os.stat(path)
+        file_key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._packages.get(path)
+            if entry and entry[0] == file_key:
+                return entry[1]
+            if is_commands_file:
+                name = os.path.basename(path).split('.')[0]
+                commands, _ = package_cache.PackageCache(self._package_dir).get_or_build(
+                    path, name, *self._package_options)
+            else:
+                commands = command_parser.CommandPackage(
+                    package_name=package).load_package(path)
+            self._packages[path] = (file_key, commands)
+            return commands
+
+    def clear(self):
+        with self._lock:
+            self._packages.clear()
+
+    def _resolve(self, package):
+        """
+        Returns
+        -------
+        path : str
+            The package file or the commands file
+        is_commands_file : bool
+        """
+        if os.sep in package or (os.altsep and os.altsep in package):
+            path = os.path.realpath(package)
+            if (self._commands_dir is None or not os.path.isfile(path)
+                    or os.path.commonpath([self._commands_dir, path]) != self._commands_dir):
+                raise cmd_fuse_exception.PackageNameError(package)
+            return path, True
+        if not package or package.startswith('.'):
+            raise cmd_fuse_exception.PackageNameError(package)
+        return os.path.join(self._package_dir, package), False
+
+async def _read_line(reader, timeout):
+    """
+    Raises
+    ------
+    TimeoutError
+        When the client sends no line within the timeout
+    """
+    try:
+        return await asyncio.wait_for(reader.readline(), timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError('The client sent nothing for {} seconds'.format(timeout))
+
+class _CommandSender:
+    """
+    Sends the commands of a fuse running in a worker thread through the
+    writer of the event loop, in batches of JSON lines
+    """
+    def __init__(self, writer, loop, batch_size, timeout):
+        self._writer = writer
+        self._loop = loop
+        self._batch_size = batch_size
+        self._timeout = timeout
+        self._batch = []
+        self.count = 0
+
+    def send_all(self, commands):
+        """
+        Returns
+        -------
+        count : int
+            The number of commands sent
+        """
+        for command in commands:
+            self._batch.append(command)
+            if len(self._batch) >= self._batch_size:
+                self.flush()
+        self.flush()
+        return self.count
+
+    def flush(self):
+        """
+        Sends the batched commands and waits until the writer takes them
+        """
+        if not self._batch:
+            return
+        data = ''.join(json.dumps(command) + _NEW_LINE
+            for command in self._batch).encode(_ENCODING)
+        self.count = self.count + len(self._batch)
+        self._batch = []
+        asyncio.run_coroutine_threadsafe(self._send(data), self._loop).result()
+
+    async def _send(self, data):
+        self._writer.write(data)
+        try:
+            await asyncio.wait_for(self._writer.drain(), self._timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError('The client read nothing for {} seconds'.format(self._timeout))
+
+class _RowStream:
+    """
+    The rows sent after a request, read in the worker thread of the fuse
+    one line at a time. The commands of the rows read so far are sent
+    before it waits for the next line
+    """
+    def __init__(self, reader, loop, sender, timeout):
+        self._reader = reader
+        self._loop = loop
+        self._sender = sender
+        self._timeout = timeout
+
+    def __iter__(self):
+        while True:
+            self._sender.flush()
+            line = asyncio.run_coroutine_threadsafe(
+                _read_line(self._reader, self._timeout), self._loop).result()
+            if not line.strip():
+                return
+            yield tuple(json.loads(line))
+
+class FuseServer:
+    """
+    Fuses the requests of local clients with the packages kept in memory.
+
+    A request is one JSON line:
+        {"package": "name or commands path", "file": "datasheet path",
+         "group": "seq", "command_column": "CMD", "data_command_sep": ";",
+         "group_order": null, "sheets": null}
+    Without "file" the client sends the header and then the rows as JSON
+    arrays, one per line, closed by an empty line or the end of the input.
+    The rows are fused while they arrive, they are not validated first.
+    The response is one JSON string per command and a closing JSON object:
+        {"status": "ok", "commands": 12} or {"status": "error", "error": "..."}
+    """
+    BASE_MAX_REQUESTS = 8
+    BASE_TIMEOUT = 60.0
+    _BATCH_SIZE = 1000
+    _LOCAL_HOST = '127.0.0.1'
+
+    def __init__(self, address, package_dir, package_options=(), allow_remote=False,
+        commands_dir=None, max_requests=BASE_MAX_REQUESTS, timeout=BASE_TIMEOUT):
+        """
+        Params
+        ------
+        address : str
+            A unix socket path or [host:]port, see parse_address
+        package_dir : str
+            The directory of the packages
+        package_options : tuple
+            Passed to the HotPackageCache
+        allow_remote : bool
+            Serves on a host which is not a loopback address, a client
+            can read any file of the server through its requests
+        commands_dir : str
+            Passed to the HotPackageCache, the clients can request the
+            commands files under it
+        max_requests : int
+            The requests fused at the same time, the others wait for them
+        timeout : float
+            The seconds a client can stay silent or stop reading before
+            its request fails, also the time a stop waits for the running
+            requests before it cancels them
+        Raises
+        ------
+        NonLocalAddressError
+            When the host is not a loopback address without allow_remote
+        SocketPathError
+            When the unix socket path is an existing file of another kind
+        """
+        server_address = FuseServer.parse_address(address)
+        if isinstance(server_address, str):
+            if os.path.lexists(server_address) and not FuseServer._is_socket(server_address):
+                raise cmd_fuse_exception.SocketPathError(server_address)
+        elif not allow_remote and not FuseServer.is_loopback(server_address[0]):
+            raise cmd_fuse_exception.NonLocalAddressError(address)
+        self._address = address
+        self._packages = HotPackageCache(package_dir, package_options, commands_dir)
+        self._max_requests = max_requests
+        self._timeout = timeout
+        self._executor = None
+        self._stop_event = None
+        self._handlers = set()
+
+    @staticmethod
+    def parse_address(address):
+        """
+        Returns
+        -------
+        address : str or tuple
+            The unix socket path, or the (host, port) pair, the host
+            is localhost when only the port is provided, an IPv6 host
+            is written in brackets, e.g. [::1]:9000
+        """
+        if os.sep in address or address.endswith('.sock'):
+            return address
+        host, _, port = address.rpartition(':')
+        if host.startswith('[') and host.endswith(']'):
+            host = host[1:-1]
+        return host or FuseServer._LOCAL_HOST, int(port)
+
+    @staticmethod
+    def is_loopback(host):
+        """
+        Returns
+        -------
+        bool
+            Every address the host resolves to is a loopback address
+        """
+        import ipaddress
+        try:
+            addresses = socket.getaddrinfo(host, None)
+        except socket.gaierror:
+            return False
+        return bool(addresses) and all(
+            ipaddress.ip_address(address[4][0].split('%')[0]).is_loopback
+            for address in addresses)
+
+    @staticmethod
+    def _is_socket(path):
+        return os.path.lexists(path) and stat.S_ISSOCK(os.lstat(path).st_mode)
+
+    @staticmethod
+    def _remove_socket(path):
+        """
+        Removes the socket file of the path, a file of another kind is kept
+
+        Raises
+        ------
+        SocketPathError
+            When the path is an existing file which is not a socket
+        """
+        if not os.path.lexists(path):
+            return
+        if not FuseServer._is_socket(path):
+            raise cmd_fuse_exception.SocketPathError(path)
+        os.remove(path)
+
+    def run(self):
+        """
+        Serves until SIGINT or SIGTERM, the running requests are finished
+        or cancelled after the timeout
+        """
+        asyncio.run(self.serve())
+
+    def stop(self):
+        if self._stop_event:
+            self._stop_event.set()
+
+    async def serve(self, on_started=None):
+        """
+        Params
+        ------
+        on_started : callable
+            Called without arguments when the server accepts connections
+        """
+        address = FuseServer.parse_address(self._address)
+        loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        for stop_signal in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(stop_signal, self._stop_event.set)
+            except (NotImplementedError, RuntimeError, ValueError):
+                # not the main thread or the platform has no signal handlers
+                pass
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(self._max_requests)
+        if isinstance(address, str):
+            # a socket left by a server which did not stop cleanly
+            FuseServer._remove_socket(address)
+            server = await asyncio.start_unix_server(self._handle, path=address)
+        else:
+            server = await asyncio.start_server(self._handle, *address)
+        try:
+            if on_started:
+                on_started()
+            await self._stop_event.wait()
+        finally:
+            server.close()
+            await server.wait_closed()
+            if self._handlers:
+                _, stalled = await asyncio.wait(self._handlers, timeout=self._timeout)
+                for handler in stalled:
+                    handler.cancel()
+                await asyncio.gather(*stalled, return_exceptions=True)
+            # a cancelled request leaves its thread, it ends at its next read or send
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            if isinstance(address, str) and FuseServer._is_socket(address):
+                os.remove(address)
+
+    async def _handle(self, reader, writer):
+        self._handlers.add(asyncio.current_task())
+        try:
+            status = {'status' : 'ok', 'commands' : 0}
+            try:
+                status['commands'] = await self._fuse_request(reader, writer)
+            except (ConnectionError, asyncio.CancelledError):
+                raise
+            except Exception as request_error:
+                status = {'status' : 'error',
+                    'error' : '{}: {}'.format(type(request_error).__name__, request_error)}
+            writer.write((json.dumps(status) + _NEW_LINE).encode(_ENCODING))
+            await asyncio.wait_for(writer.drain(), self._timeout)
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+        finally:
+            self._handlers.discard(asyncio.current_task())
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _fuse_request(self, reader, writer):
+        """
+        Returns
+        -------
+        commands : int
+            The number of commands sent
+        """
+        loop = asyncio.get_running_loop()
+        request = json.loads(await _read_line(reader, self._timeout))
+        options = dict(FuseServer._base_options())
+        options.update(request)
+        if 'package' not in request:
+            raise ValueError('The request needs a package')
+
+        commands = await loop.run_in_executor(self._executor,
+            self._packages.get, request['package'])
+        sender = _CommandSender(writer, loop, FuseServer._BATCH_SIZE, self._timeout)
+        if 'file' in request:
+            columns = cmd_deployer.CommandFuse.required_columns(
+                commands, options['command_column'])
+            data = await loop.run_in_executor(self._executor, FuseServer._read_file,
+                request['file'], options['sheets'], columns)
+        else:
+            header = json.loads(await _read_line(reader, self._timeout))
+            data = data_parser.DataTable(header, _RowStream(reader, loop, sender, self._timeout))
+
+        deployer = cmd_deployer.CommandFuse(data, commands,
+            options['command_column'], options['data_command_sep'],
+            options['group'], options['group_order'])
+        if 'file' in request:
+            await loop.run_in_executor(self._executor, deployer.validate)
+        return await loop.run_in_executor(self._executor, sender.send_all, deployer.iter_fuse())
+
+    @staticmethod
+    def _base_options():
+        return {
+            'group' : cmd_deployer.CommandSeparationType.sequential,
+            'command_column' : cmd_deployer.CommandFuse.BASE_COMMAND_COLUMN,
+            'data_command_sep' : cmd_deployer.CommandFuse.BASE_COMMAND_SEP,
+            'group_order' : None,
+            'sheets' : None
+        }
+
+    @staticmethod
+    def _read_file(path, sheets, columns):
+        if not os.path.isfile(path):
+            raise FileNotFoundError(path)
+        return data_parser.RawDataParser(path, sheets=sheets, columns=columns).data
+
+def _connect(server_address):
+    if not isinstance(server_address, str):
+        # any address family the host resolves to
+        return socket.create_connection(server_address)
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(server_address)
+    except OSError:
+        connection.close()
+        raise
+    return connection
+
+def iter_remote_fuse(address, request, header=None, rows=None):
+    """
+    Sends a request to a FuseServer
+
+    Params
+    ------
+    address : str
+        The address of the server
+    request : dict
+        See FuseServer, the package is required
+    header : []
+        The column names, with the rows instead of a file in the request
+    rows : iterable
+        One element is a list or tuple in the order of the header
+    Yields
+    ------
+    command : str
+        As the server sends them
+    Raises
+    ------
+    RemoteFuseError
+        When the server is not running or could not fuse the request
+    """
+    try:
+        connection = _connect(FuseServer.parse_address(address))
+    except OSError as connect_error:
+        raise cmd_fuse_exception.RemoteFuseError(address, connect_error)
+    with connection:
+        lines = [json.dumps(request)]
+        if header is not None:
+            lines.append(json.dumps(list(header)))
+            for row in rows or ():
+                lines.append(json.dumps(list(row)))
+            lines.append('')
+        connection.sendall((_NEW_LINE.join(lines) + _NEW_LINE).encode(_ENCODING))
+        with connection.makefile('r', encoding=_ENCODING, newline=_NEW_LINE) as response:
+            for line in response:
+                message = json.loads(line)
+                if isinstance(message, str):
+                    yield message
+                elif message.get('status') == 'ok':
+                    return
+                else:
+                    raise cmd_fuse_exception.RemoteFuseError(address, message.get('error'))
+    raise cmd_fuse_exception.RemoteFuseError(address, 'the connection closed without a status')
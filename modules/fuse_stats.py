@@ -0,0 +1,110 @@
+from collections import OrderedDict
+import time
+
+class StageStats:
+    """
+    The wall time and the counters of one stage
+    """
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.counters = OrderedDict()
+
+    def add(self, counter, amount=1):
+        self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def to_dict(self):
+        stage_dict = OrderedDict()
+        stage_dict['seconds'] = round(self.seconds, 6)
+        stage_dict.update(self.counters)
+        return stage_dict
+
+class _StageTimer:
+
+    def __init__(self, stage):
+        self._stage = stage
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self._stage
+
+    def __exit__(self, *exc_info):
+        self._stage.seconds = self._stage.seconds + time.perf_counter() - self._start
+        return False
+
+class FuseStats:
+    """
+    Collects the per stage wall time and counters, e.g. rows read,
+    commands generated, bytes written or cache hits. Pass one instance
+    to the RawDataParser, CommandPackage and CommandFuse, every one of
+    them skips the collection when no stats is given
+    """
+    DATA_READ = 'data_read'
+    PACKAGE_PARSE = 'package_parse'
+    PACKAGE_LOAD = 'package_load'
+    VALIDATE = 'validate'
+    FUSE = 'fuse'
+    WRITE = 'write'
+
+    def __init__(self):
+        self._stages = OrderedDict()
+
+    def stage(self, name):
+        """
+        Returns
+        -------
+        StageStats
+            Created at the first use
+        """
+        stage = self._stages.get(name)
+        if stage is None:
+            stage = StageStats(name)
+            self._stages[name] = stage
+        return stage
+
+    def timer(self, name):
+        """
+        Returns
+        -------
+        context manager
+            Adds the wall time of the block to the stage
+        """
+        return _StageTimer(self.stage(name))
+
+    def add_time(self, name, seconds):
+        stage = self.stage(name)
+        stage.seconds = stage.seconds + seconds
+
+    def add(self, name, counter, amount=1):
+        self.stage(name).add(counter, amount)
+
+    @property
+    def stages(self):
+        return list(self._stages.values())
+
+    def to_dict(self):
+        """
+        Returns
+        -------
+        dict
+            The stage name and its time and counters, JSON ready
+        """
+        return OrderedDict((name, stage.to_dict()) for name, stage in self._stages.items())
+
+    def report(self):
+        """
+        Returns
+        -------
+        str
+            One line for every stage
+        """
+        lines = ['Stage statistics']
+        total = 0.0
+        for stage in self._stages.values():
+            total = total + stage.seconds
+            counters = ', '.join('{}: {}'.format(counter, value)
+                for counter, value in stage.counters.items())
+            lines.append('  {:<14} {:>10.3f}s  {}'.format(stage.name, stage.seconds, counters))
+        lines.append('  {:<14} {:>10.3f}s'.format('total', total))
+        return '\n'.join(lines)
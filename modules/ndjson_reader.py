@@ -0,0 +1,92 @@
+import json
+import sys
+
+import modules.table_reader as table_reader
+
+class NdjsonReader(table_reader.TableReader):
+    """
+    Reads newline delimited JSON, one object per line. The consecutive
+    objects with the same keys share a table like DataTable.from_dicts,
+    a missing key starts a new table. The path '-' reads the standard
+    input, the rows are read while it is written
+    """
+    STDIN_PATH = '-'
+    _ENCODING = 'utf-8'
+    _EMPTY_CELL = ''
+
+    def iter_sheets(self):
+        if self._path == NdjsonReader.STDIN_PATH:
+            yield from self._iter_tables(sys.stdin)
+            return
+        with open(self._path, encoding=NdjsonReader._ENCODING) as ndjson_file:
+            yield from self._iter_tables(ndjson_file)
+
+    def _iter_tables(self, lines):
+        objects = self._iter_objects(lines)
+        # the first object of the next table, set by _iter_table_rows
+        pending = [next(objects, None)]
+        while pending[0] is not None:
+            first_object = pending[0]
+            table_keys = self._kept_keys(first_object)
+            header = [key for key in first_object if key in table_keys]
+            rows = self._iter_table_rows(objects, pending, table_keys, header)
+            yield None, header, rows
+            # the rows which were not read before the next table
+            for _ in rows:
+                pass
+
+    def _iter_objects(self, lines):
+        """
+        Yields
+        ------
+        row_object : dict
+            The objects of the lines, the empty lines are skipped
+        Raises
+        ------
+        ValueError
+            When a line is not a JSON object
+        """
+        for line_number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                row_object = json.loads(line)
+            except ValueError as json_error:
+                raise ValueError('Cannot read line {} of {}: {}'.format(
+                    line_number, self._path, json_error))
+            if not isinstance(row_object, dict):
+                raise ValueError('Line {} of {} is not a JSON object'.format(
+                    line_number, self._path))
+            yield row_object
+
+    def _kept_keys(self, row_object):
+        """
+        Returns
+        -------
+        keys : set
+            The keys of the object which are read
+        """
+        if self._columns is None:
+            return set(row_object)
+        return set(row_object).intersection(self._columns)
+
+    def _iter_table_rows(self, objects, pending, table_keys, header):
+        """
+        Yields
+        ------
+        row : tuple
+            The values of the header's keys, a null is '' like an
+            empty csv cell
+        """
+        row_object = pending[0]
+        pending[0] = None
+        while row_object is not None:
+            if self._kept_keys(row_object) != table_keys:
+                pending[0] = row_object
+                return
+            row = tuple(row_object[key] for key in header)
+            if None in row:
+                row = tuple(NdjsonReader._EMPTY_CELL if value is None else value
+                    for value in row)
+            yield row
+            row_object = next(objects, None)
@@ -0,0 +1,282 @@
+import io
+import os
+import time
+
+import modules.cmd_fuse_exception as cmd_fuse_exception
+
+# the line break of the saved output, written and read without translation
+_NEW_LINE = '\n'
+
+class CommandSink:
+    """
+    Receives the generated commands one by one,
+    one fuse pass can feed several sinks
+    """
+    # the encoded size of the saved file after close, the sinks
+    # which do not save a file keep 0
+    bytes_written = 0
+
+    def open(self):
+        pass
+
+    def write(self, command):
+        pass
+
+    def close(self):
+        pass
+
+    def abort(self):
+        """
+        Called instead of close when the fuse failed
+        """
+        self.close()
+
+class BufferedSink(CommandSink):
+    """
+    Collects the written text and passes it to the stream in large chunks,
+    with a flush interval also when the oldest text waited that long
+    """
+    BASE_BUFFER_SIZE = 1024 * 1024
+
+    def __init__(self, stream, buffer_size=BASE_BUFFER_SIZE, flush_interval=None):
+        """
+        Params
+        ------
+        stream : file object
+            Opened for writing text
+        buffer_size : int
+            The characters to collect before one write to the stream
+        flush_interval : float
+            The seconds a text can wait in the buffer, checked at the next
+            write, 0 writes every text at once, None waits for the size
+        """
+        self._stream = stream
+        self._buffer_size = buffer_size
+        self._flush_interval = flush_interval
+        self._flush_deadline = 0
+        self._buffer = []
+        self._buffered = 0
+
+    def _append(self, text):
+        if not self._buffer and self._flush_interval is not None:
+            self._flush_deadline = time.monotonic() + self._flush_interval
+        self._buffer.append(text)
+        self._buffered = self._buffered + len(text)
+        if self._buffered >= self._buffer_size:
+            self.flush()
+        elif self._flush_interval is not None and time.monotonic() >= self._flush_deadline:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the collected text to the stream
+        """
+        if self._buffer:
+            self._stream.write(''.join(self._buffer))
+            self._buffer = []
+            self._buffered = 0
+
+class StreamSink(BufferedSink):
+    """
+    Writes every command as a line into an already opened stream,
+    e.g. the console, the lines are batched into a single write
+    """
+    _NEW_LINE = '\n'
+
+    def __init__(self, stream, terminator=_NEW_LINE,
+        buffer_size=BufferedSink.BASE_BUFFER_SIZE, flush_interval=None):
+        """
+        Params
+        ------
+        stream : file object
+            Opened for writing text, e.g. sys.stdout
+        terminator : str
+            Written after every command
+        buffer_size : int
+            The characters to collect before one write to the stream
+        flush_interval : float
+            The seconds a line can wait before it is written and the
+            stream is flushed, 0 for a console or a streamed input
+        """
+        super().__init__(stream, buffer_size, flush_interval)
+        self._terminator = terminator
+
+    def write(self, command):
+        self._append(command + self._terminator)
+
+    def flush(self):
+        super().flush()
+        if self._flush_interval is not None:
+            # the stream's own buffer would hold the lines back again
+            self._stream.flush()
+
+    def close(self):
+        self.flush()
+        self._stream.flush()
+
+class SeparatedStreamSink(BufferedSink):
+    """
+    Writes the commands separated by new lines, without a trailing one
+    """
+    _NEW_LINE = '\n'
+
+    def __init__(self, stream, separator=_NEW_LINE,
+        buffer_size=BufferedSink.BASE_BUFFER_SIZE):
+        """
+        Params
+        ------
+        stream : file object
+            Opened for writing text
+        separator : str
+            Written between two commands
+        buffer_size : int
+            The characters to collect before one write to the stream
+        """
+        super().__init__(stream, buffer_size)
+        self._separator = separator
+        self._current_separator = ''
+
+    def write(self, command):
+        self._append(self._current_separator + command)
+        self._current_separator = self._separator
+
+    def close(self):
+        self.flush()
+
+class CompressionType:
+    none = 'none'
+    gzip = 'gzip'
+    zstd = 'zstd'
+
+class FileSink(SeparatedStreamSink):
+    """
+    Saves the commands into the file of the provided path, optionally
+    compressed. With atomic writing the commands go to a temporary file
+    which replaces the path only when the fuse succeeded
+    """
+    _EXTENSIONS = {
+        '.gz' : CompressionType.gzip,
+        '.zst' : CompressionType.zstd
+    }
+    _TEMP_PATH = '{}.{}.tmp'
+
+    def __init__(self, path, compression=None, atomic=True,
+        buffer_size=BufferedSink.BASE_BUFFER_SIZE):
+        """
+        Params
+        ------
+        path : str
+            The file to write
+        compression : str
+            A CompressionType value, None infers it from the extension
+        atomic : bool
+            Writes a temporary file and renames it to the path at close
+        buffer_size : int
+            The characters to collect before one write to the file
+        """
+        super().__init__(None, buffer_size=buffer_size)
+        self._path = path
+        self._compression = compression
+        if self._compression is None:
+            self._compression = FileSink.infer_compression(path)
+        self._atomic = atomic
+        self._write_path = path
+        self._raw_file = None
+
+    @staticmethod
+    def infer_compression(path):
+        """
+        Returns
+        -------
+        compression : str
+            The CompressionType of the path's extension
+        """
+        extension = os.path.splitext(path)[1]
+        return FileSink._EXTENSIONS.get(extension, CompressionType.none)
+
+    def open(self):
+        self._write_path = self._path
+        if self._atomic:
+            self._write_path = FileSink._TEMP_PATH.format(self._path, os.getpid())
+        self._current_separator = ''
+        self.bytes_written = 0
+        if self._compression == CompressionType.none:
+            self._stream = open(self._write_path, 'w', newline=_NEW_LINE)
+        elif self._compression == CompressionType.gzip:
+            import gzip
+            self._stream = gzip.open(self._write_path, 'wt', newline=_NEW_LINE)
+        elif self._compression == CompressionType.zstd:
+            try:
+                import zstandard
+            except ImportError:
+                raise cmd_fuse_exception.MissingDependencyError('zstandard', '.zst output')
+            self._raw_file = open(self._write_path, 'wb')
+            compressor = zstandard.ZstdCompressor().stream_writer(self._raw_file)
+            self._stream = io.TextIOWrapper(compressor, newline=_NEW_LINE)
+        else:
+            raise cmd_fuse_exception.NotSupportedCompressionError(self._compression)
+
+    def close(self):
+        if self._stream:
+            self.flush()
+            self._close_files()
+            self.bytes_written = os.path.getsize(self._write_path)
+            if self._atomic:
+                os.replace(self._write_path, self._path)
+
+    def abort(self):
+        if self._stream:
+            self._buffer = []
+            self._buffered = 0
+            self._close_files()
+            if self._atomic:
+                os.remove(self._write_path)
+
+    def _close_files(self):
+        self._stream.close()
+        self._stream = None
+        if self._raw_file:
+            self._raw_file.close()
+            self._raw_file = None
+
+def open_output(path, compression=None):
+    """
+    Opens a saved output for reading text, only '\n' ends a line so
+    a '\r' of a command is read back as it was written
+
+    Params
+    ------
+    path : str
+        The file written by a FileSink
+    compression : str
+        A CompressionType value, None infers it from the extension
+    """
+    if compression is None:
+        compression = FileSink.infer_compression(path)
+    if compression == CompressionType.none:
+        return open(path, newline=_NEW_LINE)
+    if compression == CompressionType.gzip:
+        import gzip
+        return gzip.open(path, 'rt', newline=_NEW_LINE)
+    if compression == CompressionType.zstd:
+        try:
+            import zstandard
+        except ImportError:
+            raise cmd_fuse_exception.MissingDependencyError('zstandard', '.zst output')
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb')),
+            newline=_NEW_LINE)
+    raise cmd_fuse_exception.NotSupportedCompressionError(compression)
+
+class ListSink(CommandSink):
+    """
+    Collects the commands into a list
+    """
+    def __init__(self):
+        self._commands = []
+
+    @property
+    def commands(self):
+        return self._commands
+
+    def write(self, command):
+        self._commands.append(command)
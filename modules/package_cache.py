@@ -0,0 +1,201 @@
+import json
+import os
+import time
+
+import modules.command_parser as command_parser
+import modules.fuse_stats     as fuse_stats
+import modules.package_format as package_format
+
+class PackageCache:
+    """
+    Serves the packages compiled from commands files, a package is
+    rebuilt only when the commands file or the parser options change.
+    The packages built by the cache are evicted least recently used first
+    when their total size grows over the limit
+    """
+    BASE_MAX_SIZE = 256 * 1024 * 1024
+    _INDEX_NAME = '.package_cache'
+    _USED = 'used'
+    _SOURCE_HASH = 'source_hash'
+    _MTIME = 'mtime'
+
+    def __init__(self, package_dir, max_size=BASE_MAX_SIZE, stats=None):
+        """
+        Params
+        ------
+        package_dir : str
+            The directory of the packages
+        max_size : int
+            The bytes the cached packages can take, None is unlimited
+        stats : fuse_stats.FuseStats
+            Collects the cache hits and misses, None skips it
+        """
+        self._package_dir = package_dir
+        self._max_size = max_size
+        self._stats = stats
+        self._index_path = os.path.join(package_dir, PackageCache._INDEX_NAME)
+
+    def get_or_build(self, commands_path, package_name,
+        separator=command_parser.CommandPackage.BASE_SEPARATOR,
+        col_sub_left=command_parser.CommandPackage.COL_SUB_LEFT,
+        col_sub_right=command_parser.CommandPackage.COL_SUB_RIGHT,
+        to_replace=command_parser.CommandPackage.TO_REPLACE,
+        file_format=command_parser.CommandPackage.BASE_PACKAGE_FORMAT,
+        rebuild=False):
+        """
+        Params
+        ------
+        commands_path : str
+            The commands file
+        package_name : str
+            The package to serve or build
+        rebuild : bool
+            Builds the package even if the cached one is up to date
+        The others are passed to the CommandPackage
+        Returns
+        -------
+        (commands, is_built) : tuple
+            The command id and OneCommand pairs and whether the
+            package was compiled again
+        """
+        cmd_package = command_parser.CommandPackage(None, package_name,
+            separator, col_sub_left, col_sub_right, to_replace, self._stats)
+        package_path = os.path.join(self._package_dir, package_name)
+        expected_hash = cmd_package.hash_source_file(commands_path)
+
+        if not rebuild and self._is_up_to_date(package_name, package_path,
+            expected_hash, file_format):
+            commands = cmd_package.load_package(package_path)
+            self._touch(package_name)
+            if self._stats:
+                self._stats.add(fuse_stats.FuseStats.PACKAGE_LOAD, 'cache_hits')
+            return commands, False
+
+        if self._stats:
+            self._stats.add(fuse_stats.FuseStats.PACKAGE_LOAD, 'cache_misses')
+        cmd_package = command_parser.CommandPackage(commands_path, package_name,
+            separator, col_sub_left, col_sub_right, to_replace, self._stats)
+        cmd_package.deploy_package(package_path, file_format)
+        json_hash = None
+        if file_format == command_parser.CommandPackage.JSON_FORMAT:
+            json_hash = expected_hash
+        self._touch(package_name, package_path, json_hash)
+        self.evict(keep=package_name)
+        return cmd_package.commands, True
+
+    def invalidate(self, package_name):
+        """
+        Removes the cached package, the next request builds it again
+        """
+        index = self._read_index()
+        if package_name in index:
+            del index[package_name]
+            self._remove_package(package_name)
+            self._write_index(index)
+
+    def clear(self):
+        """
+        Removes every package built by the cache
+        """
+        for package_name in self._read_index():
+            self._remove_package(package_name)
+        self._write_index({})
+
+    def evict(self, keep=None):
+        """
+        Removes the least recently used packages until the cached
+        packages fit into the size limit
+
+        Params
+        ------
+        keep : str
+            The package name which is never evicted
+        """
+        if self._max_size is None:
+            return
+        index = self._read_index()
+        sizes = {}
+        for package_name in list(index):
+            package_path = os.path.join(self._package_dir, package_name)
+            if os.path.isfile(package_path):
+                sizes[package_name] = os.path.getsize(package_path)
+            else:
+                del index[package_name]
+        total_size = sum(sizes.values())
+        for package_name in sorted(sizes, key=lambda name: index[name].get(PackageCache._USED, 0)):
+            if total_size <= self._max_size:
+                break
+            if package_name == keep:
+                continue
+            self._remove_package(package_name)
+            total_size = total_size - sizes[package_name]
+            del index[package_name]
+        self._write_index(index)
+
+    def _is_up_to_date(self, package_name, package_path, expected_hash, file_format):
+        """
+        Returns
+        -------
+        bool
+            The package is in the requested format and was compiled
+            from the expected source
+        """
+        if not os.path.isfile(package_path):
+            return False
+        if package_format.is_binary_package(package_path):
+            return (file_format == command_parser.CommandPackage.BINARY_FORMAT
+                and package_format.read_hash(package_path) == expected_hash)
+        if file_format != command_parser.CommandPackage.JSON_FORMAT:
+            return False
+        # a JSON package has no header, the index holds its source hash
+        # for the file the cache wrote
+        entry = self._read_index().get(package_name, {})
+        return (entry.get(PackageCache._SOURCE_HASH) == expected_hash
+            and entry.get(PackageCache._MTIME) == os.stat(package_path).st_mtime_ns)
+
+    def _touch(self, package_name, package_path=None, json_hash=None):
+        """
+        Params
+        ------
+        package_path : str
+            The package which was written, None keeps the stored hash
+        json_hash : str
+            The source hash of a written JSON package
+        """
+        index = self._read_index()
+        entry = index.setdefault(package_name, {})
+        entry[PackageCache._USED] = time.time()
+        if package_path is not None:
+            entry.pop(PackageCache._SOURCE_HASH, None)
+            entry.pop(PackageCache._MTIME, None)
+            if json_hash is not None:
+                entry[PackageCache._SOURCE_HASH] = json_hash
+                entry[PackageCache._MTIME] = os.stat(package_path).st_mtime_ns
+        self._write_index(index)
+
+    def _remove_package(self, package_name):
+        package_path = os.path.join(self._package_dir, package_name)
+        if os.path.isfile(package_path):
+            os.remove(package_path)
+
+    def _read_index(self):
+        """
+        Returns
+        -------
+        index : dict
+            The package name and entry pairs, an entry holds the last
+            use time and the source hash of a JSON package
+        """
+        if not os.path.isfile(self._index_path):
+            return {}
+        try:
+            with open(self._index_path) as index_file:
+                return json.load(index_file)
+        except ValueError:
+            return {}
+
+    def _write_index(self, index):
+        temp_path = self._index_path + '.tmp'
+        with open(temp_path, 'w') as index_file:
+            json.dump(index, index_file)
+        os.replace(temp_path, self._index_path)
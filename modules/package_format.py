@@ -0,0 +1,252 @@
+import itertools
+import mmap
+import os
+import struct
+import sys
+
+import modules.cmd_fuse_exception as cmd_fuse_exception
+
+# Precompiled command package layout, every number is little endian:
+#   magic, format version, source hash
+#   column table: count, then the column names
+#   commands: count, then
+#     the text of every command: the cmd_id, command_str and format
+#     template of every command in one string, then their u32 lengths
+#     in characters
+#     the required columns: the u32 column count of every command,
+#     then their u32 indices into the column table
+# a string is an u32 byte length and the utf-8 bytes, the text is
+# decoded once and sliced, the templates are not built again
+MAGIC = b'CMDFUSEP'
+FORMAT_VERSION = 1
+_TEXT_FIELDS = 3
+HASH_SIZE = 32
+_EMPTY_HASH = bytes(HASH_SIZE)
+_ENCODING = 'utf-8'
+_TEMP_PATH = '{}.{}.tmp'
+
+_HEADER = struct.Struct('<8sH32s')
+_COUNT = struct.Struct('<I')
+
+class PackageRecord:
+    """
+    One precompiled command as stored in the package
+    """
+    __slots__ = ('cmd_id', 'command_str', 'required_columns', 'template')
+
+    def __init__(self, cmd_id, command_str, required_columns, template):
+        self.cmd_id = cmd_id
+        self.command_str = command_str
+        self.required_columns = required_columns
+        self.template = template
+
+_OPTION_SEPARATOR = b'\0'
+
+def source_hash(content, options=()):
+    """
+    Params
+    ------
+    content : bytes
+        The source the package was compiled from
+    options : tuple
+        The parser options which change the compiled package, one element is str
+    Returns
+    -------
+    hash : str
+        Hex digest which fits into the package header
+    """
+    import hashlib
+    source = hashlib.sha256()
+    for option in options:
+        source.update(option.encode(_ENCODING))
+        source.update(_OPTION_SEPARATOR)
+    source.update(content)
+    return source.hexdigest()
+
+def read_hash(path):
+    """
+    Reads only the header of the package
+
+    Returns
+    -------
+    hash : str
+        The source hash, None for JSON packages or packages without one
+    """
+    with open(path, 'rb') as package_file:
+        header = package_file.read(_HEADER.size)
+    if len(header) != _HEADER.size:
+        return None
+    magic, version, raw_hash = _HEADER.unpack(header)
+    if magic != MAGIC or version != FORMAT_VERSION or raw_hash == _EMPTY_HASH:
+        return None
+    return raw_hash.hex()
+
+def is_binary_package(path):
+    """
+    Returns
+    -------
+    bool
+        The file starts with the precompiled package magic
+    """
+    with open(path, 'rb') as package_file:
+        return package_file.read(len(MAGIC)) == MAGIC
+
+def dump(commands, path, package_hash=None):
+    """
+    Writes the precompiled package into a temporary file which replaces
+    the path when it is complete, a reader never sees a partial package
+
+    Params
+    ------
+    commands : []
+        One element is a OneCommand
+    path : str
+        The file to write
+    package_hash : str
+        Hex digest of the source, see source_hash
+    """
+    column_ids = {}
+    columns = []
+    for command in commands:
+        for col in command.required_columns:
+            if col not in column_ids:
+                column_ids[col] = len(columns)
+                columns.append(col)
+
+    raw_hash = _EMPTY_HASH
+    if package_hash:
+        raw_hash = bytes.fromhex(package_hash)
+    texts = []
+    column_counts = []
+    column_idxs = []
+    for command in commands:
+        texts.extend((command.cmd_id, command.command_str, command.template))
+        column_counts.append(len(command.required_columns))
+        column_idxs.extend(column_ids[col] for col in command.required_columns)
+
+    buffer = bytearray(_HEADER.pack(MAGIC, FORMAT_VERSION, raw_hash))
+    _pack_strings(buffer, columns)
+    buffer += _COUNT.pack(len(commands))
+    _pack_string(buffer, ''.join(texts))
+    _pack_array(buffer, [len(text) for text in texts])
+    _pack_array(buffer, column_counts)
+    _pack_numbers(buffer, column_idxs)
+
+    temp_path = _TEMP_PATH.format(path, os.getpid())
+    try:
+        with open(temp_path, 'wb') as package_file:
+            package_file.write(buffer)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def load(path):
+    """
+    Reads the precompiled package through a memory map
+
+    Returns
+    -------
+    (package_hash, records) : tuple
+        The source hash or None and the PackageRecord list
+    Raises
+    ------
+    PackageFormatError
+        When the file is not a supported precompiled package
+    """
+    with open(path, 'rb') as package_file:
+        with mmap.mmap(package_file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            return _unpack(buffer)
+
+def _unpack(buffer):
+    try:
+        magic, version, raw_hash = _HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise cmd_fuse_exception.PackageFormatError('not a precompiled package')
+        if version != FORMAT_VERSION:
+            raise cmd_fuse_exception.PackageFormatError(
+                'unsupported format version {}'.format(version))
+        offset = _HEADER.size
+        columns, offset = _unpack_strings(buffer, offset)
+        # one str object per column name, shared by every command
+        columns = [sys.intern(col) for col in columns]
+
+        (command_count,) = _COUNT.unpack_from(buffer, offset)
+        offset = offset + _COUNT.size
+        records = _unpack_records(buffer, offset, columns, command_count)
+    except (struct.error, IndexError, UnicodeDecodeError) as unpack_error:
+        raise cmd_fuse_exception.PackageFormatError(str(unpack_error))
+
+    package_hash = None
+    if raw_hash != _EMPTY_HASH:
+        package_hash = raw_hash.hex()
+    return package_hash, records
+
+def _unpack_records(buffer, offset, columns, command_count):
+    text, offset = _unpack_string(buffer, offset)
+    text_lengths, offset = _unpack_array(buffer, offset, command_count * _TEXT_FIELDS)
+    column_counts, offset = _unpack_array(buffer, offset, command_count)
+    column_idxs, offset = _unpack_numbers(buffer, offset)
+    if sum(text_lengths) != len(text) or sum(column_counts) != len(column_idxs):
+        raise IndexError('command table out of the package bounds')
+    text_ends = list(itertools.accumulate(text_lengths))
+    column_ends = list(itertools.accumulate(column_counts))
+
+    records = []
+    text_start = 0
+    column_start = 0
+    for command_idx in range(command_count):
+        cmd_id_end, command_str_end, template_end = text_ends[
+            command_idx * _TEXT_FIELDS:(command_idx + 1) * _TEXT_FIELDS]
+        column_end = column_ends[command_idx]
+        records.append(PackageRecord(text[text_start:cmd_id_end],
+            text[cmd_id_end:command_str_end],
+            [columns[idx] for idx in column_idxs[column_start:column_end]],
+            text[command_str_end:template_end]))
+        text_start = template_end
+        column_start = column_end
+    return records
+
+def _pack_string(buffer, value):
+    encoded = value.encode(_ENCODING)
+    buffer += _COUNT.pack(len(encoded))
+    buffer += encoded
+
+def _pack_strings(buffer, values):
+    buffer += _COUNT.pack(len(values))
+    for value in values:
+        _pack_string(buffer, value)
+
+def _pack_numbers(buffer, numbers):
+    buffer += _COUNT.pack(len(numbers))
+    _pack_array(buffer, numbers)
+
+def _pack_array(buffer, numbers):
+    # the count is known from an earlier field
+    buffer += struct.pack('<{}I'.format(len(numbers)), *numbers)
+
+def _unpack_string(buffer, offset):
+    (length,) = _COUNT.unpack_from(buffer, offset)
+    offset = offset + _COUNT.size
+    end = offset + length
+    if end > len(buffer):
+        raise IndexError('string out of the package bounds')
+    return str(buffer[offset:end], _ENCODING), end
+
+def _unpack_strings(buffer, offset):
+    (count,) = _COUNT.unpack_from(buffer, offset)
+    offset = offset + _COUNT.size
+    values = []
+    for _ in range(count):
+        value, offset = _unpack_string(buffer, offset)
+        values.append(value)
+    return values, offset
+
+def _unpack_numbers(buffer, offset):
+    (count,) = _COUNT.unpack_from(buffer, offset)
+    return _unpack_array(buffer, offset + _COUNT.size, count)
+
+def _unpack_array(buffer, offset, count):
+    numbers = list(struct.unpack_from('<{}I'.format(count), buffer, offset))
+    return numbers, offset + count * _COUNT.size
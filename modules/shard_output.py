@@ -0,0 +1,321 @@
+from collections import OrderedDict
+import os
+import queue
+import threading
+import zlib
+
+import modules.cmd_fuse_exception as cmd_fuse_exception
+
+class _Shard:
+
+    def __init__(self, path, writer_idx):
+        self.path = path
+        self.temp_path = ShardOutput._TEMP_PATH.format(path, os.getpid())
+        self.writer_idx = writer_idx
+        self.buffer = []
+        self.buffered = 0
+        self.separator = ''
+        self.is_started = False
+
+class _ShardWriter(threading.Thread):
+    """
+    Writes the text of its shards in the order it is queued, the files
+    stay open until more than max_open_files are needed, then the least
+    recently written one is closed
+    """
+    def __init__(self, max_open_files, queue_size):
+        super().__init__(daemon=True)
+        self._max_open_files = max(1, max_open_files)
+        self._queue = queue.Queue(queue_size)
+        self._files = OrderedDict()
+        self.error = None
+
+    def put(self, item):
+        """
+        Params
+        ------
+        item : tuple
+            The (path, text, truncate) to write, None stops the writer
+        """
+        self._queue.put(item)
+
+    def run(self):
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                if self.error is None:
+                    try:
+                        self._write(*item)
+                    except Exception as write_error:
+                        self.error = write_error
+        finally:
+            for shard_file in self._files.values():
+                try:
+                    shard_file.close()
+                except Exception as close_error:
+                    if self.error is None:
+                        self.error = close_error
+            self._files.clear()
+
+    def _write(self, path, text, truncate):
+        shard_file = self._files.pop(path, None)
+        if shard_file is None:
+            if len(self._files) >= self._max_open_files:
+                _, least_recent = self._files.popitem(last=False)
+                least_recent.close()
+            # written like an output_sink.FileSink, without newline translation
+            shard_file = open(path, 'w' if truncate else 'a',
+                encoding=ShardOutput._ENCODING, newline=ShardOutput._NEW_LINE)
+        self._files[path] = shard_file
+        shard_file.write(text)
+
+class ShardOutput:
+    """
+    Saves the commands of every key of a column into a file of its own,
+    or with a shard count into that many files by the hash of the key.
+    The commands are buffered per shard and written by a few writer
+    threads, a shard always goes to the same writer so its commands keep
+    their order. The files are written next to their paths and renamed
+    when the fuse succeeded, like an atomic output_sink.FileSink. The
+    names of the written shards are kept in an index file of the
+    directory, the shards of the previous run which got no command
+    this time are removed
+    """
+    BASE_MAX_OPEN_FILES = 256
+    BASE_WRITERS = 4
+    BASE_SHARD_BUFFER_SIZE = 64 * 1024
+    # the characters of every shard buffer together before all are written
+    BASE_BUFFER_BUDGET = 32 * 1024 * 1024
+    _EXTENSION = '.txt'
+    _EMPTY_KEY_NAME = '%empty'
+    _HASH_NAME = 'shard_{:0{}d}'
+    _NEW_LINE = '\n'
+    _TEMP_PATH = '{}.{}.tmp'
+    _INDEX_NAME = '.shards'
+    # the queued writes per writer, bounds the memory of a slow disk
+    _QUEUE_SIZE = 16
+    _ENCODING = 'utf-8'
+
+    def __init__(self, directory, shard_count=None,
+        max_open_files=BASE_MAX_OPEN_FILES, writers=BASE_WRITERS,
+        shard_buffer_size=BASE_SHARD_BUFFER_SIZE, buffer_budget=BASE_BUFFER_BUDGET):
+        """
+        Params
+        ------
+        directory : str
+            The directory of the shard files, created when missing
+        shard_count : int
+            Hashes the keys into this many files, None writes
+            a file for every key
+        max_open_files : int
+            The files the writers keep open together
+        writers : int
+            The number of writer threads
+        shard_buffer_size : int
+            The characters to collect for a shard before one write
+        buffer_budget : int
+            The characters to collect for every shard together
+        """
+        self._directory = directory
+        self._shard_count = shard_count
+        self._writer_count = max(1, writers)
+        self._max_open_files = max_open_files
+        self._shard_buffer_size = shard_buffer_size
+        self._buffer_budget = buffer_budget
+        # the shards by path in the order of their first command
+        self._shards = {}
+        self._key_shards = {}
+        self._hash_shards = []
+        self._writers = []
+        self._buffered = 0
+        self.bytes_written = 0
+
+    @property
+    def paths(self):
+        """
+        Returns
+        -------
+        paths : []
+            The shard files with at least one command, in the
+            order of their first command
+        """
+        return [shard.path for shard in self._shards.values()]
+
+    def shard_name(self, key):
+        """
+        Returns
+        -------
+        name : str
+            The file name of the key's shard, a key is percent-encoded
+            so two keys never share a file
+        """
+        if self._shard_count:
+            width = len(str(self._shard_count - 1))
+            name = ShardOutput._HASH_NAME.format(self._shard_index(key), width)
+            return name + ShardOutput._EXTENSION
+        key = '' if key is None else str(key)
+        if not key:
+            return ShardOutput._EMPTY_KEY_NAME + ShardOutput._EXTENSION
+        # imported here, only the keyed shards need it
+        from urllib.parse import quote
+        name = quote(key, safe=' ,-=@+')
+        if not name.strip('.'):
+            name = name.replace('.', '%2E')
+        return name + ShardOutput._EXTENSION
+
+    def _shard_index(self, key):
+        key = '' if key is None else str(key)
+        return zlib.crc32(key.encode(ShardOutput._ENCODING)) % self._shard_count
+
+    def open(self):
+        """
+        Raises
+        ------
+        ShardDirectoryError
+            When the directory is a file, e.g. a saved output
+        """
+        if os.path.exists(self._directory) and not os.path.isdir(self._directory):
+            raise cmd_fuse_exception.ShardDirectoryError(self._directory)
+        os.makedirs(self._directory, exist_ok=True)
+        self._shards = {}
+        self._key_shards = {}
+        self._hash_shards = [None] * (self._shard_count or 0)
+        self._buffered = 0
+        self.bytes_written = 0
+        max_open_per_writer = max(1, self._max_open_files // self._writer_count)
+        self._writers = [_ShardWriter(max_open_per_writer, ShardOutput._QUEUE_SIZE)
+            for _ in range(self._writer_count)]
+        for writer in self._writers:
+            writer.start()
+
+    def write(self, key, command):
+        """
+        Params
+        ------
+        key : object
+            The value of the row in the shard column
+        command : str
+            Written as a line of the key's shard
+        """
+        if self._shard_count:
+            shard_idx = self._shard_index(key)
+            shard = self._hash_shards[shard_idx]
+            if shard is None:
+                shard = self._hash_shards[shard_idx] = self._get_shard(key)
+        else:
+            shard = self._key_shards.get(key)
+            if shard is None:
+                shard = self._key_shards[key] = self._get_shard(key)
+        text = shard.separator + command
+        shard.separator = ShardOutput._NEW_LINE
+        shard.buffer.append(text)
+        shard.buffered = shard.buffered + len(text)
+        self._buffered = self._buffered + len(text)
+        if shard.buffered >= self._shard_buffer_size:
+            self._flush(shard)
+        if self._buffered >= self._buffer_budget:
+            self._flush_all()
+
+    def close(self):
+        """
+        Writes the rest of the buffers and replaces the shard files
+
+        Raises
+        ------
+        OSError
+            When a writer failed, no shard file is replaced
+        """
+        try:
+            self._flush_all()
+        except BaseException:
+            self.abort()
+            raise
+        error = self._stop_writers()
+        if error:
+            self._remove_temp_files()
+            raise error
+        for shard in self._shards.values():
+            self.bytes_written = self.bytes_written + os.path.getsize(shard.temp_path)
+            os.replace(shard.temp_path, shard.path)
+        self._remove_stale_shards()
+
+    def abort(self):
+        """
+        Called instead of close when the fuse failed,
+        the previous shard files are kept
+        """
+        self._stop_writers()
+        self._remove_temp_files()
+
+    def _remove_stale_shards(self):
+        """
+        Removes the shards of the previous index which were not written
+        now, e.g. of a key which is gone, and saves the new index
+        """
+        index_path = os.path.join(self._directory, ShardOutput._INDEX_NAME)
+        names = [os.path.basename(path) for path in self._shards]
+        if os.path.isfile(index_path):
+            with open(index_path, encoding=ShardOutput._ENCODING) as index_file:
+                stale_names = set(index_file.read().splitlines()).difference(names)
+            for name in stale_names:
+                # only the shard files of the directory itself
+                if name != os.path.basename(name) or not name.endswith(ShardOutput._EXTENSION):
+                    continue
+                path = os.path.join(self._directory, name)
+                if os.path.isfile(path):
+                    os.remove(path)
+        temp_path = ShardOutput._TEMP_PATH.format(index_path, os.getpid())
+        with open(temp_path, 'w', encoding=ShardOutput._ENCODING,
+                newline=ShardOutput._NEW_LINE) as index_file:
+            index_file.write(''.join(name + ShardOutput._NEW_LINE for name in names))
+        os.replace(temp_path, index_path)
+
+    def _get_shard(self, key):
+        name = self.shard_name(key)
+        path = os.path.join(self._directory, name)
+        # e.g. 1.0 and '1.0' share a file
+        shard = self._shards.get(path)
+        if shard is None:
+            writer_idx = zlib.crc32(name.encode(ShardOutput._ENCODING)) % self._writer_count
+            shard = self._shards[path] = _Shard(path, writer_idx)
+        return shard
+
+    def _flush(self, shard):
+        writer = self._writers[shard.writer_idx]
+        if writer.error:
+            raise writer.error
+        text = ''.join(shard.buffer)
+        writer.put((shard.temp_path, text, not shard.is_started))
+        shard.is_started = True
+        shard.buffer = []
+        self._buffered = self._buffered - shard.buffered
+        shard.buffered = 0
+
+    def _flush_all(self):
+        for shard in self._shards.values():
+            if shard.buffer:
+                self._flush(shard)
+
+    def _stop_writers(self):
+        """
+        Returns
+        -------
+        error : Exception
+            The first error of the writers, None without one
+        """
+        for writer in self._writers:
+            writer.put(None)
+        error = None
+        for writer in self._writers:
+            writer.join()
+            if error is None:
+                error = writer.error
+        self._writers = []
+        return error
+
+    def _remove_temp_files(self):
+        for shard in self._shards.values():
+            if shard.is_started and os.path.exists(shard.temp_path):
+                os.remove(shard.temp_path)
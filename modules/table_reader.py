@@ -0,0 +1,39 @@
+class TableReader:
+    """
+    Reads the tables of a datasheet file row by row. A reader type is
+    registered for a path pattern with data_parser.register_reader
+    """
+    def __init__(self, path, sheets=None, columns=None, read_jobs=None):
+        """
+        Params
+        ------
+        path : str
+            The file's path
+        sheets : []
+            The sheet names to read, None reads every sheet, the
+            formats with one table ignore it
+        columns : iterable
+            The column names to read, None reads every column
+        read_jobs : int
+            The processes to read with, for the formats which can
+            split a file, None reads it in this process
+        """
+        self._path = path
+        self._sheets = sheets
+        self._columns = columns
+        self._read_jobs = read_jobs
+
+    def iter_sheets(self):
+        """
+        Yields
+        ------
+        (sheet_name, header, rows) : tuple
+            The header is a list and rows is an iterable of tuples,
+            the rows must be read before the next sheet
+        """
+        pass
+
+    def _column_indices(self, header):
+        # imported here, data_parser imports the readers
+        import modules.data_parser as data_parser
+        return data_parser.column_indices(header, self._columns)
@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import modules.batch_fuse         as batch_fuse
+import modules.cmd_fuse_exception as cmd_fuse_exception
+
+class BatchFuseTest(unittest.TestCase):
+
+    def setUp(self):
+        self._work_dir = tempfile.mkdtemp()
+        self._package_dir = os.path.join(self._work_dir, 'packages')
+        self._save_dir = os.path.join(self._work_dir, 'output')
+        os.mkdir(self._package_dir)
+        os.mkdir(self._save_dir)
+        self._commands_path = self._write('commands.txt', 'host : hostname [NAME]\n')
+
+    def tearDown(self):
+        shutil.rmtree(self._work_dir)
+
+    def _write(self, name, text):
+        path = os.path.join(self._work_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as text_file:
+            text_file.write(text)
+        return path
+
+    def _job(self, data_path, package=None, save_path=None):
+        return batch_fuse.BatchFuse.create_job(data_path, package or self._commands_path,
+            self._save_dir, save_path)
+
+    def test_same_default_save_path_is_a_conflict(self):
+        first = self._write(os.path.join('b1', 'a.csv'), 'NAME,CMD\nsw1,host\n')
+        second = self._write(os.path.join('b2', 'a.csv'), 'NAME,CMD\nsw2,host\n')
+        with self.assertRaises(cmd_fuse_exception.BatchConflictError) as conflict:
+            batch_fuse.BatchFuse([self._job(first), self._job(second)], self._package_dir)
+        self.assertEqual(len(conflict.exception.conflicts), 1)
+
+    def test_commands_files_of_the_same_name_are_a_conflict(self):
+        data_path = self._write('a.csv', 'NAME,CMD\nsw1,host\n')
+        other_commands = self._write(os.path.join('other', 'commands.txt'), 'host : host [NAME]\n')
+        jobs = [self._job(data_path, save_path=os.path.join(self._save_dir, '1.txt')),
+            self._job(data_path, other_commands, os.path.join(self._save_dir, '2.txt')),
+            self._job(data_path, 'commands', os.path.join(self._save_dir, '3.txt'))]
+        with self.assertRaises(cmd_fuse_exception.BatchConflictError) as conflict:
+            batch_fuse.BatchFuse(jobs, self._package_dir)
+        self.assertEqual(len(conflict.exception.conflicts), 1)
+
+    def test_jobs_save_their_own_outputs(self):
+        first = self._write(os.path.join('b1', 'a.csv'), 'NAME,CMD\nsw1,host\n')
+        second = self._write(os.path.join('b2', 'a.csv'), 'NAME,CMD\nsw2,host\n')
+        missing = os.path.join(self._work_dir, 'missing.csv')
+        jobs = [self._job(first, save_path=os.path.join(self._save_dir, '1.txt')),
+            self._job(second, save_path=os.path.join(self._save_dir, '2.txt')),
+            self._job(missing)]
+        results = list(batch_fuse.BatchFuse(jobs, self._package_dir, workers=2,
+            use_threads=True).run())
+        self.assertEqual([result.error is None for result in results], [True, True, False])
+        for save_name, command in [('1.txt', 'hostname sw1'), ('2.txt', 'hostname sw2')]:
+            with open(os.path.join(self._save_dir, save_name)) as output_file:
+                self.assertEqual(output_file.read(), command)
+
+if __name__ == '__main__':
+    unittest.main()
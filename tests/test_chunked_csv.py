@@ -0,0 +1,92 @@
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+
+import modules.chunked_csv as chunked_csv
+
+class ChunkedCsvFileTest(unittest.TestCase):
+
+    HEADER = ['NAME', 'CMD', 'DESCRIPTION']
+    ROWS = [
+        ['sw1', 'a', 'plain'],
+        ['sw2', 'a;b', 'quoted "" quote'],
+        ['sw3', 'b', 'two\nlines'],
+        ['sw4', 'a', 'comma, and\r\nwindows line'],
+        ['sw5', 'a', ''],
+        ['sw6', 'b', '"\n"'],
+        ['sw7', 'a', '\n\n\n'],
+        ['sw8', 'a', 'last'],
+    ]
+
+    def setUp(self):
+        self._work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._work_dir)
+
+    def _write(self, name, rows, line_terminator='\n', dialect='excel'):
+        path = os.path.join(self._work_dir, name)
+        with open(path, 'w', newline='') as csv_file:
+            writer = csv.writer(csv_file, dialect=dialect, lineterminator=line_terminator)
+            writer.writerow(ChunkedCsvFileTest.HEADER)
+            writer.writerows(rows)
+        return path
+
+    @staticmethod
+    def _expected(rows):
+        return [tuple(row) for row in rows]
+
+    def _assert_every_chunk_size(self, path, rows, dialect='excel'):
+        size = os.path.getsize(path)
+        for chunk_bytes in range(1, size + 1):
+            chunked_file = chunked_csv.ChunkedCsvFile(path, dialect, chunk_bytes=chunk_bytes)
+            ranges = list(chunked_file.iter_ranges())
+            # the ranges follow each other without a gap up to the end of the file
+            for previous, current in zip(ranges, ranges[1:]):
+                self.assertEqual(previous.end, current.start)
+            if ranges:
+                self.assertEqual(ranges[-1].end, size)
+            self.assertEqual(list(chunked_file), rows, 'chunk_bytes={}'.format(chunk_bytes))
+
+    def test_ranges_end_on_record_boundaries(self):
+        path = self._write('data.csv', ChunkedCsvFileTest.ROWS)
+        self.assertEqual(chunked_csv.ChunkedCsvFile(path, 'excel').header,
+            ChunkedCsvFileTest.HEADER)
+        self._assert_every_chunk_size(path, self._expected(ChunkedCsvFileTest.ROWS))
+
+    def test_windows_line_endings(self):
+        path = self._write('data.csv', ChunkedCsvFileTest.ROWS, '\r\n')
+        self._assert_every_chunk_size(path, self._expected(ChunkedCsvFileTest.ROWS))
+
+    def test_tsv(self):
+        path = self._write('data.tsv', ChunkedCsvFileTest.ROWS, dialect='excel-tab')
+        self._assert_every_chunk_size(path,
+            self._expected(ChunkedCsvFileTest.ROWS), 'excel-tab')
+
+    def test_short_rows_are_padded(self):
+        path = os.path.join(self._work_dir, 'short.csv')
+        with open(path, 'w', newline='') as csv_file:
+            csv_file.write('NAME,CMD,DESCRIPTION\nsw1,a\n\nsw2\n')
+        self._assert_every_chunk_size(path, [('sw1', 'a', ''), ('sw2', '', '')])
+
+    def test_columns_are_projected(self):
+        path = self._write('data.csv', ChunkedCsvFileTest.ROWS)
+        chunked_file = chunked_csv.ChunkedCsvFile(path, 'excel', columns={'CMD', 'NAME'},
+            chunk_bytes=7)
+        self.assertEqual(chunked_file.header, ['NAME', 'CMD'])
+        self.assertEqual(list(chunked_file),
+            [(row[0], row[1]) for row in ChunkedCsvFileTest.ROWS])
+
+    def test_header_only_and_empty_file(self):
+        path = self._write('header.csv', [])
+        self.assertEqual(list(chunked_csv.ChunkedCsvFile(path, 'excel')), [])
+        empty_path = os.path.join(self._work_dir, 'empty.csv')
+        open(empty_path, 'w').close()
+        empty_file = chunked_csv.ChunkedCsvFile(empty_path, 'excel')
+        self.assertIsNone(empty_file.header)
+        self.assertEqual(list(empty_file.iter_ranges()), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+
+import modules.cmd_deployer       as cmd_deployer
+import modules.cmd_fuse_exception as cmd_fuse_exception
+import modules.command_parser     as command_parser
+import modules.data_parser        as data_parser
+
+def create_commands():
+    return {
+        'a' : command_parser.OneCommand('a', 'echo NAME', ['NAME']),
+        'b' : command_parser.OneCommand('b', 'set NAME IP', ['NAME', 'IP'])
+    }
+
+class ValidateTest(unittest.TestCase):
+
+    def test_valid_data(self):
+        table = data_parser.DataTable(['NAME', 'IP', 'CMD'],
+            [('sw1', '10.0.0.1', 'a;b'), ('sw2', '10.0.0.2', ''), ('sw3', '10.0.0.3', 'b')])
+        cmd_deployer.CommandFuse([table], create_commands()).validate()
+
+    def test_problems_are_collected(self):
+        table = data_parser.DataTable(['NAME', 'CMD'],
+            [('sw1', 'a'), ('sw2', 'zz'), ('sw3', 'a;b'), ('sw4', 'zz;b'), ('sw5', 'yy')])
+        with self.assertRaises(cmd_fuse_exception.DataValidationError) as validation:
+            cmd_deployer.CommandFuse([table], create_commands()).validate()
+        # every unknown id and missing column once, at its first row (lines 3, 4 and 6)
+        missing_ip = cmd_fuse_exception.CannotGenerateCommandError('b', ['IP'])
+        self.assertEqual(validation.exception.problems, [
+            str(cmd_fuse_exception.UnknownCommandIdError('zz', 2)),
+            str(cmd_fuse_exception.FuseExecutionError(str(missing_ip), 3)),
+            str(cmd_fuse_exception.UnknownCommandIdError('yy', 5))])
+
+    def test_every_table_is_checked_with_its_header(self):
+        tables = [data_parser.DataTable(['NAME', 'IP', 'CMD'], [('sw1', '10.0.0.1', 'b')]),
+            data_parser.DataTable(['NAME', 'CMD'], [('sw2', 'b')])]
+        with self.assertRaises(cmd_fuse_exception.DataValidationError) as validation:
+            cmd_deployer.CommandFuse(tables, create_commands()).validate()
+        self.assertEqual(len(validation.exception.problems), 1)
+
+class CommandCacheTest(unittest.TestCase):
+
+    def test_least_recently_used_is_evicted(self):
+        cache = cmd_deployer.CommandCache(max_size=2)
+        cache.use_header(('CMD',))
+        cache.put('a', ['resolved a'])
+        cache.put('b', ['resolved b'])
+        self.assertEqual(cache.get('a'), ['resolved a'])
+        cache.put('c', ['resolved c'])
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), ['resolved a'])
+        self.assertEqual(cache.get('c'), ['resolved c'])
+        self.assertEqual(cache.info(), cmd_deployer.CacheInfo(3, 1, 2, 2))
+
+    def test_other_header_forgets_the_entries(self):
+        cache = cmd_deployer.CommandCache()
+        cache.use_header(('NAME', 'CMD'))
+        cache.put('a', ['resolved a'])
+        cache.use_header(('NAME', 'CMD'))
+        self.assertEqual(cache.get('a'), ['resolved a'])
+        cache.use_header(('CMD', 'NAME'))
+        self.assertIsNone(cache.get('a'))
+
+    def test_fuse_resolves_every_distinct_cell_once(self):
+        rows = [('sw{}'.format(idx), '10.0.0.1', ['a', 'a;b', ' b ; a'][idx % 3])
+            for idx in range(30)]
+        deployer = cmd_deployer.CommandFuse(
+            [data_parser.DataTable(['NAME', 'IP', 'CMD'], rows)], create_commands(),
+            command_cache_size=2)
+        commands = deployer.fuse()
+        self.assertEqual(commands[:5], ['echo sw0', 'echo sw1', 'set sw1 10.0.0.1',
+            'set sw2 10.0.0.1', 'echo sw2'])
+        self.assertEqual(len(commands), 50)
+        # three distinct cells rotate through two entries, every lookup misses
+        self.assertEqual(deployer.command_cache_info().misses, 30)
+
+        deployer = cmd_deployer.CommandFuse(
+            [data_parser.DataTable(['NAME', 'IP', 'CMD'], rows)], create_commands())
+        self.assertEqual(deployer.fuse(), commands)
+        info = deployer.command_cache_info()
+        self.assertEqual((info.hits, info.misses, info.size), (27, 3, 3))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import modules.cmd_deployer       as cmd_deployer
+import modules.cmd_fuse_exception as cmd_fuse_exception
+import modules.command_parser     as command_parser
+import modules.data_parser        as data_parser
+
+@unittest.skipIf(numpy is None, 'needs numpy')
+class ColumnarFuseTest(unittest.TestCase):
+
+    HEADER = ['NAME', 'IP', 'CMD']
+
+    def setUp(self):
+        self._commands = {
+            'a' : command_parser.OneCommand('a', 'echo NAME', ['NAME']),
+            'b' : command_parser.OneCommand('b', 'set {NAME} IP', ['NAME', 'IP']),
+            'c' : command_parser.OneCommand('c', 'show version', [])
+        }
+        cells = ['a', 'b;a', '', 'c;b;c', ' a ; c ', 'b']
+        self._rows = [('sw{}'.format(idx), '\\g<0>{}'.format(idx), cells[idx * 7 % len(cells)])
+            for idx in range(50)]
+
+    def _tables(self):
+        return [data_parser.DataTable(ColumnarFuseTest.HEADER, self._rows[:20]),
+            data_parser.DataTable(['CMD', 'IP', 'NAME'],
+                [tuple(reversed(row)) for row in self._rows[20:]])]
+
+    def _fuse(self, backend, separation_type):
+        return cmd_deployer.CommandFuse(self._tables(), self._commands,
+            separation_type=separation_type, backend=backend).fuse()
+
+    def test_same_output_as_the_row_backend(self):
+        for separation_type in [cmd_deployer.CommandSeparationType.sequential,
+                cmd_deployer.CommandSeparationType.group]:
+            expected = self._fuse(cmd_deployer.FuseBackend.row, separation_type)
+            self.assertEqual(len(expected), 75)
+            self.assertEqual(self._fuse(cmd_deployer.FuseBackend.columnar, separation_type),
+                expected)
+
+    def test_chunks_keep_the_row_order(self):
+        import modules.columnar_fuse as columnar_fuse
+        table = data_parser.DataTable(ColumnarFuseTest.HEADER, self._rows)
+        row_fuser = cmd_deployer.RowFuser(self._commands, 'CMD', ';')
+        expected = list(row_fuser.iter_table_commands(table, 1))
+        columnar_fuser = columnar_fuse.ColumnarFuser(self._commands,
+            cmd_deployer.RowFuser(self._commands, 'CMD', ';'), chunk_size=4)
+        self.assertEqual(list(columnar_fuser.iter_table_commands(table, 1)), expected)
+
+    def test_same_error_as_the_row_backend(self):
+        self._rows[7] = ('sw7', '10.0.0.7', 'a;zz')
+        errors = []
+        for backend in [cmd_deployer.FuseBackend.row, cmd_deployer.FuseBackend.columnar]:
+            with self.assertRaises(cmd_fuse_exception.CommandFuseError) as fuse_error:
+                self._fuse(backend, cmd_deployer.CommandSeparationType.sequential)
+            errors.append((type(fuse_error.exception), str(fuse_error.exception)))
+        self.assertEqual(errors[0], errors[1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+import modules.cmd_deployer   as cmd_deployer
+import modules.command_parser as command_parser
+import modules.data_parser    as data_parser
+
+class ColumnarReaderTest(unittest.TestCase):
+
+    HEADER = ['NAME', 'IP', 'CMD']
+    ROWS = [('sw1', '10.0.0.1', 'a'), ('sw2', None, 'a'), (None, None, 'a')]
+    EXPECTED_ROWS = [('sw1', '10.0.0.1', 'a'), ('sw2', '', 'a'), ('', '', 'a')]
+
+    def setUp(self):
+        self._work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._work_dir)
+
+    def _assert_rows(self, path):
+        tables = data_parser.RawDataParser(path).data
+        self.assertEqual(len(tables), 1)
+        self.assertEqual(list(tables[0].header), ColumnarReaderTest.HEADER)
+        self.assertEqual([tuple(row) for row in tables[0].rows], ColumnarReaderTest.EXPECTED_ROWS)
+        commands = {'a' : command_parser.OneCommand('a', 'set NAME IP', ['NAME', 'IP'])}
+        self.assertEqual(cmd_deployer.CommandFuse(tables, commands).fuse(),
+            ['set sw1 10.0.0.1', 'set sw2', 'set'])
+
+    def test_ndjson_null_is_empty(self):
+        path = os.path.join(self._work_dir, 'data.ndjson')
+        with open(path, 'w') as ndjson_file:
+            for row in ColumnarReaderTest.ROWS:
+                ndjson_file.write(json.dumps(dict(zip(ColumnarReaderTest.HEADER, row))) + '\n')
+        self._assert_rows(path)
+
+    def _table(self):
+        return pyarrow.table({col : [row[idx] for row in ColumnarReaderTest.ROWS]
+            for idx, col in enumerate(ColumnarReaderTest.HEADER)})
+
+    @unittest.skipIf(pyarrow is None, 'needs pyarrow')
+    def test_arrow_null_is_empty(self):
+        import pyarrow.ipc
+        path = os.path.join(self._work_dir, 'data.arrow')
+        table = self._table()
+        with pyarrow.ipc.new_file(path, table.schema) as writer:
+            writer.write_table(table)
+        self._assert_rows(path)
+
+    @unittest.skipIf(pyarrow is None, 'needs pyarrow')
+    def test_parquet_null_is_empty(self):
+        import pyarrow.parquet
+        path = os.path.join(self._work_dir, 'data.parquet')
+        pyarrow.parquet.write_table(self._table(), path)
+        self._assert_rows(path)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+
+import modules.command_buckets as command_buckets
+
+class CommandBucketSpillTest(unittest.TestCase):
+
+    COMMANDS = ['plain', 'x\rY', 'q\r\nw', 'multi\nline', 'back\\slash',
+        'escaped\\n', '\\\\n\r', '', 'trailing\r']
+
+    def test_spill_round_trip(self):
+        bucket = command_buckets.CommandBucket()
+        try:
+            for command in CommandBucketSpillTest.COMMANDS:
+                bucket.append(command)
+            bucket.spill()
+            self.assertEqual(bucket.size, 0)
+            self.assertEqual(list(bucket), CommandBucketSpillTest.COMMANDS)
+        finally:
+            bucket.close()
+
+    def test_spilled_and_held_keep_order(self):
+        bucket = command_buckets.CommandBucket()
+        try:
+            bucket.append('a\rb')
+            bucket.spill()
+            bucket.append('c\nd')
+            bucket.spill()
+            bucket.append('e\r')
+            self.assertEqual(list(bucket), ['a\rb', 'c\nd', 'e\r'])
+        finally:
+            bucket.close()
+
+    def test_memory_budget_spills_every_bucket(self):
+        buckets = command_buckets.CommandBuckets(['second'], memory_budget=4)
+        try:
+            buckets.add('first', 'x\rY')
+            buckets.add('second', 'q\r\nw')
+            buckets.add('first', 'z')
+            self.assertEqual(buckets.ordered_ids(), ['second', 'first'])
+            self.assertEqual(list(buckets), ['q\r\nw', 'x\rY', 'z'])
+        finally:
+            buckets.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+import modules.cmd_deployer   as cmd_deployer
+import modules.command_dedupe as command_dedupe
+import modules.command_parser as command_parser
+import modules.data_parser    as data_parser
+
+class CommandDedupeTest(unittest.TestCase):
+
+    def setUp(self):
+        self._work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._work_dir)
+
+    def _fuse(self, deduper):
+        commands = {
+            'a' : command_parser.OneCommand('a', 'show version', []),
+            'b' : command_parser.OneCommand('b', 'show version', []),
+            'c' : command_parser.OneCommand('c', 'ping IP', ['IP'])
+        }
+        table = data_parser.DataTable(['IP', 'CMD'],
+            [('10.0.0.1', 'a;c'), ('10.0.0.1', 'b;c'), ('10.0.0.2', 'a;c')])
+        return cmd_deployer.CommandFuse([table], commands, dedupe=deduper).fuse()
+
+    def test_output_scope(self):
+        deduper = command_dedupe.CommandDeduper(command_dedupe.DedupeScope.output)
+        self.assertEqual(self._fuse(deduper), ['show version', 'ping 10.0.0.1', 'ping 10.0.0.2'])
+        self.assertEqual(deduper.removed, 3)
+
+    def test_group_scope_keeps_the_repeats_of_other_ids(self):
+        deduper = command_dedupe.CommandDeduper(command_dedupe.DedupeScope.group)
+        self.assertEqual(self._fuse(deduper),
+            ['show version', 'ping 10.0.0.1', 'show version', 'ping 10.0.0.2'])
+        self.assertEqual(deduper.removed, 2)
+
+    def test_spilled_digests_are_still_found(self):
+        commands = ['cmd {}'.format(idx % 40) for idx in range(200)]
+        for bloom_items in [None, 40]:
+            deduper = command_dedupe.CommandDeduper(memory_budget=500,
+                bloom_items=bloom_items, spill_dir=self._work_dir)
+            deduper.reset()
+            kept = [command for command in commands if deduper.is_new(command)]
+            self.assertEqual(kept, commands[:40])
+            self.assertEqual(deduper.removed, 160)
+            self.assertEqual(len(os.listdir(self._work_dir)), 1)
+            deduper.close()
+            self.assertEqual(os.listdir(self._work_dir), [])
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = command_dedupe.BloomFilter(100)
+        digests = [hashlib.blake2b(str(idx).encode(), digest_size=16).digest()
+            for idx in range(200)]
+        for digest in digests[:100]:
+            bloom.add(digest)
+        self.assertTrue(all(digest in bloom for digest in digests[:100]))
+        self.assertLess(sum(digest in bloom for digest in digests[100:]), 10)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import modules.command_executor as command_executor
+
+@unittest.skipIf(os.name != 'posix', 'runs posix shell commands')
+class CommandExecutorTest(unittest.TestCase):
+
+    def setUp(self):
+        self._work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._work_dir)
+
+    def _execute(self, command_groups, **options):
+        results = []
+        summary = command_executor.CommandExecutor(**options).execute(
+            command_groups, results.append)
+        return summary, results
+
+    def test_results_and_summary(self):
+        summary, results = self._execute([('a', ['echo one', 'exit 3', 'echo two >&2'])])
+        self.assertEqual([result.exit_code for result in results], [0, 3, 0])
+        self.assertEqual([result.index for result in results], [0, 1, 2])
+        self.assertEqual(results[0].stdout, 'one\n')
+        self.assertEqual(results[2].stderr, 'two\n')
+        self.assertEqual((summary.commands, summary.failed, summary.groups), (3, 1, 1))
+
+    def test_timeout_kills_the_command(self):
+        summary, results = self._execute([('a', ['sleep 10'])], timeout=0.2)
+        self.assertTrue(results[0].timed_out)
+        self.assertLess(results[0].exit_code, 0)
+        self.assertLess(results[0].duration, 5)
+        self.assertEqual(summary.failed, 1)
+
+    def test_failed_command_is_retried(self):
+        marker_path = os.path.join(self._work_dir, 'marker')
+        # fails the first time only
+        command = 'test -f {0} || {{ touch {0}; exit 1; }}'.format(marker_path)
+        summary, results = self._execute([('a', [command])], retries=2, retry_backoff=0)
+        self.assertEqual((results[0].exit_code, results[0].attempts), (0, 2))
+        self.assertEqual(summary.failed, 0)
+
+        summary, results = self._execute([('a', ['exit 1'])], retries=2, retry_backoff=0)
+        self.assertEqual((results[0].exit_code, results[0].attempts), (1, 3))
+
+    def test_groups_are_barriers(self):
+        order_path = os.path.join(self._work_dir, 'order')
+        first = ['sleep 0.2; echo a >> {}'.format(order_path)] * 2
+        second = ['echo b >> {}'.format(order_path)]
+        summary, _ = self._execute([('a', first), ('b', second)], concurrency=4)
+        with open(order_path) as order_file:
+            self.assertEqual(order_file.read(), 'a\na\nb\n')
+        self.assertEqual(summary.groups, 2)
+
+    def test_stop_on_error_skips_the_next_groups(self):
+        log_path = os.path.join(self._work_dir, 'results.jsonl')
+        summary, results = self._execute([('a', ['exit 1', 'true']), ('b', ['true'])],
+            stop_on_error=True, log_path=log_path)
+        self.assertEqual(len(results), 2)
+        self.assertEqual((summary.commands, summary.failed), (2, 1))
+        with open(log_path) as log_file:
+            logged = [json.loads(line) for line in log_file]
+        self.assertEqual([entry['command'] for entry in logged], ['exit 1', 'true'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import modules.cmd_fuse_exception as cmd_fuse_exception
+import modules.command_parser     as command_parser
+import modules.package_format     as package_format
+
+class OneCommandCompileTest(unittest.TestCase):
+
+    def _command(self, command_str, required_cols):
+        return command_parser.OneCommand('cmd', command_str, required_cols)
+
+    def test_values_are_not_patterns(self):
+        command = self._command('set NAME to IP', ['NAME', 'IP'])
+        for value in ['\\1', '\\g<0>', '\\g<NAME>', '\\\\', '$1', '.*']:
+            self.assertEqual(command.generate({'NAME' : value, 'IP' : value}),
+                'set {0} to {0}'.format(value))
+
+    def test_values_are_not_format_fields(self):
+        command = self._command('set NAME to IP', ['NAME', 'IP'])
+        for value in ['{}', '{0}', '{NAME}', '{{', '}', '{0!r:>10}']:
+            self.assertEqual(command.generate({'NAME' : value, 'IP' : value}),
+                'set {0} to {0}'.format(value))
+
+    def test_braces_of_the_command_are_kept(self):
+        command = self._command('json {"name": "NAME", "n": {}}', ['NAME'])
+        self.assertEqual(command.generate({'NAME' : 'sw1'}), 'json {"name": "sw1", "n": {}}')
+
+    def test_longest_column_wins(self):
+        command = self._command('host HOSTNAME name NAME', ['NAME', 'HOSTNAME'])
+        self.assertEqual(command.slots, [1, 0])
+        self.assertEqual(command.generate({'NAME' : 'n', 'HOSTNAME' : 'h'}), 'host h name n')
+
+    def test_value_holding_a_column_name_is_not_replaced_again(self):
+        command = self._command('set NAME IP', ['NAME', 'IP'])
+        self.assertEqual(command.generate({'NAME' : 'IP', 'IP' : 'NAME'}), 'set IP NAME')
+
+    def test_repeated_column(self):
+        command = self._command('NAME-NAME', ['NAME'])
+        self.assertEqual(command.segments, ['', '-', ''])
+        self.assertEqual(command.generate({'NAME' : 'x'}), 'x-x')
+
+    def test_missing_column(self):
+        command = self._command('set NAME IP', ['NAME', 'IP'])
+        with self.assertRaises(cmd_fuse_exception.CannotGenerateCommandError):
+            command.generate({'NAME' : 'x'})
+
+    def test_bound_command_matches_generate(self):
+        command = self._command('host HOSTNAME name NAME {}', ['NAME', 'HOSTNAME'])
+        bound = command.bind({'HOSTNAME' : 0, 'NAME' : 1})
+        row = ('\\g<0>', '{0}')
+        expected = command.generate({'HOSTNAME' : row[0], 'NAME' : row[1]})
+        self.assertEqual(bound.generate(row), expected)
+        self.assertEqual(bound.generate_rows([row, row]), [expected, expected])
+
+class BinaryPackageTest(unittest.TestCase):
+
+    def setUp(self):
+        self._work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._work_dir)
+
+    def test_round_trip(self):
+        commands_path = os.path.join(self._work_dir, 'commands.txt')
+        with open(commands_path, 'w') as commands_file:
+            commands_file.write('host : hostname [HOSTNAME] {[NAME]}\n')
+            commands_file.write('plain : show version\n')
+            commands_file.write('ip : ip [IP] [IP] é\n')
+        compiled = command_parser.CommandPackage(commands_path, 'test')
+        package_path = os.path.join(self._work_dir, 'test')
+        compiled.deploy_package(package_path)
+
+        loaded = command_parser.CommandPackage(package_name='test')
+        commands = loaded.load_package(package_path)
+        self.assertEqual(loaded.source_hash, compiled.source_hash)
+        data = {'HOSTNAME' : '\\1', 'NAME' : '{}', 'IP' : '10.0.0.1'}
+        for cmd_id, command in compiled.commands.items():
+            self.assertEqual(commands[cmd_id].required_columns, command.required_columns)
+            self.assertEqual(commands[cmd_id].segments, command.segments)
+            self.assertEqual(commands[cmd_id].slots, command.slots)
+            self.assertEqual(commands[cmd_id].generate(data), command.generate(data))
+
+    def test_dump_replaces_the_package(self):
+        package_path = os.path.join(self._work_dir, 'test')
+        commands = [command_parser.OneCommand('host', 'hostname NAME', ['NAME'])]
+        package_format.dump(commands, package_path)
+        package_format.dump(commands[:0], package_path)
+        self.assertEqual(os.listdir(self._work_dir), ['test'])
+        self.assertEqual(package_format.load(package_path), (None, []))
+
+    def test_other_format_version_is_refused(self):
+        package_path = os.path.join(self._work_dir, 'test')
+        package_format.dump([], package_path)
+        with open(package_path, 'r+b') as package_file:
+            package_file.seek(len(package_format.MAGIC))
+            package_file.write(bytes([package_format.FORMAT_VERSION + 1]))
+        with self.assertRaises(cmd_fuse_exception.PackageFormatError):
+            package_format.load(package_path)
+
+if __name__ == '__main__':
+    unittest.main()
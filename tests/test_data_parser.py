@@ -0,0 +1,110 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+import modules.cmd_fuse_exception as cmd_fuse_exception
+import modules.data_parser        as data_parser
+
+HEADER = ['NAME', 'IP', 'MASK', 'CMD']
+ROWS = [('sw1', '10.0.0.1', '255.0.0.0', 'a'), ('sw2', None, '255.0.0.0', 'a;b'),
+    ('sw3', '10.0.0.3', None, None)]
+EXPECTED_ROWS = [tuple('' if cell is None else cell for cell in row) for row in ROWS]
+
+class DataParserTest(unittest.TestCase):
+
+    def setUp(self):
+        self._work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._work_dir)
+
+    def _write_csv(self):
+        path = os.path.join(self._work_dir, 'data.csv')
+        with open(path, 'w', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(HEADER)
+            writer.writerows(EXPECTED_ROWS)
+        return path
+
+    def _write_xlsx(self):
+        path = os.path.join(self._work_dir, 'data.xlsx')
+        book = openpyxl.Workbook()
+        first = book.active
+        first.title = 'first'
+        for row in [HEADER] + ROWS:
+            first.append(row)
+        second = book.create_sheet('second')
+        second.append(HEADER)
+        second.append(ROWS[0])
+        book.save(path)
+        return path
+
+    def _write_ndjson(self):
+        path = os.path.join(self._work_dir, 'data.ndjson')
+        with open(path, 'w') as ndjson_file:
+            for row in ROWS:
+                ndjson_file.write(json.dumps(dict(zip(HEADER, row))) + '\n')
+        return path
+
+    @staticmethod
+    def _read(path, **options):
+        return [(list(table.header), [tuple(row) for row in table.rows])
+            for table in data_parser.RawDataParser(path, **options).data]
+
+@unittest.skipIf(openpyxl is None, 'needs openpyxl')
+class ExcelReadTest(DataParserTest):
+
+    def test_same_tables_as_the_csv(self):
+        tables = DataParserTest._read(self._write_xlsx())
+        self.assertEqual(tables[0], DataParserTest._read(self._write_csv())[0])
+        self.assertEqual(tables[1], (HEADER, [EXPECTED_ROWS[0]]))
+
+    def test_selected_sheets(self):
+        path = self._write_xlsx()
+        self.assertEqual(DataParserTest._read(path, sheets=['second']),
+            [(HEADER, [EXPECTED_ROWS[0]])])
+        with self.assertRaises(cmd_fuse_exception.SheetNotFoundError):
+            DataParserTest._read(path, sheets=['third'])
+
+    def test_sample_workbook(self):
+        path = os.path.join(os.path.dirname(__file__), 'switch_config.xlsx')
+        tables = DataParserTest._read(path)
+        self.assertEqual(len(tables), 1)
+        header, rows = tables[0]
+        self.assertEqual(header, ['NAME', 'GATEWAY_IP', 'INTERFACE', 'IP', 'MASK', 'CMD'])
+        self.assertEqual(len(rows), 31)
+        self.assertTrue(all(len(row) == len(header) for row in rows))
+
+class ColumnProjectionTest(DataParserTest):
+
+    # the kept columns stay in the file's order, an unknown name is ignored
+    COLUMNS = ['CMD', 'NAME', 'MISSING']
+    EXPECTED_TABLE = (['NAME', 'CMD'], [(row[0], row[3]) for row in EXPECTED_ROWS])
+
+    def _assert_projected(self, path):
+        self.assertEqual(DataParserTest._read(path, columns=ColumnProjectionTest.COLUMNS)[0],
+            ColumnProjectionTest.EXPECTED_TABLE)
+
+    def test_csv(self):
+        self._assert_projected(self._write_csv())
+
+    def test_ndjson(self):
+        self._assert_projected(self._write_ndjson())
+
+    @unittest.skipIf(openpyxl is None, 'needs openpyxl')
+    def test_xlsx(self):
+        self._assert_projected(self._write_xlsx())
+
+    def test_every_column_without_a_projection(self):
+        self.assertEqual(DataParserTest._read(self._write_csv()), [(HEADER, EXPECTED_ROWS)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import asyncio
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+import modules.cmd_fuse_exception as cmd_fuse_exception
+import modules.fuse_server        as fuse_server
+
+class FuseServerAddressTest(unittest.TestCase):
+
+    def setUp(self):
+        self._work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._work_dir)
+
+    def test_regular_file_is_not_a_socket_path(self):
+        path = os.path.join(self._work_dir, 'data.sock')
+        with open(path, 'w') as data_file:
+            data_file.write('keep')
+        with self.assertRaises(cmd_fuse_exception.SocketPathError):
+            fuse_server.FuseServer(path, self._work_dir)
+        with open(path) as data_file:
+            self.assertEqual(data_file.read(), 'keep')
+
+    def test_parse_address(self):
+        self.assertEqual(fuse_server.FuseServer.parse_address('9000'), ('127.0.0.1', 9000))
+        self.assertEqual(fuse_server.FuseServer.parse_address('[::1]:9000'), ('::1', 9000))
+        self.assertEqual(fuse_server.FuseServer.parse_address('/tmp/fuse.sock'), '/tmp/fuse.sock')
+
+    def test_non_loopback_host_is_refused(self):
+        with self.assertRaises(cmd_fuse_exception.NonLocalAddressError):
+            fuse_server.FuseServer('0.0.0.0:9000', self._work_dir)
+
+class HotPackageCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self._work_dir = tempfile.mkdtemp()
+        self._package_dir = os.path.join(self._work_dir, 'packages')
+        self._commands_dir = os.path.join(self._work_dir, 'commands')
+        os.mkdir(self._package_dir)
+        os.mkdir(self._commands_dir)
+        self._commands_path = os.path.join(self._commands_dir, 'switch.txt')
+        with open(self._commands_path, 'w') as commands_file:
+            commands_file.write('host : hostname [NAME]\n')
+
+    def tearDown(self):
+        shutil.rmtree(self._work_dir)
+
+    def test_names_outside_the_package_dir_are_refused(self):
+        cache = fuse_server.HotPackageCache(self._package_dir)
+        for package in ['../commands/switch.txt', '..', '.', '', '.index',
+                os.path.join('..', 'packages', 'switch'), self._commands_path]:
+            with self.assertRaises(cmd_fuse_exception.PackageNameError):
+                cache.get(package)
+        self.assertEqual(os.listdir(self._package_dir), [])
+
+    def test_commands_file_of_the_commands_dir(self):
+        cache = fuse_server.HotPackageCache(self._package_dir, commands_dir=self._commands_dir)
+        commands = cache.get(self._commands_path)
+        self.assertEqual(commands['host'].generate({'NAME' : 'sw1'}), 'hostname sw1')
+        self.assertIs(cache.get('switch'), cache.get('switch'))
+        outside_path = os.path.join(self._work_dir, 'outside.txt')
+        shutil.copy(self._commands_path, outside_path)
+        for package in [outside_path, os.path.join(self._commands_dir, '..', 'outside.txt')]:
+            with self.assertRaises(cmd_fuse_exception.PackageNameError):
+                cache.get(package)
+
+class FuseServerTimeoutTest(unittest.TestCase):
+
+    def setUp(self):
+        self._work_dir = tempfile.mkdtemp()
+        with open(os.path.join(self._work_dir, 'switch.txt'), 'w') as commands_file:
+            commands_file.write('host : hostname [NAME]\n')
+        self._address = os.path.join(self._work_dir, 'fuse.sock')
+        self._server = fuse_server.FuseServer(self._address, self._work_dir,
+            commands_dir=self._work_dir, max_requests=1, timeout=0.5)
+        started = threading.Event()
+        def on_started():
+            self._loop = asyncio.get_running_loop()
+            started.set()
+        self._thread = threading.Thread(target=asyncio.run,
+            args=(self._server.serve(on_started),))
+        self._thread.start()
+        started.wait()
+
+    def tearDown(self):
+        self._stop()
+        shutil.rmtree(self._work_dir)
+
+    def _stop(self):
+        if self._thread.is_alive():
+            self._loop.call_soon_threadsafe(self._server.stop)
+            self._thread.join()
+
+    def _send(self, lines):
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(self._address)
+        connection.sendall(''.join(line + '\n' for line in lines).encode())
+        return connection
+
+    @staticmethod
+    def _read_all(connection):
+        with connection, connection.makefile('r') as response:
+            return [json.loads(line) for line in response]
+
+    def _request(self):
+        return json.dumps({'package' : os.path.join(self._work_dir, 'switch.txt')})
+
+    def test_silent_client_fails_and_frees_the_worker(self):
+        request = self._request()
+        silent = self._send([request, json.dumps(['NAME', 'CMD']), json.dumps(['sw1', 'host'])])
+        # the only worker waits for the rows of the silent client until the timeout
+        active = self._send([request, json.dumps(['NAME', 'CMD']), json.dumps(['sw2', 'host']), ''])
+        self.assertEqual(FuseServerTimeoutTest._read_all(active),
+            ['hostname sw2', {'status' : 'ok', 'commands' : 1}])
+        messages = FuseServerTimeoutTest._read_all(silent)
+        self.assertEqual(messages[0], 'hostname sw1')
+        self.assertEqual(messages[-1]['status'], 'error')
+        self.assertIn('TimeoutError', messages[-1]['error'])
+
+    def test_stop_does_not_wait_for_a_silent_client(self):
+        silent = self._send([self._request(), json.dumps(['NAME', 'CMD'])])
+        time.sleep(0.1)
+        start = time.monotonic()
+        self._stop()
+        self.assertLess(time.monotonic() - start, 5)
+        silent.close()
+
+if __name__ == '__main__':
+    unittest.main()
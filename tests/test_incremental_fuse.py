@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import modules.cmd_deployer   as cmd_deployer
+import modules.command_parser as command_parser
+
+class IncrementalFuseTest(unittest.TestCase):
+
+    def setUp(self):
+        self._work_dir = tempfile.mkdtemp()
+        self._output_path = os.path.join(self._work_dir, 'output.txt')
+        self._commands = {
+            'a' : command_parser.OneCommand('a', 'echo NAME', ['NAME']),
+            'b' : command_parser.OneCommand('b', 'set NAME IP', ['NAME', 'IP'])
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self._work_dir)
+
+    def _rows(self, names):
+        return [{'NAME' : name, 'IP' : '10.0.0.1', 'CMD' : 'a;b'} for name in names]
+
+    def _fuse_incremental(self, rows):
+        deployer = cmd_deployer.CommandFuse(rows, self._commands)
+        return deployer.fuse_to_file_incremental(self._output_path)
+
+    def _fuse_full(self, rows):
+        full_path = os.path.join(self._work_dir, 'full.txt')
+        cmd_deployer.CommandFuse(rows, self._commands).fuse_to_file(full_path)
+        return IncrementalFuseTest._read(full_path)
+
+    @staticmethod
+    def _read(path):
+        with open(path, 'rb') as output_file:
+            return output_file.read()
+
+    def test_splice_keeps_line_breaks_of_values(self):
+        names = ['x\ry', 'z', 'p\nq', 'r\r\ns', 'w']
+        self._fuse_incremental(self._rows(names))
+        names[2] = 'Q'
+        result = self._fuse_incremental(self._rows(names))
+        self.assertEqual(result.reused_rows, len(names) - 1)
+        self.assertEqual(IncrementalFuseTest._read(self._output_path),
+            self._fuse_full(self._rows(names)))
+
+    def test_splice_after_last_row_changed(self):
+        names = ['x\ry', 'x\ry', 'z']
+        self._fuse_incremental(self._rows(names))
+        names[2] = 'Q'
+        result = self._fuse_incremental(self._rows(names))
+        self.assertEqual(result.regenerated_rows, 1)
+        output = IncrementalFuseTest._read(self._output_path)
+        self.assertEqual(output, self._fuse_full(self._rows(names)))
+        self.assertIn(b'echo x\ry\n', output)
+
+    def test_changed_template_regenerates_its_rows(self):
+        names = ['x\ry', 'z']
+        self._fuse_incremental(self._rows(names))
+        self._commands['b'] = command_parser.OneCommand('b', 'unset NAME', ['NAME'])
+        result = self._fuse_incremental(self._rows(names))
+        self.assertEqual(result.reused_rows, 0)
+        self.assertEqual(IncrementalFuseTest._read(self._output_path),
+            self._fuse_full(self._rows(names)))
+
+if __name__ == '__main__':
+    unittest.main()
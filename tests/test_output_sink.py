@@ -0,0 +1,33 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import modules.cmd_deployer   as cmd_deployer
+import modules.command_parser as command_parser
+import modules.fuse_stats     as fuse_stats
+import modules.output_sink    as output_sink
+
+class FuseToSinksTest(unittest.TestCase):
+
+    def setUp(self):
+        self._work_dir = tempfile.mkdtemp()
+        self._commands = {'a' : command_parser.OneCommand('a', 'echo NAME', ['NAME'])}
+
+    def tearDown(self):
+        shutil.rmtree(self._work_dir)
+
+    def test_bytes_written_are_the_saved_bytes(self):
+        rows = [{'NAME' : name, 'CMD' : 'a'} for name in ['sw1', 'ső', '交換機']]
+        output_path = os.path.join(self._work_dir, 'output.txt')
+        console = io.StringIO()
+        stats = fuse_stats.FuseStats()
+        cmd_deployer.CommandFuse(rows, self._commands, stats=stats).fuse_to_sinks(
+            [output_sink.FileSink(output_path), output_sink.StreamSink(console)])
+        self.assertEqual(console.getvalue(), 'echo sw1\necho ső\necho 交換機\n')
+        self.assertEqual(stats.stage(fuse_stats.FuseStats.WRITE).counters['bytes_written'],
+            os.path.getsize(output_path))
+
+if __name__ == '__main__':
+    unittest.main()
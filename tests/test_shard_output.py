@@ -0,0 +1,54 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import modules.shard_output as shard_output
+
+class ShardOutputTest(unittest.TestCase):
+
+    def setUp(self):
+        self._work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._work_dir)
+
+    def _save(self, commands, shard_count=None):
+        output = shard_output.ShardOutput(self._work_dir, shard_count, writers=2,
+            shard_buffer_size=4)
+        output.open()
+        for key, command in commands:
+            output.write(key, command)
+        output.close()
+        return output
+
+    def _read(self, name):
+        with open(os.path.join(self._work_dir, name), 'rb') as shard_file:
+            return shard_file.read()
+
+    def test_commands_are_saved_as_written(self):
+        output = self._save([('sw1', 'echo a\rb'), ('sw2', 'név'), ('sw1', 'x\r\ny')])
+        self.assertEqual(self._read('sw1.txt'), 'echo a\rb\nx\r\ny'.encode('utf-8'))
+        self.assertEqual(self._read('sw2.txt'), 'név'.encode('utf-8'))
+        self.assertEqual(output.bytes_written,
+            len(self._read('sw1.txt')) + len(self._read('sw2.txt')))
+
+    def test_stale_shards_are_removed(self):
+        with open(os.path.join(self._work_dir, 'notes.txt'), 'w') as notes_file:
+            notes_file.write('kept')
+        self._save([('sw1', 'a'), ('sw2', 'b')])
+        self._save([('sw2', 'c'), ('sw3', 'd')])
+        self.assertEqual(sorted(os.listdir(self._work_dir)),
+            ['.shards', 'notes.txt', 'sw2.txt', 'sw3.txt'])
+        self.assertEqual(self._read('sw2.txt'), b'c')
+
+    def test_failed_run_keeps_the_previous_shards(self):
+        self._save([('sw1', 'a')])
+        output = shard_output.ShardOutput(self._work_dir)
+        output.open()
+        output.write('sw2', 'b')
+        output.abort()
+        self.assertEqual(sorted(os.listdir(self._work_dir)), ['.shards', 'sw1.txt'])
+
+if __name__ == '__main__':
+    unittest.main()